@@ -46,10 +46,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'listings',
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the whole stack. Inactive unless REQUEST_METRICS_ENABLED.
+    'listings.middleware.RequestMetricsMiddleware',
+    # Pins clients to the primary database after a write. Inactive without DATABASE_REPLICA_URLS.
+    'listings.replicas.PinPrimaryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,12 +88,61 @@ WSGI_APPLICATION = 'alx_travel_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# DATABASE_URL selects the primary, e.g. postgres://user:password@db:5432/alx_travel
+# (default: the local SQLite file).
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': env.db('DATABASE_URL', default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
 }
+# Persistent connections: reused for up to DATABASE_CONN_MAX_AGE seconds and checked
+# before reuse, so a connection dropped by the server or a failover is replaced.
+DATABASE_CONN_MAX_AGE = env.int('DATABASE_CONN_MAX_AGE', default=60)
+DATABASE_CONN_HEALTH_CHECKS = env.bool('DATABASE_CONN_HEALTH_CHECKS', default=True)
+# DATABASE_POOL: use psycopg's connection pool in each process (PostgreSQL with psycopg 3
+# and psycopg[pool] only) instead of persistent connections; the value is the pool's max_size.
+DATABASE_POOL = env.int('DATABASE_POOL', default=0)
+# DATABASE_PGBOUNCER: the URLs point at PgBouncer in transaction pooling mode, which
+# can't keep server-side cursors (QuerySet.iterator(), used by the exports) open.
+DATABASE_PGBOUNCER = env.bool('DATABASE_PGBOUNCER', default=False)
+
+# Read replicas, comma separated; each becomes an alias replica_0, replica_1, ... used by
+# the listing and booking read endpoints (see listings/replicas.py). Under test they mirror
+# the primary.
+DATABASE_REPLICA_URLS = env.list('DATABASE_REPLICA_URLS', default=[])
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES[f'replica_{index}'] = {**env.db_url_config(url), 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# Seconds a client reads from the primary after a write; keep above the replication lag.
+DATABASE_REPLICA_PIN_SECONDS = env.int('DATABASE_REPLICA_PIN_SECONDS', default=10)
+
+# SQLite tuning, run on every new connection (see listings/sqlite.py).
+SQLITE_PRAGMAS = {
+    'journal_mode': env('SQLITE_JOURNAL_MODE', default='WAL'),
+    'synchronous': env('SQLITE_SYNCHRONOUS', default='NORMAL'),
+    'mmap_size': env.int('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024),
+    'cache_size': env.int('SQLITE_CACHE_SIZE', default=-64000),  # Negative: in KiB, so 64 MB
+    'temp_store': 'MEMORY',
+}
+SQLITE_BUSY_TIMEOUT = env.float('SQLITE_BUSY_TIMEOUT', default=20)  # Seconds a writer waits for the lock
+# Booking, payment and outbox transactions take the write lock up front (BEGIN IMMEDIATE).
+SQLITE_IMMEDIATE_WRITES = env.bool('SQLITE_IMMEDIATE_WRITES', default=True)
+
+for database in DATABASES.values():
+    if database['ENGINE'] == 'django.db.backends.postgresql' and DATABASE_POOL:
+        # Django requires CONN_MAX_AGE = 0 with a pool; the pool keeps the connections.
+        database['OPTIONS'] = {**database.get('OPTIONS', {}), 'pool': {'max_size': DATABASE_POOL}}
+        database['CONN_MAX_AGE'] = 0
+    else:
+        database['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+    database['CONN_HEALTH_CHECKS'] = DATABASE_CONN_HEALTH_CHECKS
+    database['DISABLE_SERVER_SIDE_CURSORS'] = DATABASE_PGBOUNCER
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        database['OPTIONS'] = {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            **database.get('OPTIONS', {}),
+        }
+
+DATABASE_ROUTERS = ['listings.replicas.PrimaryReplicaRouter']
 
 
 # Password validation
@@ -132,9 +186,83 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches: local memory by default; set CACHE_URL (e.g. redis://127.0.0.1:6379/1) to share
+# the cache between processes.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Listing response cache (see listings/cache.py)
+LISTINGS_CACHE_ALIAS = env('LISTINGS_CACHE_ALIAS', default='default')
+LISTINGS_CACHE_TIMEOUT = env.int('LISTINGS_CACHE_TIMEOUT', default=300)
+
+# Full-text search (`?q=` on the listings endpoint, see listings/textsearch.py)
+SEARCH_MIN_PREFIX = env.int('SEARCH_MIN_PREFIX', default=3)  # Shorter query words match whole terms only
+SEARCH_PREFIX_EXPANSIONS = env.int('SEARCH_PREFIX_EXPANSIONS', default=20)  # Terms one query word may expand to
+SEARCH_STATS_TIMEOUT = env.int('SEARCH_STATS_TIMEOUT', default=3600)  # Seconds the BM25 corpus stats are cached
+
+# Nightly pricing (PricingRule, see listings/pricing.py)
+PRICE_CALENDAR_DAYS = env.int('PRICE_CALENDAR_DAYS', default=730)  # Nights precomputed per listing, from today
+PRICE_CALENDAR_TIMEOUT = env.int('PRICE_CALENDAR_TIMEOUT', default=86400)  # Seconds a calendar is cached
+PRICE_CALENDAR_LOCAL_ENTRIES = env.int('PRICE_CALENDAR_LOCAL_ENTRIES', default=2000)  # Calendars kept per process
+
+# Radius search (`?near=lat,lng&radius=` on the listings endpoints, see listings/geo.py)
+GEO_DEFAULT_RADIUS_KM = env.float('GEO_DEFAULT_RADIUS_KM', default=10.0)
+GEO_MAX_RADIUS_KM = env.float('GEO_MAX_RADIUS_KM', default=500.0)
+GEO_MAX_CELLS = env.int('GEO_MAX_CELLS', default=16)  # Geohash cells one search may cover (0 disables the cell prefilter)
+
+# API pagination (keyset cursors, see listings/pagination.py)
+LISTINGS_PAGE_SIZE = env.int('LISTINGS_PAGE_SIZE', default=20)
+LISTINGS_MAX_PAGE_SIZE = env.int('LISTINGS_MAX_PAGE_SIZE', default=100)
+BOOKINGS_PAGE_SIZE = env.int('BOOKINGS_PAGE_SIZE', default=50)
+BOOKINGS_MAX_PAGE_SIZE = env.int('BOOKINGS_MAX_PAGE_SIZE', default=1000)
+
+# List endpoints render from compiled .values() readers instead of serializer instances
+# (see listings/fastpath.py); responses are encoded with orjson when it is installed.
+FAST_READ_SERIALIZERS = env.bool('FAST_READ_SERIALIZERS', default=True)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'listings.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Maximum number of items accepted by POST /api/bookings/bulk/
+BULK_BOOKING_MAX_ITEMS = env.int('BULK_BOOKING_MAX_ITEMS', default=10000)
+
+# Rows fetched per database round trip by the streaming booking/payment exports
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=2000)
+
 # Chapa API Key
 CHAPA_SECRET_KEY = env('CHAPA_SECRET_KEY')
 
+# Chapa client (see listings/chapa.py). Point CHAPA_BASE_URL at `manage.py fake_chapa` for load runs.
+CHAPA_BASE_URL = env('CHAPA_BASE_URL', default='https://api.chapa.co')
+CHAPA_CONNECT_TIMEOUT = env.float('CHAPA_CONNECT_TIMEOUT', default=3.05)
+CHAPA_READ_TIMEOUT = env.float('CHAPA_READ_TIMEOUT', default=10.0)
+CHAPA_MAX_RETRIES = env.int('CHAPA_MAX_RETRIES', default=2)
+CHAPA_BACKOFF_BASE = env.float('CHAPA_BACKOFF_BASE', default=0.2)
+CHAPA_BACKOFF_MAX = env.float('CHAPA_BACKOFF_MAX', default=2.0)
+CHAPA_POOL_SIZE = env.int('CHAPA_POOL_SIZE', default=10)
+CHAPA_BREAKER_THRESHOLD = env.int('CHAPA_BREAKER_THRESHOLD', default=5)
+CHAPA_BREAKER_RESET_TIMEOUT = env.float('CHAPA_BREAKER_RESET_TIMEOUT', default=30.0)
+# Secret used to sign webhook deliveries; webhook POSTs are rejected while it is unset.
+CHAPA_WEBHOOK_SECRET = env('CHAPA_WEBHOOK_SECRET', default='')
+
+# Payment reconciliation (listings.tasks.reconcile_pending_payments)
+PAYMENT_RECONCILE_AFTER = env.int('PAYMENT_RECONCILE_AFTER', default=900)  # seconds before a pending payment is swept
+PAYMENT_RECONCILE_BATCH_SIZE = env.int('PAYMENT_RECONCILE_BATCH_SIZE', default=200)
+PAYMENT_PENDING_EXPIRY = env.int('PAYMENT_PENDING_EXPIRY', default=86400)  # seconds before an unpaid payment fails
+
+# Idempotency-Key support on booking and payment POSTs (see listings/idempotency.py)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=86400)  # seconds a stored response is replayed
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', default=60)  # seconds before an unfinished claim is abandoned
+IDEMPOTENCY_WAIT_SECONDS = env.float('IDEMPOTENCY_WAIT_SECONDS', default=10.0)  # how long a concurrent duplicate waits
+
+# Host stats rollups (see listings/rollups.py)
+ROLLUP_DAILY_DAYS = env.int('ROLLUP_DAILY_DAYS', default=90)  # days kept per day before compacting into months
+ROLLUP_REFRESH_BATCH_SIZE = env.int('ROLLUP_REFRESH_BATCH_SIZE', default=500)  # queued changes applied per run
+
 # Celery Configuration
 CELERY_BROKER_URL = 'amqp://guest@localhost//'
 CELERY_RESULT_BACKEND = 'rpc://'
@@ -143,6 +271,76 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-pending-payments': {
+        'task': 'listings.tasks.reconcile_pending_payments',
+        'schedule': 300.0,  # every 5 minutes
+    },
+    'flush-confirmation-emails': {
+        'task': 'listings.tasks.flush_confirmation_emails',
+        'schedule': 60.0,  # picks up retries whose backoff has elapsed
+    },
+    'refresh-search-stats': {
+        'task': 'listings.tasks.refresh_search_stats',
+        'schedule': 1800.0,  # well inside SEARCH_STATS_TIMEOUT, so searches never recount
+    },
+    'purge-idempotency-keys': {
+        'task': 'listings.tasks.purge_idempotency_keys',
+        'schedule': 3600.0,
+    },
+    'refresh-listing-rollups': {
+        'task': 'listings.tasks.refresh_listing_rollups',
+        'schedule': 60.0,  # host stats lag changes by about a minute
+    },
+    'compact-listing-rollups': {
+        'task': 'listings.tasks.compact_listing_rollups',
+        'schedule': 86400.0,  # nightly
+    },
+}
+
+# Queues and routing: slow SMTP work must never sit in front of payment verification.
+# See README_CELERY.md for the worker topology; `python manage.py celery_workers` prints it.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'listings.tasks.send_payment_confirmation_email': {'queue': 'email'},
+    'listings.tasks.send_booking_confirmation_email': {'queue': 'email'},
+    'listings.tasks.send_booking_confirmation_emails': {'queue': 'email'},
+    'listings.tasks.flush_confirmation_emails': {'queue': 'email'},
+    'listings.tasks.verify_payment_task': {'queue': 'payments'},
+    'listings.tasks.reconcile_pending_payments': {'queue': 'maintenance'},
+    'listings.tasks.refresh_search_stats': {'queue': 'maintenance'},
+    'listings.tasks.purge_idempotency_keys': {'queue': 'maintenance'},
+    'listings.tasks.refresh_listing_rollups': {'queue': 'maintenance'},
+    'listings.tasks.compact_listing_rollups': {'queue': 'maintenance'},
+}
+# Reserve one message per process by default, so a long task can't hold a backlog of
+# short ones hostage in its prefetch buffer. Workers can override it per queue.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Each flush sends up to CONFIRMATION_EMAIL_BATCH_SIZE messages, so this caps outbound
+# email per email worker at rate x batch size (12/m x 100 = 1200 messages a minute).
+CELERY_TASK_ANNOTATIONS = {
+    'listings.tasks.flush_confirmation_emails': {
+        'rate_limit': env('CONFIRMATION_EMAIL_FLUSH_RATE_LIMIT', default='12/m'),
+    },
+}
+# One worker per queue group: (queues, concurrency, prefetch multiplier)
+CELERY_WORKER_TOPOLOGY = {
+    'payments': {
+        'queues': ['payments'],
+        'concurrency': env.int('CELERY_PAYMENTS_CONCURRENCY', default=8),  # I/O bound on Chapa
+        'prefetch_multiplier': 1,
+    },
+    'email': {
+        'queues': ['email'],
+        'concurrency': env.int('CELERY_EMAIL_CONCURRENCY', default=2),
+        'prefetch_multiplier': 1,
+    },
+    'maintenance': {
+        'queues': ['maintenance', 'default'],
+        'concurrency': env.int('CELERY_MAINTENANCE_CONCURRENCY', default=2),
+        'prefetch_multiplier': 4,  # short, cheap tasks
+    },
+}
 
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -152,3 +350,20 @@ EMAIL_USE_TLS = env('EMAIL_USE_TLS', default=True)
 EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='noreply@alxtravel.com')
+
+# Batched confirmation emails (see listings/emails.py)
+CONFIRMATION_EMAIL_WINDOW = env.int('CONFIRMATION_EMAIL_WINDOW', default=5)  # seconds to collect a batch
+CONFIRMATION_EMAIL_BATCH_SIZE = env.int('CONFIRMATION_EMAIL_BATCH_SIZE', default=100)
+CONFIRMATION_EMAIL_MAX_ATTEMPTS = env.int('CONFIRMATION_EMAIL_MAX_ATTEMPTS', default=5)
+CONFIRMATION_EMAIL_RETRY_BASE = env.int('CONFIRMATION_EMAIL_RETRY_BASE', default=30)  # seconds, doubled per attempt
+CONFIRMATION_EMAIL_SEND_LEASE = env.int('CONFIRMATION_EMAIL_SEND_LEASE', default=300)  # seconds a claimed batch is hidden
+
+# Per-request timing instrumentation (see listings/middleware.py)
+REQUEST_METRICS_ENABLED = env.bool('REQUEST_METRICS_ENABLED', default=False)
+REQUEST_METRICS_SAMPLE_RATE = env.float('REQUEST_METRICS_SAMPLE_RATE', default=1.0)  # fraction of requests timed
+REQUEST_METRICS_DUPLICATE_THRESHOLD = env.int('REQUEST_METRICS_DUPLICATE_THRESHOLD', default=3)
+# Bearer token a Prometheus scraper presents to /api/metrics/ (staff users may always read it)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+# Cache holding Celery task metrics so every worker process adds to the same series;
+# must be shared between processes (e.g. Redis via CACHE_URL) for workers to be counted
+METRICS_CACHE_ALIAS = env('METRICS_CACHE_ALIAS', default='default')
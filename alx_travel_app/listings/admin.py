@@ -1,9 +1,14 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Listing, Booking, Review, Payment
+from .models import Listing, Booking, Review, Payment, OccupiedNight, EmailOutbox, PricingRule, IdempotencyKey, ListingStatsRollup
 
 admin.site.register(Listing)
 admin.site.register(Booking)
 admin.site.register(Review)
 admin.site.register(Payment)
+admin.site.register(OccupiedNight)
+admin.site.register(EmailOutbox)
+admin.site.register(PricingRule)
+admin.site.register(IdempotencyKey)
+admin.site.register(ListingStatsRollup)
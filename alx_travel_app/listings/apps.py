@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ListingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'listings'
+
+    def ready(self):
+        # Register signal handlers (rating aggregates, etc.)
+        from . import signals  # noqa: F401
+        # Celery signal handlers for task metrics (web processes publish, workers execute)
+        from . import task_metrics  # noqa: F401
@@ -0,0 +1,123 @@
+"""
+Per-night availability index for listings.
+
+Every active booking (pending or confirmed) owns one OccupiedNight row per night of
+its stay. Because (listing, night) is unique, two overlapping active bookings cannot
+both be written, even from concurrent requests; the loser gets BookingOverlapError.
+Availability lookups are a range scan on that table and never touch Booking.
+"""
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+
+from .models import OccupiedNight
+
+# Statuses that hold their nights. Canceled bookings release them.
+ACTIVE_BOOKING_STATUSES = ('pending', 'confirmed')
+
+# Upper bound on the span a single availability query may cover.
+MAX_AVAILABILITY_RANGE_DAYS = 366
+
+
+class BookingOverlapError(Exception):
+    """
+    Raised when a booking would occupy a night already held by another active booking.
+    """
+    def __init__(self, listing_id, nights=None):
+        self.listing_id = listing_id
+        self.nights = nights or []
+        super().__init__(f"Listing {listing_id} is already booked for one or more of the requested nights.")
+
+
+def as_date(value):
+    """
+    Accepts a date or an ISO 'YYYY-MM-DD' string (as model fields may hold before a refresh).
+    """
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def parse_date_range(params, required=True):
+    """
+    Reads a [from, to) stay from query parameters. Returns (None, None) when neither is
+    given and required is False. Raises ValueError with a client-facing message otherwise.
+    """
+    raw_start, raw_end = params.get('from'), params.get('to')
+    if raw_start is None and raw_end is None and not required:
+        return None, None
+    try:
+        start_date, end_date = as_date(raw_start), as_date(raw_end)
+    except (TypeError, ValueError):
+        raise ValueError("'from' and 'to' are required dates in YYYY-MM-DD format")
+    if end_date <= start_date:
+        raise ValueError("'to' must be after 'from'")
+    if (end_date - start_date).days > MAX_AVAILABILITY_RANGE_DAYS:
+        raise ValueError(f"Range may not exceed {MAX_AVAILABILITY_RANGE_DAYS} days")
+    return start_date, end_date
+
+
+def nights_between(start_date, end_date):
+    """
+    Yields each night of a stay: start_date inclusive, end_date (check-out) exclusive.
+    """
+    night = as_date(start_date)
+    end_date = as_date(end_date)
+    while night < end_date:
+        yield night
+        night += timedelta(days=1)
+
+
+def sync_booking_nights(booking):
+    """
+    Rewrites the nights held by `booking` to match its current dates and status.
+    Must run inside the transaction that saved the booking.
+    """
+    OccupiedNight.objects.filter(booking_id=booking.pk).delete()
+    if booking.status not in ACTIVE_BOOKING_STATUSES:
+        return
+
+    nights = [
+        OccupiedNight(listing_id=booking.listing_id, booking_id=booking.pk, night=night)
+        for night in nights_between(booking.start_date, booking.end_date)
+    ]
+    try:
+        # Savepoint, so a conflict doesn't poison an enclosing transaction the caller may keep using.
+        with transaction.atomic():
+            OccupiedNight.objects.bulk_create(nights)
+    except IntegrityError:
+        taken = list(
+            OccupiedNight.objects.filter(
+                listing_id=booking.listing_id,
+                night__in=[n.night for n in nights],
+            ).values_list('night', flat=True)
+        )
+        raise BookingOverlapError(booking.listing_id, taken)
+
+
+def booked_nights(listing_id, start_date, end_date):
+    """
+    Returns the sorted list of nights in [start_date, end_date) that are already held.
+    """
+    return list(
+        OccupiedNight.objects.filter(
+            listing_id=listing_id,
+            night__gte=start_date,
+            night__lt=end_date,
+        ).order_by('night').values_list('night', flat=True)
+    )
+
+
+def exclude_unavailable(listings, start_date, end_date):
+    """
+    Narrows a Listing queryset to listings with no held night in [start_date, end_date).
+    Compiles to a single NOT EXISTS probe on the unique (listing, night) index per
+    candidate listing, so it composes with other filters in one query.
+    """
+    held = OccupiedNight.objects.filter(
+        listing_id=OuterRef('pk'),
+        night__gte=start_date,
+        night__lt=end_date,
+    )
+    return listings.filter(~Exists(held))
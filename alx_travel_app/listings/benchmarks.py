@@ -0,0 +1,300 @@
+"""
+Benchmark harness for the listings API hot paths.
+
+Each benchmark is an operation run N times in-process (through the Django test client,
+so middleware, routing and serialization are included) against data generated by the
+seed command with a fixed --seed. For every benchmark we record latency percentiles,
+throughput and database queries per operation. Results are plain JSON so two runs
+(e.g. before and after a change) can be diffed with compare_results().
+
+External services are replaced with local equivalents: payments go to FakeChapaServer,
+email goes to the locmem backend, and Celery publishes to an in-memory broker, so a
+request's cost includes enqueueing its task but never waits on a worker.
+"""
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from .cache import invalidate_all
+from .emails import flush_outbox
+from .fake_chapa import FakeChapaServer
+from .models import Booking, Listing, Payment
+from .tasks import send_booking_confirmation_email, send_payment_confirmation_email
+
+# Far enough ahead of the seeded bookings that created bookings never overlap them.
+BOOKING_CREATE_START = date(2030, 1, 1)
+
+
+class Benchmark:
+    """
+    A named operation. `prepare(i)` runs untimed before iteration i (e.g. to clear a
+    cache); `run(i)` is the timed part.
+    """
+    def __init__(self, name, run, prepare=None):
+        self.name = name
+        self.run = run
+        self.prepare = prepare
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def summarize(timings, query_counts=None):
+    """
+    Reduces per-iteration latencies (seconds) and, when counted, query counts to the
+    reported metrics.
+    """
+    timings_ms = sorted(t * 1000 for t in timings)
+    total = sum(timings)
+    return {
+        'iterations': len(timings_ms),
+        'mean_ms': round(statistics.mean(timings_ms), 3),
+        'p50_ms': round(percentile(timings_ms, 0.50), 3),
+        'p95_ms': round(percentile(timings_ms, 0.95), 3),
+        'p99_ms': round(percentile(timings_ms, 0.99), 3),
+        'max_ms': round(timings_ms[-1], 3),
+        'ops_per_sec': round(len(timings) / total, 1) if total else None,
+        'queries_per_op': round(statistics.mean(query_counts), 2) if query_counts else None,
+    }
+
+
+def measure(benchmark, iterations, warmup):
+    """
+    Runs warmup iterations untimed, then times each iteration and counts its queries.
+    """
+    for i in range(warmup):
+        if benchmark.prepare:
+            benchmark.prepare(i)
+        benchmark.run(i)
+
+    timings, query_counts = [], []
+    for i in range(warmup, warmup + iterations):
+        if benchmark.prepare:
+            benchmark.prepare(i)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            benchmark.run(i)
+            timings.append(time.perf_counter() - started)
+        query_counts.append(len(queries))
+    return summarize(timings, query_counts)
+
+
+def check(response, expected_status):
+    """
+    Fails loudly if an operation stops succeeding, so a broken path can't look fast.
+    """
+    if response.status_code != expected_status:
+        raise AssertionError(f"Expected {expected_status}, got {response.status_code}: {response.content[:200]!r}")
+
+
+def build_benchmarks(client, user, listing_ids, booking_ids, payment_ids):
+    """
+    Returns the benchmarks, in run order, over the seeded ids.
+    """
+    def pick(ids, i):
+        return ids[i % len(ids)]
+
+    def booking_payload(i):
+        start = BOOKING_CREATE_START + timedelta(days=8 * i)
+        return {
+            'listing_id': str(pick(listing_ids, i)),
+            'user_id': user.pk,
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=3)).isoformat(),
+        }
+
+    return [
+        Benchmark(
+            'listing_list',
+            lambda i: check(client.get('/api/listings/'), 200),
+            prepare=lambda i: invalidate_all(),
+        ),
+        Benchmark('listing_list_cached', lambda i: check(client.get('/api/listings/'), 200)),
+        Benchmark(
+            'listing_detail',
+            lambda i: check(client.get(f'/api/listings/{pick(listing_ids, i)}/'), 200),
+            prepare=lambda i: invalidate_all(),
+        ),
+        Benchmark(
+            'booking_create',
+            lambda i: check(client.post('/api/bookings/', booking_payload(i), format='json'), 201),
+        ),
+        Benchmark(
+            'payment_initiate',
+            lambda i: check(client.post('/api/payments/initiate/', {'booking_id': str(pick(booking_ids, i))},
+                                        format='json'), 200),
+        ),
+        Benchmark(
+            'payment_verify',
+            lambda i: check(client.get('/api/payments/verify/', {'tx_ref': str(pick(payment_ids, i))}), 200),
+        ),
+        Benchmark(
+            'email_booking_confirmation',
+            lambda i: (send_booking_confirmation_email.apply(args=[str(pick(booking_ids, i))]), flush_outbox()),
+        ),
+        Benchmark(
+            'email_payment_confirmation',
+            lambda i: (send_payment_confirmation_email.apply(args=[str(pick(payment_ids, i))]), flush_outbox()),
+        ),
+    ]
+
+
+BENCHMARK_NAMES = [
+    'listing_list', 'listing_list_cached', 'listing_detail', 'booking_create',
+    'payment_initiate', 'payment_verify', 'email_booking_confirmation', 'email_payment_confirmation',
+]
+
+
+@contextmanager
+def local_services():
+    """
+    Points Chapa at a fake server, email at locmem and Celery at an in-memory broker
+    for the duration of the run.
+    """
+    from alx_travel_app.celery import app
+
+    # The app reads CELERY_-prefixed settings, and those keys take precedence in app.conf.
+    overrides = {'CELERY_BROKER_URL': 'memory://', 'CELERY_TASK_IGNORE_RESULT': True}
+    saved_conf = {key: app.conf.get(key) for key in overrides}
+    app.conf.update(overrides)
+    with FakeChapaServer() as server, override_settings(
+        CHAPA_BASE_URL=server.base_url,
+        CHAPA_SECRET_KEY=settings.CHAPA_SECRET_KEY or 'bench-secret',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        ALLOWED_HOSTS=['testserver'],
+    ):
+        try:
+            yield server
+        finally:
+            app.conf.update(saved_conf)
+
+
+def seed_data(listings, users, bookings_per_listing, reviews_per_listing, seed):
+    """
+    Loads the fixed data set with the seed command and returns its row counts.
+    """
+    call_command(
+        'seed', num_listings=listings, num_users=users, bookings_per_listing=bookings_per_listing,
+        reviews_per_listing=reviews_per_listing, seed=seed, stdout=StringIO(),
+    )
+    return {
+        'listings': Listing.objects.count(),
+        'bookings': Booking.objects.count(),
+        'payments': Payment.objects.count(),
+    }
+
+
+def bench_host():
+    """
+    The user that owns the listings seeded by the standalone benchmark commands.
+    """
+    host, _ = get_user_model().objects.get_or_create(
+        username='bench_host', defaults={'email': 'bench_host@example.com'},
+    )
+    return host
+
+
+def seed_listings(count, build, batch_size=5000, with_batch=None, stdout=None):
+    """
+    Bulk-loads `count` listings for a benchmark command, one transaction per batch, and
+    returns their host. `build(host, index)` returns each unsaved Listing. bulk_create
+    skips Listing.save() and the signals, so rows that depend on the listings (search
+    terms, bookings) are written by `with_batch(listings)` inside the batch's transaction.
+    """
+    host = bench_host()
+    for number, offset in enumerate(range(0, count, batch_size)):
+        listings = [build(host, index) for index in range(offset, min(offset + batch_size, count))]
+        with transaction.atomic():
+            Listing.objects.bulk_create(listings, batch_size=batch_size)
+            if with_batch:
+                with_batch(listings)
+        if stdout and number % 20 == 19:
+            stdout.write(f"  {offset + len(listings)} listings")
+    invalidate_all()  # bulk_create skipped the cache invalidation signals
+    return host
+
+
+def git_commit():
+    """
+    The current commit, when run from a git checkout, so results record what they measured.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(iterations=200, warmup=10, only=None, data=None, seed=42):
+    """
+    Runs the benchmarks against the current database, which must already hold the
+    seeded data described by `data`. Returns the JSON-serializable result document.
+    """
+    listing_ids = list(Listing.objects.order_by('pk').values_list('pk', flat=True))
+    booking_ids = list(Booking.objects.order_by('pk').values_list('pk', flat=True))
+    payment_ids = list(Payment.objects.filter(status='completed').order_by('pk').values_list('pk', flat=True))
+    user = get_user_model().objects.get(pk=Booking.objects.order_by('pk').values_list('user', flat=True)[0])
+
+    results = {}
+    with local_services():
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(user)
+        for benchmark in build_benchmarks(client, user, listing_ids, booking_ids, payment_ids):
+            if only and benchmark.name not in only:
+                continue
+            results[benchmark.name] = measure(benchmark, iterations, warmup)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'seed': seed,
+            'iterations': iterations,
+            'warmup': warmup,
+            'data': data,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare_results(baseline, current, metrics=('p50_ms', 'p95_ms', 'ops_per_sec', 'queries_per_op')):
+    """
+    Returns rows of (benchmark, metric, baseline value, current value, change %) for the
+    benchmarks present in both result documents.
+    """
+    rows = []
+    for name, current_stats in current['benchmarks'].items():
+        baseline_stats = baseline['benchmarks'].get(name)
+        if baseline_stats is None:
+            continue
+        for metric in metrics:
+            before, after = baseline_stats.get(metric), current_stats.get(metric)
+            if before is None or after is None:
+                continue
+            change = ((after - before) / before * 100) if before else None
+            rows.append((name, metric, before, after, change))
+    return rows
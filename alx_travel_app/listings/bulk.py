@@ -0,0 +1,151 @@
+"""
+Bulk booking creation for partner integrations.
+
+A batch of N bookings costs a fixed number of queries instead of N serializer round
+trips: every referenced listing and user is resolved with one IN query each, prices
+come from the listings' price calendars (one cache read for the batch, see
+listings/pricing.py), overlaps (against existing bookings and within the batch) are
+found with one query on the occupancy index, and the accepted bookings and their
+nights are written with bulk_create. Invalid items are reported individually and
+never abort the rest of the batch.
+"""
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from rest_framework import serializers
+
+from .availability import ACTIVE_BOOKING_STATUSES, BookingOverlapError, nights_between
+from .models import BOOKING_STATUS_CHOICES, Booking, Listing, OccupiedNight
+from .parsers import InvalidLine
+from .pricing import calendars_for
+from .rollups import queue_stays
+from .serializers import overlap_validation_error
+from .snapshots import build_snapshot
+from .sqlite import write_transaction
+
+User = get_user_model()
+
+
+class BulkBookingItemSerializer(serializers.Serializer):
+    """
+    Shape validation for one bulk item. Deliberately has no related fields, so it
+    never touches the database; references are resolved in bulk afterwards.
+    """
+    listing_id = serializers.UUIDField()
+    user_id = serializers.IntegerField()
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    status = serializers.ChoiceField(choices=BOOKING_STATUS_CHOICES, default='pending')
+
+    def validate(self, data):
+        if data['end_date'] <= data['start_date']:
+            raise serializers.ValidationError("Booking must be for at least one night.")
+        return data
+
+
+def _validate_shapes(items, errors):
+    """
+    Returns [(index, validated_data)] for items that pass shape validation.
+    """
+    valid = []
+    for index, item in enumerate(items):
+        if isinstance(item, InvalidLine):
+            errors[index] = {'non_field_errors': [f'Line {item.line_number}: {item.message}']}
+            continue
+        if not isinstance(item, dict):
+            errors[index] = {'non_field_errors': ['Each item must be a JSON object.']}
+            continue
+        serializer = BulkBookingItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors[index] = serializer.errors
+    return valid
+
+
+def bulk_create_bookings(items):
+    """
+    Creates the valid, non-overlapping bookings among `items`.
+    Returns (created bookings in input order as [(index, booking)], {index: errors}).
+    """
+    errors = {}
+    valid = _validate_shapes(items, errors)
+    if not valid:
+        return [], errors
+
+    # --- Resolve references: one IN query per model ---
+    # Only the columns used for pricing and the booking snapshots (see listings/snapshots.py).
+    listings = (
+        Listing.objects.filter(pk__in={data['listing_id'] for _, data in valid})
+        .only('pk', 'pricepernight', 'name', 'location').in_bulk()
+    )
+    users = (
+        User.objects.filter(pk__in={data['user_id'] for _, data in valid})
+        .only('pk', 'first_name', 'last_name', 'email').in_bulk()
+    )
+    calendars = calendars_for(list(listings), listings)
+
+    # --- Existing occupancy for every listing/date window in the batch: one query ---
+    window_start = min(data['start_date'] for _, data in valid)
+    window_end = max(data['end_date'] for _, data in valid)
+    taken = set(
+        OccupiedNight.objects.filter(
+            listing_id__in=listings.keys(), night__gte=window_start, night__lt=window_end,
+        ).values_list('listing_id', 'night')
+    )
+
+    # --- Single pass: references, price, overlap (existing and in-batch) ---
+    accepted = []
+    for index, data in valid:
+        listing_id, user_id = data['listing_id'], data['user_id']
+        if listing_id not in listings:
+            errors[index] = {'listing_id': [f'Invalid pk "{listing_id}" - object does not exist.']}
+            continue
+        if user_id not in users:
+            errors[index] = {'user_id': [f'Invalid pk "{user_id}" - object does not exist.']}
+            continue
+
+        nights = list(nights_between(data['start_date'], data['end_date']))
+        claims = [(listing_id, night) for night in nights]
+        if data['status'] in ACTIVE_BOOKING_STATUSES:
+            conflicts = [night for key, night in zip(claims, nights) if key in taken]
+            if conflicts:
+                errors[index] = overlap_validation_error(BookingOverlapError(listing_id, conflicts)).detail
+                continue
+            taken.update(claims)  # Later items in the batch can't take these nights either
+
+        listing, user = listings[listing_id], users[user_id]
+        booking = Booking(
+            listing=listing,
+            user=user,
+            start_date=data['start_date'],
+            end_date=data['end_date'],
+            status=data['status'],
+            total_price=calendars[listing_id].quote(data['start_date'], data['end_date'])['total_price'],
+            snapshot=build_snapshot(listing, user),
+        )
+        booking._loaded_night_state = booking.night_state()
+        accepted.append((index, booking, nights))
+
+    try:
+        with write_transaction():
+            Booking.objects.bulk_create([booking for _, booking, _ in accepted])
+            OccupiedNight.objects.bulk_create([
+                OccupiedNight(listing_id=booking.listing_id, booking_id=booking.pk, night=night)
+                for _, booking, nights in accepted if booking.status in ACTIVE_BOOKING_STATUSES
+                for night in nights
+            ])
+            queue_stays([(booking.listing_id, booking.start_date, booking.end_date) for _, booking, _ in accepted])
+        created = [(index, booking) for index, booking, _ in accepted]
+    except IntegrityError:
+        # A concurrent writer claimed some of these nights after our overlap query.
+        # Fall back to per-item saves, which report exactly which items lost the race.
+        created = []
+        for index, booking, _ in accepted:
+            booking._loaded_night_state = None
+            try:
+                booking.save(force_insert=True)
+                created.append((index, booking))
+            except BookingOverlapError as exc:
+                errors[index] = overlap_validation_error(exc).detail
+
+    return created, errors
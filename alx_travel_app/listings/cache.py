@@ -0,0 +1,188 @@
+"""
+Versioned response cache for the listing read endpoints.
+
+Cached responses are keyed by the absolute URL (path + query string) and the rendered
+format, plus the version tokens of everything that can change their content:
+
+- a global generation, bumped by bulk writes that bypass signals
+- the list version, bumped whenever any listing's representation changes
+- a per-listing version, bumped when that listing, its reviews or its host change
+
+Invalidation never deletes entries; bumping a version makes every key built on the old
+token unreachable and lets the cache backend age them out. Because a key fully
+determines the response body, the ETag is derived from the key alone, so a matching
+If-None-Match is answered with 304 before any query or serialization runs.
+
+The backend is the Django cache named by settings.LISTINGS_CACHE_ALIAS (local memory
+by default, Redis when CACHE_URL points at one).
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+GENERATION_KEY = 'listings:generation'
+LIST_VERSION_KEY = 'listings:list:version'
+DETAIL_VERSION_KEY = 'listings:detail:{pk}:version'
+# Set for DATABASE_REPLICA_PIN_SECONDS after any invalidation (see listings/replicas.py).
+RECENT_WRITE_KEY = 'listings:recent-write'
+
+# Only the JSON rendering is cached; the browsable API embeds per-user forms.
+CACHEABLE_FORMATS = ('json',)
+
+
+def get_cache():
+    return caches[settings.LISTINGS_CACHE_ALIAS]
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def _versions(keys):
+    """
+    Returns the current token for each version key, creating missing ones.
+    A fresh random token (not a counter reset) is used, so ETags issued before a cache
+    flush can never match content built afterwards.
+    """
+    cache = get_cache()
+    found = cache.get_many(keys)
+    missing = {key: _new_token() for key in keys if key not in found}
+    if missing:
+        for key, token in missing.items():
+            # add() so concurrent initializers agree on one token
+            cache.add(key, token, timeout=None)
+        found.update(cache.get_many(list(missing)))
+    return [found.get(key, '') for key in keys]
+
+
+# --- Invalidation ---
+
+def invalidate_listings(listing_ids):
+    """
+    Bumps the detail versions of the given listings and the list version.
+    """
+    tokens = {DETAIL_VERSION_KEY.format(pk=pk): _new_token() for pk in listing_ids}
+    tokens[LIST_VERSION_KEY] = _new_token()
+    get_cache().set_many(tokens, timeout=None)
+    _note_write()
+
+
+def invalidate_all():
+    """
+    Bumps the global generation, invalidating every cached listing response.
+    Used after bulk writes (queryset.update(), bulk_create) that skip signals.
+    """
+    get_cache().set(GENERATION_KEY, _new_token(), timeout=None)
+    _note_write()
+
+
+def _note_write():
+    # A miss right after an invalidation must not be refilled from a lagging replica.
+    if settings.DATABASE_REPLICAS:
+        get_cache().set(RECENT_WRITE_KEY, True, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def written_recently():
+    """
+    Whether a listing changed within the last DATABASE_REPLICA_PIN_SECONDS.
+    """
+    return get_cache().get(RECENT_WRITE_KEY, False)
+
+
+# --- Read path ---
+
+class CachedResponse:
+    """
+    The cache key and ETag for one request, plus helpers to serve or store the response.
+    """
+    def __init__(self, request, version_keys):
+        generation, *tokens = _versions([GENERATION_KEY] + list(version_keys))
+        url = request.build_absolute_uri()
+        fmt = request.accepted_renderer.format
+        digest = hashlib.sha1(f'{url}|{fmt}'.encode()).hexdigest()
+        self.key = f"listings:response:{generation}:{':'.join(tokens)}:{digest}"
+        self.etag = '"%s"' % hashlib.sha1(self.key.encode()).hexdigest()
+        self.request = request
+
+    def not_modified(self):
+        """
+        Returns a 304 response if the client's If-None-Match already names this version.
+        """
+        header = self.request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return None
+        etags = [tag.removeprefix('W/') for tag in parse_etags(header)]
+        if self.etag in etags or '*' in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = self.etag
+            return response
+        return None
+
+    def cached(self):
+        """
+        Returns the stored response for this key, or None on a miss.
+        """
+        entry = get_cache().get(self.key)
+        if entry is None:
+            return None
+        content, content_type = entry
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = self.etag
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def store(self, response):
+        """
+        Stores a rendered 200 response under this key and tags it with the ETag.
+        """
+        if response.status_code != 200:
+            return
+        response.render()
+        get_cache().set(
+            self.key, (response.content, response['Content-Type']),
+            timeout=settings.LISTINGS_CACHE_TIMEOUT,
+        )
+        response['ETag'] = self.etag
+        response['X-Cache'] = 'MISS'
+
+
+class CachedReadMixin:
+    """
+    ViewSet mixin that serves list() and retrieve() through the versioned response cache.
+    """
+    def _cached_read(self, request, version_keys, handler, *args, **kwargs):
+        if request.accepted_renderer.format not in CACHEABLE_FORMATS:
+            return handler(request, *args, **kwargs)
+
+        entry = CachedResponse(request, version_keys)
+        response = entry.not_modified() or entry.cached()
+        if response is not None:
+            return response
+
+        # Rendering happens in finalize_response(), so the entry is stored there.
+        self._cache_entry = entry
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_read(request, [LIST_VERSION_KEY], super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            pk = uuid.UUID(str(pk))  # Match the str(uuid) form used by invalidation
+        except ValueError:
+            pass
+        key = DETAIL_VERSION_KEY.format(pk=pk)
+        return self._cached_read(request, [key], super().retrieve, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        entry = getattr(self, '_cache_entry', None)
+        if entry is not None:
+            self._cache_entry = None
+            entry.store(response)
+        return response
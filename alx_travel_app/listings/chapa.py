@@ -0,0 +1,265 @@
+"""
+Client for the Chapa payment gateway.
+
+All outbound Chapa traffic goes through ChapaClient, which provides:
+
+- a pooled keep-alive requests.Session shared by every request in the process
+- separate connect and read timeouts on every call
+- bounded retries with exponential backoff and full jitter for transient failures
+  (connection errors, timeouts, 429 and 5xx responses); POSTs are only retried when
+  the request provably never reached the gateway or the gateway answered 429/503
+- a circuit breaker that fails fast while the gateway is down, instead of tying up a
+  worker for the full timeout on every call
+
+AsyncChapaClient exposes the same calls as coroutines for ASGI code paths; it runs the
+pooled client in a worker thread so the event loop is never blocked.
+
+Settings: CHAPA_BASE_URL, CHAPA_SECRET_KEY, CHAPA_CONNECT_TIMEOUT, CHAPA_READ_TIMEOUT,
+CHAPA_MAX_RETRIES, CHAPA_BACKOFF_BASE, CHAPA_BACKOFF_MAX, CHAPA_POOL_SIZE,
+CHAPA_BREAKER_THRESHOLD and CHAPA_BREAKER_RESET_TIMEOUT.
+"""
+import random
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from .instrumentation import timed
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Statuses that mean the gateway did not act on the request, so even a POST may be resent.
+POST_RETRYABLE_STATUS_CODES = {429, 503}
+
+
+class ChapaError(Exception):
+    """
+    The gateway returned something unusable (e.g. a non-JSON body).
+    """
+
+
+class ChapaUnavailable(ChapaError):
+    """
+    The gateway could not be reached in time, kept failing, or the circuit is open.
+    """
+
+
+class ChapaRejected(ChapaError):
+    """
+    The gateway answered with a non-retryable error status (e.g. 400, 401 or 404).
+    The decoded body is kept for its message.
+    """
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body if isinstance(body, dict) else {}
+        super().__init__(f"Chapa returned HTTP {status_code}: {self.body.get('message', '')}")
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls until
+    `reset_timeout` seconds have passed; then lets a single trial call through
+    (half-open) and closes again if it succeeds.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class ChapaClient:
+    """
+    Synchronous Chapa API client. Safe to share between threads.
+    """
+    def __init__(self, base_url, secret_key, connect_timeout=3.05, read_timeout=10.0,
+                 max_retries=2, backoff_base=0.2, backoff_max=2.0, pool_size=10, breaker=None,
+                 sleep=time.sleep):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Bearer {secret_key}'})
+        # Retries are handled below (with jitter and POST rules), not by urllib3.
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # --- API calls ---
+
+    def initialize(self, payload):
+        """
+        POST /v1/transaction/initialize. Returns the decoded JSON body, or raises
+        ChapaRejected for an error status.
+        """
+        with timed('http'):
+            return self._request('POST', '/v1/transaction/initialize', json=payload)
+
+    def verify(self, tx_ref):
+        """
+        GET /v1/transaction/verify/<tx_ref>. Returns the decoded JSON body, or raises
+        ChapaRejected for an error status.
+        """
+        with timed('http'):
+            return self._request('GET', f'/v1/transaction/verify/{tx_ref}')
+
+    # --- Transport ---
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise ChapaUnavailable('Chapa circuit breaker is open')
+
+        idempotent = method in ('GET', 'HEAD')
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.sleep(self._backoff(attempt - 1))
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                last_error = exc
+                # A read timeout on a POST may mean the gateway acted on it; don't resend.
+                never_sent = isinstance(exc, requests.ConnectTimeout) or not isinstance(exc, requests.Timeout)
+                if idempotent or never_sent:
+                    continue
+                break
+            except requests.RequestException as exc:
+                last_error = exc
+                break
+
+            retryable = POST_RETRYABLE_STATUS_CODES if not idempotent else RETRYABLE_STATUS_CODES
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                last_error = ChapaUnavailable(f'Chapa returned HTTP {response.status_code}')
+                if response.status_code in retryable:
+                    continue
+                break
+
+            self.breaker.record_success()
+            try:
+                body = response.json()
+            except ValueError:
+                raise ChapaError(f'Chapa returned a non-JSON response (HTTP {response.status_code})')
+            if not response.ok:
+                # The gateway is up (so the breaker stays closed), but this is no answer.
+                raise ChapaRejected(response.status_code, body)
+            return body
+
+        self.breaker.record_failure()
+        raise ChapaUnavailable(f'Chapa request failed: {last_error}') from last_error
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncChapaClient:
+    """
+    Coroutine interface over a ChapaClient for ASGI views and other async code.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    async def initialize(self, payload):
+        return await sync_to_async(self.client.initialize, thread_sensitive=False)(payload)
+
+    async def verify(self, tx_ref):
+        return await sync_to_async(self.client.verify, thread_sensitive=False)(tx_ref)
+
+
+# --- Process-wide client ---
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process-wide ChapaClient built from settings, so the connection pool
+    and circuit breaker are shared by every request handled by this process.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ChapaClient(
+                    base_url=settings.CHAPA_BASE_URL,
+                    secret_key=settings.CHAPA_SECRET_KEY,
+                    connect_timeout=settings.CHAPA_CONNECT_TIMEOUT,
+                    read_timeout=settings.CHAPA_READ_TIMEOUT,
+                    max_retries=settings.CHAPA_MAX_RETRIES,
+                    backoff_base=settings.CHAPA_BACKOFF_BASE,
+                    backoff_max=settings.CHAPA_BACKOFF_MAX,
+                    pool_size=settings.CHAPA_POOL_SIZE,
+                    breaker=CircuitBreaker(
+                        failure_threshold=settings.CHAPA_BREAKER_THRESHOLD,
+                        reset_timeout=settings.CHAPA_BREAKER_RESET_TIMEOUT,
+                    ),
+                )
+    return _client
+
+
+def get_async_client():
+    return AsyncChapaClient(get_client())
+
+
+def reset_client():
+    """
+    Drops the process-wide client (closing its pool); the next get_client() rebuilds it.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+@receiver(setting_changed)
+def _reset_on_settings_change(setting, **kwargs):
+    if setting.startswith('CHAPA_'):
+        reset_client()
@@ -0,0 +1,254 @@
+"""
+Batched delivery of booking and payment confirmation emails.
+
+Confirmations are not sent one by one. queue_confirmation() records them in the
+EmailOutbox table and schedules a flush a short window later (at most one scheduled
+flush per window), so a burst of bookings turns into one flush that:
+
+- loads every booking/payment in the batch with one select_related query per kind
+- sends all messages over a single reused mail connection
+- isolates failures per message: a failed send is rescheduled with exponential
+  backoff and jitter and does not affect the rest of the batch
+
+Settings: CONFIRMATION_EMAIL_WINDOW, CONFIRMATION_EMAIL_BATCH_SIZE,
+CONFIRMATION_EMAIL_MAX_ATTEMPTS, CONFIRMATION_EMAIL_RETRY_BASE and
+CONFIRMATION_EMAIL_SEND_LEASE.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Booking, EmailOutbox, Payment
+from .sqlite import write_transaction
+
+FLUSH_SCHEDULED_KEY = 'listings:emails:flush-scheduled'
+
+
+class EmailDeliveryError(Exception):
+    """
+    Raised by flush_confirmation_emails when messages in its batch could not be sent,
+    so the failure (or retry) is visible to Celery instead of looking like a success.
+    """
+
+
+# --- Message builders ---
+
+def build_booking_confirmation(booking):
+    """
+    Builds the booking confirmation email. Expects listing, listing.host and user loaded.
+    """
+    user = booking.user
+    listing = booking.listing
+    subject = f"Booking Confirmation - {listing.name}"
+    message = f"""
+        Hello {user.first_name or user.username or 'Valued Customer'},
+        
+        Your booking has been successfully created!
+        
+        Booking Details:
+        - Booking ID: {booking.booking_id}
+        - Listing: {listing.name}
+        - Location: {listing.location}
+        - Check-in: {booking.start_date}
+        - Check-out: {booking.end_date}
+        - Total Price: ${booking.total_price}
+        - Status: {booking.get_status_display()}
+        
+        Host Information:
+        - Host: {listing.host.first_name or listing.host.username or 'Host'}
+        - Contact: {listing.host.email}
+        
+        We'll send you another confirmation once your payment is processed.
+        
+        Thank you for choosing ALX Travel!
+        
+        Best regards,
+        ALX Travel Team
+        """
+    return EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+def build_payment_confirmation(payment):
+    """
+    Builds the payment confirmation email. Expects booking, booking.listing and booking.user loaded.
+    """
+    booking = payment.booking
+    user = booking.user
+    subject = f"Payment Confirmation for Booking {booking.booking_id.hex[:8]}"
+    message = f"""
+        Hello {user.first_name or user.username},
+        
+        Your payment for booking {booking.listing.name} has been confirmed.
+        
+        Booking Details:
+        - Listing: {booking.listing.name}
+        - Dates: {booking.start_date} to {booking.end_date}
+        - Total Amount: {payment.amount} ETB
+        - Payment ID: {payment.payment_id}
+        
+        Thank you for using our service!
+        
+        Best regards,
+        ALX Travel Team
+        """
+    return EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+# Per kind: how to bulk-load the referenced objects and how to build the message.
+EMAIL_KINDS = {
+    'booking_confirmation': (
+        lambda ids: Booking.objects.select_related('listing__host', 'user').in_bulk(ids),
+        build_booking_confirmation,
+    ),
+    'payment_confirmation': (
+        lambda ids: Payment.objects.select_related('booking__listing', 'booking__user').in_bulk(ids),
+        build_payment_confirmation,
+    ),
+}
+
+
+# --- Queueing ---
+
+def queue_confirmation(kind, object_id):
+    """
+    Records a confirmation email and makes sure a flush is scheduled within the window.
+    """
+    EmailOutbox.objects.create(kind=kind, object_id=object_id)
+    schedule_flush()
+
+
+def queue_confirmations(kind, object_ids):
+    """
+    Records many confirmation emails with one insert (used by bulk booking creation).
+    """
+    EmailOutbox.objects.bulk_create([EmailOutbox(kind=kind, object_id=pk) for pk in object_ids])
+    schedule_flush()
+
+
+def schedule_flush():
+    """
+    Schedules flush_confirmation_emails after CONFIRMATION_EMAIL_WINDOW seconds, unless
+    one is already scheduled for the current window.
+    """
+    from .tasks import flush_confirmation_emails
+
+    window = settings.CONFIRMATION_EMAIL_WINDOW
+    if cache.add(FLUSH_SCHEDULED_KEY, True, timeout=window):
+        transaction.on_commit(lambda: flush_confirmation_emails.apply_async(countdown=window))
+
+
+# --- Flushing ---
+
+def retry_delay(attempts):
+    """
+    Exponential backoff with jitter for a message that has failed `attempts` times.
+    """
+    base = settings.CONFIRMATION_EMAIL_RETRY_BASE * (2 ** (attempts - 1))
+    return timedelta(seconds=base + random.uniform(0, base / 2))
+
+
+def _load_messages(rows):
+    """
+    Builds {outbox row pk: EmailMessage or None} with one query per email kind.
+    None means the booking/payment no longer exists.
+    """
+    messages = {}
+    for kind, (load, build) in EMAIL_KINDS.items():
+        kind_rows = [row for row in rows if row.kind == kind]
+        if not kind_rows:
+            continue
+        objects = load([row.object_id for row in kind_rows])
+        for row in kind_rows:
+            obj = objects.get(row.object_id)
+            messages[row.pk] = build(obj) if obj is not None else None
+    return messages
+
+
+def _claim_batch(batch_size, now):
+    """
+    Takes up to `batch_size` due rows and pushes their next_attempt_at out by
+    CONFIRMATION_EMAIL_SEND_LEASE, so concurrent flushes skip them while they are sent.
+    The transaction is short: it must not stay open across the SMTP round trips.
+    """
+    with write_transaction():
+        due = EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent flushes take disjoint batches instead of waiting on each other.
+            due = due.select_for_update(skip_locked=True)
+        rows = list(due[:batch_size])
+        if rows:
+            lease_until = now + timedelta(seconds=settings.CONFIRMATION_EMAIL_SEND_LEASE)
+            EmailOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(next_attempt_at=lease_until)
+    return rows
+
+
+def flush_outbox(batch_size=None):
+    """
+    Sends up to `batch_size` due confirmation emails over one mail connection.
+    Returns a dict of counts: sent, retrying, failed (gave up), dropped (object gone),
+    plus remaining (whether another batch is already due) and retry_in (seconds until
+    the earliest rescheduled message is due, or None).
+
+    The batch is claimed with a lease rather than held under a lock, so no transaction
+    is open while messages are sent. If the worker dies mid-batch, the unsent rows become
+    due again when the lease expires.
+    """
+    batch_size = batch_size or settings.CONFIRMATION_EMAIL_BATCH_SIZE
+    max_attempts = settings.CONFIRMATION_EMAIL_MAX_ATTEMPTS
+    stats = {'sent': 0, 'retrying': 0, 'failed': 0, 'dropped': 0, 'remaining': False, 'retry_in': None}
+
+    rows = _claim_batch(batch_size, timezone.now())
+    if not rows:
+        return stats
+
+    messages = _load_messages(rows)
+    done, retried = [], []
+    mail_connection = get_connection()
+    connection_open = False
+    try:
+        for row in rows:
+            message = messages[row.pk]
+            if message is None:
+                done.append(row.pk)
+                stats['dropped'] += 1
+                continue
+            message.connection = mail_connection
+            try:
+                if not connection_open:
+                    # Opened explicitly so the backend keeps it open across sends.
+                    mail_connection.open()
+                    connection_open = True
+                message.send()
+            except Exception as exc:
+                # Drop the possibly broken connection; the next message reopens it.
+                mail_connection.close()
+                connection_open = False
+                row.attempts += 1
+                row.last_error = f'{type(exc).__name__}: {exc}'
+                if row.attempts >= max_attempts:
+                    row.status = 'failed'
+                    stats['failed'] += 1
+                else:
+                    row.next_attempt_at = timezone.now() + retry_delay(row.attempts)
+                    stats['retrying'] += 1
+                retried.append(row)
+            else:
+                done.append(row.pk)
+                stats['sent'] += 1
+    finally:
+        mail_connection.close()
+
+    EmailOutbox.objects.filter(pk__in=done).delete()
+    if retried:
+        EmailOutbox.objects.bulk_update(retried, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+        due_again = [row.next_attempt_at for row in retried if row.status == 'pending']
+        if due_again:
+            stats['retry_in'] = max(0.0, (min(due_again) - timezone.now()).total_seconds())
+
+    stats['remaining'] = len(rows) == batch_size
+    return stats
@@ -0,0 +1,146 @@
+"""
+Streaming exports of bookings and payments for finance reconciliation.
+
+Rows are read with values_list() over .iterator(chunk_size=...), so neither model
+instances nor serializer output are built, and only one chunk is held in memory at a
+time regardless of how many rows match. The same generators back the export endpoints
+(StreamingHttpResponse) and the `export` management command.
+"""
+import csv
+import json
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Booking, Payment
+
+
+class ExportSpec:
+    """
+    What an export reads: the model, its columns (values_list lookups, which may follow
+    foreign keys) and the allowed status values for filtering.
+    """
+    def __init__(self, model, columns, statuses):
+        self.model = model
+        self.columns = columns
+        self.statuses = statuses
+
+
+EXPORTS = {
+    'bookings': ExportSpec(
+        Booking,
+        ['booking_id', 'listing_id', 'user_id', 'start_date', 'end_date', 'total_price', 'status', 'created_at'],
+        [value for value, _ in Booking._meta.get_field('status').choices],
+    ),
+    'payments': ExportSpec(
+        Payment,
+        ['payment_id', 'booking_id', 'amount', 'status', 'transaction_id', 'created_at', 'updated_at'],
+        [value for value, _ in Payment.PAYMENT_STATUS_CHOICES],
+    ),
+}
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_export_filters(kind, params):
+    """
+    Reads the optional filters from query parameters (or command options):
+    `from` / `to` as YYYY-MM-DD creation dates ([from, to), either may be omitted) and
+    `status` as a comma-separated list. Raises ValueError with a client-facing message.
+    """
+    spec = EXPORTS[kind]
+    filters = {}
+    for param, lookup in (('from', 'created_at__gte'), ('to', 'created_at__lt')):
+        raw = params.get(param)
+        if not raw:
+            continue
+        try:
+            day = date.fromisoformat(raw)
+        except ValueError:
+            raise ValueError(f"'{param}' must be a date in YYYY-MM-DD format")
+        # Compare against aware datetimes, not created_at__date, so the index is usable.
+        filters[lookup] = timezone.make_aware(datetime.combine(day, time.min))
+    if 'created_at__gte' in filters and 'created_at__lt' in filters \
+            and filters['created_at__lt'] <= filters['created_at__gte']:
+        raise ValueError("'to' must be after 'from'")
+
+    raw_status = params.get('status')
+    if raw_status:
+        statuses = [status.strip() for status in raw_status.split(',') if status.strip()]
+        unknown = sorted(set(statuses) - set(spec.statuses))
+        if unknown:
+            raise ValueError(f"Unknown status: {', '.join(unknown)}. Choose from {', '.join(spec.statuses)}")
+        filters['status__in'] = statuses
+    return filters
+
+
+def export_rows(kind, filters, chunk_size=None):
+    """
+    Yields one tuple per matching row, oldest first.
+    Ordered by (created_at, pk) so the date range and status filters are served by the
+    (status, created_at) and created_at indexes and the output order is stable.
+    """
+    spec = EXPORTS[kind]
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    queryset = (
+        spec.model.objects.filter(**filters)
+        .order_by('created_at', 'pk')
+        .values_list(*spec.columns)
+    )
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def plain(value):
+    """
+    Converts a column value to the text both formats write: UUIDs and decimals as
+    strings, dates and datetimes as ISO 8601, None as an empty CSV cell / JSON null.
+    """
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """
+    A file-like object whose write() returns the text, so csv.writer can feed a generator.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(columns, rows):
+    """
+    Yields the header line, then one CSV line per row.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([plain(value) for value in row])
+
+
+def stream_ndjson(columns, rows):
+    """
+    Yields one JSON object per row, newline-terminated.
+    """
+    for row in rows:
+        yield json.dumps({column: plain(value) for column, value in zip(columns, row)}) + '\n'
+
+
+def stream_export(kind, export_format, filters, chunk_size=None):
+    """
+    Returns a generator of text chunks for the given export and format.
+    Nothing is queried until the generator is first advanced.
+    """
+    columns = EXPORTS[kind].columns
+    render = stream_csv if export_format == 'csv' else stream_ndjson
+    return render(columns, export_rows(kind, filters, chunk_size))
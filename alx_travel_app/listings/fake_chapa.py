@@ -0,0 +1,172 @@
+"""
+A local stand-in for the Chapa API, for tests and load runs.
+
+Implements the two endpoints the app uses:
+
+- POST /v1/transaction/initialize  -> checkout_url for the given tx_ref
+- GET  /v1/transaction/verify/<tx_ref> -> success for every tx_ref it initialized
+
+Latency and failures can be injected, either for the whole run (latency, failure_rate)
+or for the next N requests (fail_next), to exercise timeouts, retries and the circuit
+breaker. Run it standalone with `python manage.py fake_chapa` and point
+CHAPA_BASE_URL at it.
+"""
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VERIFY_PATH = re.compile(r'^/v1/transaction/verify/(?P<tx_ref>[^/?]+)$')
+
+
+class FakeChapaState:
+    """
+    Shared, lock-protected state of one fake server.
+    """
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fail_next = 0
+        self.fail_status = 503
+        self.transactions = {}
+        self.requests = []
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def should_fail(self):
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return self.failure_rate > 0 and self.rng.random() < self.failure_rate
+
+
+class FakeChapaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real gateway
+    # Headers and body go out in separate writes; without TCP_NODELAY, Nagle plus the
+    # client's delayed ACK adds ~40 ms to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass  # Keep test and load-run output clean
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_common(self):
+        """
+        Records the request and applies injected latency/failures.
+        Returns False if the request was already answered with an error.
+        """
+        with self.state.lock:
+            self.state.requests.append((self.command, self.path))
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.should_fail():
+            self.send_json(self.state.fail_status, {'status': 'failed', 'message': 'Injected failure'})
+            return False
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            self.send_json(401, {'status': 'failed', 'message': 'Invalid API Key'})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self.handle_common():
+            return
+        if self.path != '/v1/transaction/initialize':
+            return self.send_json(404, {'status': 'failed', 'message': 'Not found'})
+
+        tx_ref = body.get('tx_ref')
+        if not tx_ref or not body.get('amount'):
+            return self.send_json(400, {'status': 'failed', 'message': 'tx_ref and amount are required'})
+        with self.state.lock:
+            if tx_ref in self.state.transactions:
+                return self.send_json(400, {'status': 'failed', 'message': 'Transaction reference has been used before'})
+            self.state.transactions[tx_ref] = body
+        self.send_json(200, {
+            'status': 'success',
+            'message': 'Hosted Link',
+            'data': {'checkout_url': f'https://checkout.chapa.test/checkout/payment/{tx_ref}'},
+        })
+
+    def do_GET(self):
+        if not self.handle_common():
+            return
+        match = VERIFY_PATH.match(self.path)
+        if not match:
+            return self.send_json(404, {'status': 'failed', 'message': 'Not found'})
+        with self.state.lock:
+            transaction = self.state.transactions.get(match['tx_ref'])
+        if transaction is None:
+            return self.send_json(404, {'status': 'failed', 'message': 'Invalid transaction or Transaction not found'})
+        self.send_json(200, {
+            'status': 'success',
+            'message': 'Payment details',
+            'data': {
+                'tx_ref': match['tx_ref'],
+                'amount': transaction['amount'],
+                'currency': transaction.get('currency', 'ETB'),
+                'status': 'success',
+            },
+        })
+
+
+class FakeChapaHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that's expected here, not an error.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeChapaServer:
+    """
+    Runs the fake gateway on a background thread.
+
+        with FakeChapaServer() as server:
+            client = ChapaClient(server.base_url, 'test-key')
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, seed=None):
+        self.httpd = FakeChapaHTTPServer((host, port), FakeChapaHandler)
+        self.httpd.state = FakeChapaState(latency=latency, failure_rate=failure_rate, seed=seed)
+        self.thread = None
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,290 @@
+"""
+Fast read path for list endpoints: serializer output built from .values() rows.
+
+Once the queries are planned (listings/querysets.py), most of the time in a list
+request goes to DRF itself: a model instance per row, then Field.get_attribute() and
+Field.to_representation() for every field. For read-only rendering, a RowReader is
+compiled once per serializer class. It walks the declared fields, like the query
+planner, and produces:
+
+- the .values() lookups the serializer reads, with nested serializers on forward
+  relations flattened into `relation__column` lookups (one join, no instances)
+- one converter per field that does what the DRF field's to_representation() does
+  for that column type, picked once at compile time
+
+Reading a page is then one .values() query and a loop of dict lookups and converter
+calls. SerializerMethodFields are opaque, so a serializer opts them in by naming the
+columns they read in `Meta.method_field_sources` and a function of those column values
+in `Meta.method_field_values`. A serializer with any field the compiler does not know
+is not compiled (reader_for_serializer() returns None), and callers fall back to the
+regular serializer. The output is byte-identical to the regular serializer's once
+rendered; the golden tests in listings/tests.py hold both paths to that.
+
+Enabled with FAST_READ_SERIALIZERS. Responses are rendered by FastJSONRenderer
+(listings/renderers.py) on both paths.
+"""
+import decimal
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.fields import ISO_8601
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class NotCompilable(Exception):
+    """
+    Raised while compiling a serializer that has a field the fast path can't render.
+    """
+
+
+# --- Converters: each mirrors one DRF field's to_representation() ---
+
+def _identity(value):
+    return value
+
+
+def _uuid_converter(field):
+    if field.uuid_format != 'hex_verbose':
+        raise NotCompilable(field)
+    return str
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.normalize_output or field.decimal_places is None:
+        raise NotCompilable(field)
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return f'{value.quantize(quantum, rounding=rounding, context=context):f}'
+    return convert
+
+
+def _datetime_converter(field):
+    if getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() != ISO_8601:
+        raise NotCompilable(field)
+    page = {}
+
+    def setup():
+        # The field's timezone is per request (the active timezone), so it is looked up
+        # once per page rather than per value.
+        page['tz'] = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+    def convert(value):
+        if not value:
+            return None
+        tz = page['tz']
+        if tz is not None and value.utcoffset() is not None:
+            value = value.astimezone(tz)
+        else:
+            value = field.enforce_timezone(value)  # Naive values, or USE_TZ off
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    convert.setup = setup
+    return convert
+
+
+def _date_converter(field):
+    if getattr(field, 'format', api_settings.DATE_FORMAT).lower() != ISO_8601:
+        raise NotCompilable(field)
+
+    def convert(value):
+        return value.isoformat() if value else None
+    return convert
+
+
+def _choice_converter(field):
+    lookup = field.choice_strings_to_values
+
+    def convert(value):
+        if value == '':
+            return value
+        return lookup.get(str(value), value)
+    return convert
+
+
+def _related_pk_converter(field):
+    if field.pk_field is not None:
+        raise NotCompilable(field)
+    return _identity  # .values() already yields the related primary key
+
+
+# Checked in order, so subclasses come before their bases.
+CONVERTERS = [
+    (serializers.ChoiceField, _choice_converter),
+    (serializers.UUIDField, _uuid_converter),
+    (serializers.DecimalField, _decimal_converter),
+    (serializers.DateTimeField, _datetime_converter),
+    (serializers.DateField, _date_converter),
+    (serializers.BooleanField, lambda field: bool),
+    (serializers.IntegerField, lambda field: int),
+    (serializers.FloatField, lambda field: float),
+    (serializers.CharField, lambda field: str),
+    (serializers.PrimaryKeyRelatedField, _related_pk_converter),
+    (serializers.ReadOnlyField, lambda field: _identity),
+]
+
+
+def _converter_for(field):
+    for field_class, factory in CONVERTERS:
+        if isinstance(field, field_class):
+            return factory(field)
+    raise NotCompilable(field)
+
+
+# --- Compilation ---
+
+def _compile(serializer, prefix, lookups, setups):
+    """
+    Returns the mapper for `serializer`: a function from a .values() row to the
+    serializer's output dict. Adds the lookups it reads to `lookups`, and the setup
+    functions of converters that need per-page state to `setups`.
+    """
+    meta = getattr(serializer, 'Meta', None)
+    method_sources = getattr(meta, 'method_field_sources', {})
+    method_values = getattr(meta, 'method_field_values', {})
+    model = meta.model
+    steps = []
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            raise NotCompilable(field)
+
+        if isinstance(field, serializers.BaseSerializer):
+            relation = model._meta.get_field(field.source)
+            if not relation.many_to_one:
+                raise NotCompilable(field)
+            nested_prefix = prefix + field.source + '__'
+            # The related primary key decides between a nested object and None.
+            presence = nested_prefix + 'pk'
+            lookups.append(presence)
+            steps.append((name, _nested(presence, _compile(field, nested_prefix, lookups, setups))))
+            continue
+
+        if isinstance(field, serializers.SerializerMethodField):
+            if name not in method_values:
+                raise NotCompilable(field)
+            sources = [prefix + source for source in method_sources[name]]
+            lookups.extend(sources)
+            steps.append((name, _method(sources, method_values[name])))
+            continue
+
+        if field.source == '*' or len(field.source_attrs) != 1:
+            raise NotCompilable(field)
+        lookup = prefix + field.source_attrs[0]
+        lookups.append(lookup)
+        convert = _converter_for(field)
+        if hasattr(convert, 'setup'):
+            setups.append(convert.setup)
+        steps.append((name, _column(lookup, convert)))
+
+    def mapper(row):
+        return {name: step(row) for name, step in steps}
+    return mapper
+
+
+def _column(lookup, convert):
+    def step(row):
+        value = row[lookup]
+        return None if value is None else convert(value)
+    return step
+
+
+def _nested(presence, mapper):
+    def step(row):
+        return None if row[presence] is None else mapper(row)
+    return step
+
+
+def _method(sources, function):
+    def step(row):
+        return function(*[row[source] for source in sources])
+    return step
+
+
+class RowReader:
+    """
+    A compiled serializer: reads a queryset with .values() and maps each row to the
+    serializer's output.
+    """
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        lookups, self.setups = [], []
+        self.mapper = _compile(serializer_class(), '', lookups, self.setups)
+        self.lookups = list(dict.fromkeys(lookups))
+        # Optional classmethod run on each page of rows before mapping (e.g. to fill
+        # data missing from some rows with one query).
+        self.prepare_rows = getattr(serializer_class, 'prepare_rows', None)
+
+    def values(self, queryset, extra=()):
+        """
+        The queryset as .values() rows holding the serializer's lookups, plus `pk` and any
+        `extra` columns the caller needs (e.g. the pagination ordering field).
+        """
+        return queryset.values(*dict.fromkeys(['pk', *extra, *self.lookups]))
+
+    def render(self, rows):
+        """
+        Maps .values() rows to the list of dicts the serializer would return.
+        """
+        rows = list(rows)
+        for setup in self.setups:
+            setup()
+        if self.prepare_rows is not None:
+            self.prepare_rows(rows)
+        mapper = self.mapper
+        return [mapper(row) for row in rows]
+
+
+_readers = {}
+
+
+def reader_for_serializer(serializer_class):
+    """
+    Returns the (cached) RowReader for a serializer class, or None when the fast path is
+    disabled or the serializer can't be compiled.
+    """
+    if not settings.FAST_READ_SERIALIZERS:
+        return None
+    if serializer_class not in _readers:
+        try:
+            _readers[serializer_class] = RowReader(serializer_class)
+        except NotCompilable:
+            _readers[serializer_class] = None
+    return _readers[serializer_class]
+
+
+class FastListMixin:
+    """
+    ViewSet mixin that serves list() (and any action calling list_response()) from the
+    serializer's RowReader when it has one, and through the serializer otherwise.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.filter_queryset(self.get_queryset()))
+
+    def list_response(self, queryset):
+        reader = reader_for_serializer(self.get_serializer_class())
+        if reader is None:
+            page = self.paginate_queryset(queryset)
+            if page is None:
+                return Response(self.get_serializer(queryset, many=True).data)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        extra = [self.paginator.ordering_field] if getattr(self.paginator, 'ordering_field', None) else []
+        rows = reader.values(queryset, extra=extra)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(reader.render(rows))
+        return self.get_paginated_response(reader.render(page))
@@ -0,0 +1,104 @@
+"""
+Geocoding listings from a local gazetteer file, for the `geocode_listings` command.
+
+Listings only have a free-text `location`. The gazetteer maps place names to
+coordinates, and each listing gets the coordinates of the place its location names.
+Two file formats are read:
+
+- a GeoNames dump (tab-separated, e.g. cities15000.txt or a country file from
+  https://download.geonames.org/export/dump/), matched on the name, the ASCII name and
+  every alternate name, with the most populous place winning a shared name
+- a CSV file with a header row holding `name`, `latitude` and `longitude` columns (and
+  optionally `population`), where the first row wins a shared name
+
+Names are compared the way full-text search compares words (case, accents and
+punctuation ignored). A location that doesn't match as a whole is retried with the
+part before its first comma, so "Nairobi, Kenya" finds Nairobi.
+
+The distinct locations are read first, so only the gazetteer entries they need are
+kept while the file streams past; a full GeoNames dump never has to fit in memory.
+Each matched location is then one UPDATE over the location index.
+"""
+import csv
+
+from .geo import encode
+from .models import Listing
+from .textsearch import tokenize
+
+# Columns of the GeoNames dump format
+GEONAMES_NAME, GEONAMES_ASCIINAME, GEONAMES_ALTERNATE_NAMES = 1, 2, 3
+GEONAMES_LATITUDE, GEONAMES_LONGITUDE, GEONAMES_POPULATION = 4, 5, 14
+
+
+def place_key(name):
+    """
+    The normalized form of a place name that gazetteer entries and locations are matched on.
+    """
+    return ' '.join(tokenize(name))
+
+
+def location_keys(location):
+    """
+    The keys a listing location is looked up under, most specific first.
+    """
+    keys = [place_key(location)]
+    if ',' in location:
+        keys.append(place_key(location.split(',', 1)[0]))
+    return [key for key in dict.fromkeys(keys) if key]
+
+
+def _geonames_entries(lines):
+    for line in lines:
+        columns = line.rstrip('\n').split('\t')
+        if len(columns) <= GEONAMES_POPULATION:
+            continue
+        names = [columns[GEONAMES_NAME], columns[GEONAMES_ASCIINAME]]
+        names += columns[GEONAMES_ALTERNATE_NAMES].split(',')
+        population = int(columns[GEONAMES_POPULATION] or 0)
+        yield names, float(columns[GEONAMES_LATITUDE]), float(columns[GEONAMES_LONGITUDE]), population
+
+
+def _csv_entries(lines):
+    for row in csv.DictReader(lines):
+        yield [row['name']], float(row['latitude']), float(row['longitude']), int(row.get('population') or 0)
+
+
+def read_gazetteer(path, wanted):
+    """
+    Returns {key: (latitude, longitude)} for the place keys in `wanted` that the file names.
+    """
+    found = {}  # key -> (population, latitude, longitude)
+    with open(path, encoding='utf-8', newline='') as lines:
+        first_line = lines.readline()
+        lines.seek(0)
+        entries = _geonames_entries(lines) if '\t' in first_line else _csv_entries(lines)
+        for names, latitude, longitude, population in entries:
+            for key in {place_key(name) for name in names}.intersection(wanted):
+                if key not in found or population > found[key][0]:
+                    found[key] = (population, latitude, longitude)
+    return {key: (latitude, longitude) for key, (_, latitude, longitude) in found.items()}
+
+
+def geocode_listings(path, overwrite=False):
+    """
+    Sets the coordinates of listings whose location the gazetteer at `path` names.
+    Listings that already have coordinates are skipped unless overwrite is True.
+    Returns (listings updated, the locations that matched nothing).
+    """
+    listings = Listing.objects.all() if overwrite else Listing.objects.filter(latitude__isnull=True)
+    locations = list(listings.order_by().values_list('location', flat=True).distinct())
+    keys = {location: location_keys(location) for location in locations}
+    places = read_gazetteer(path, {key for candidates in keys.values() for key in candidates})
+
+    updated, unmatched = 0, []
+    for location in locations:
+        place = next((places[key] for key in keys[location] if key in places), None)
+        if place is None:
+            unmatched.append(location)
+            continue
+        latitude, longitude = place
+        # .update() skips Listing.save(), so the geohash is written alongside.
+        updated += listings.filter(location=location).update(
+            latitude=latitude, longitude=longitude, geohash=encode(latitude, longitude),
+        )
+    return updated, unmatched
@@ -0,0 +1,226 @@
+"""
+Radius search over listing coordinates, without PostGIS.
+
+A listing's latitude and longitude are stored as plain floats, plus a geohash of them
+(GEOHASH_PRECISION characters, about 5 m) kept up to date by Listing.save(). A geohash
+names a grid cell. Its first p characters name the enclosing cell at precision p, so
+every listing inside that cell sorts into one contiguous range of the geohash index.
+
+within_radius() narrows a queryset to the listings within `radius_km` of a point in
+three steps:
+
+1. Cells: the bounding box of the circle is covered with geohash cells at the finest
+   precision that needs at most GEO_MAX_CELLS of them. Cells next to each other in
+   geohash order are merged, and each run becomes one range scan on the geohash index.
+2. Bounding box: the cells overshoot the circle, so plain comparisons on latitude and
+   longitude drop the rows outside its bounding box.
+3. Haversine: the exact great-circle test, on the few rows left.
+
+Boxes that cross the antimeridian are split in two, and circles that reach a pole
+cover every longitude. NearFilterMixin adds `?near=lat,lng&radius=km` to a viewset's list.
+"""
+import math
+
+from django.conf import settings
+from django.db.models import F, Q, Value
+from django.db.models.functions import Cos, Power, Radians, Sin
+from rest_framework import status
+from rest_framework.response import Response
+
+EARTH_RADIUS_KM = 6371.0088  # Mean radius
+
+GEOHASH_PRECISION = 9  # Characters stored per listing
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+# --- Geohash cells ---
+# A cell at precision p is an integer of 5p bits: longitude and latitude bits
+# interleaved, longitude first. Longitude gets the extra bit when 5p is odd.
+
+def _axis_bits(precision):
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def _axis_index(value, low, high, bits):
+    """
+    The cell index along one axis: which of the 2**bits equal slices of [low, high] holds value.
+    """
+    index = int((value - low) / (high - low) * (1 << bits))
+    return min(max(index, 0), (1 << bits) - 1)
+
+
+def _interleave(x, y, precision):
+    x_bits, y_bits = _axis_bits(precision)
+    code = 0
+    for position in range(5 * precision):
+        if position % 2 == 0:
+            x_bits -= 1
+            code = (code << 1) | ((x >> x_bits) & 1)
+        else:
+            y_bits -= 1
+            code = (code << 1) | ((y >> y_bits) & 1)
+    return code
+
+
+def _to_base32(code, precision):
+    return ''.join(_BASE32[(code >> 5 * shift) & 31] for shift in range(precision - 1, -1, -1))
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    The geohash of a point, or '' when the point has no coordinates.
+    """
+    if latitude is None or longitude is None:
+        return ''
+    x_bits, y_bits = _axis_bits(precision)
+    x = _axis_index(longitude, -180.0, 180.0, x_bits)
+    y = _axis_index(latitude, -90.0, 90.0, y_bits)
+    return _to_base32(_interleave(x, y, precision), precision)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    The box around a circle on the sphere: (min_lat, max_lat, [(min_lng, max_lng), ...]),
+    with one longitude interval, or two when the box crosses the antimeridian.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angle)
+    max_lat = latitude + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle contains a pole, so it spans every longitude.
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    # The meridians tangent to the circle, which are wider apart than at its centre latitude.
+    spread = math.sin(angle) / math.cos(math.radians(latitude))
+    if spread >= 1:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+    delta = math.degrees(math.asin(spread))
+    min_lng, max_lng = longitude - delta, longitude + delta
+    if min_lng < -180:
+        return min_lat, max_lat, [(min_lng + 360, 180.0), (-180.0, max_lng)]
+    if max_lng > 180:
+        return min_lat, max_lat, [(min_lng, 180.0), (-180.0, max_lng - 360)]
+    return min_lat, max_lat, [(min_lng, max_lng)]
+
+
+def cell_ranges(box, max_cells=None):
+    """
+    Covers a bounding box with geohash cells and returns them as [(start, stop)] string
+    ranges (stop exclusive, None for no upper bound), or None when even the coarsest
+    cells would take more than max_cells.
+    """
+    max_cells = settings.GEO_MAX_CELLS if max_cells is None else max_cells
+    min_lat, max_lat, longitudes = box
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        x_bits, y_bits = _axis_bits(precision)
+        rows = range(_axis_index(min_lat, -90.0, 90.0, y_bits), _axis_index(max_lat, -90.0, 90.0, y_bits) + 1)
+        columns = [
+            range(_axis_index(low, -180.0, 180.0, x_bits), _axis_index(high, -180.0, 180.0, x_bits) + 1)
+            for low, high in longitudes
+        ]
+        if len(rows) * sum(len(span) for span in columns) <= max_cells:
+            break
+    else:
+        return None
+
+    codes = sorted({_interleave(x, y, precision) for span in columns for x in span for y in rows})
+    runs = []
+    for code in codes:
+        if runs and runs[-1][1] == code:
+            runs[-1][1] = code + 1
+        else:
+            runs.append([code, code + 1])
+    last = 1 << (5 * precision)
+    return [
+        (_to_base32(start, precision), _to_base32(stop, precision) if stop < last else None)
+        for start, stop in runs
+    ]
+
+
+# --- Querying ---
+
+def parse_near(params):
+    """
+    Reads `near=lat,lng` and `radius=` (km) from query parameters. Returns None when
+    `near` is absent and (latitude, longitude, radius_km) otherwise. Raises ValueError
+    with a client-facing message for bad values.
+    """
+    raw_near = params.get('near')
+    if raw_near is None:
+        return None
+    try:
+        latitude, longitude = (float(part) for part in raw_near.split(','))
+    except ValueError:
+        raise ValueError("'near' must be 'latitude,longitude' in decimal degrees")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("'near' is outside latitude -90..90 / longitude -180..180")
+    try:
+        radius_km = float(params.get('radius', settings.GEO_DEFAULT_RADIUS_KM))
+    except ValueError:
+        raise ValueError("'radius' must be a number of kilometres")
+    if not 0 < radius_km <= settings.GEO_MAX_RADIUS_KM:
+        raise ValueError(f"'radius' must be greater than 0 and at most {settings.GEO_MAX_RADIUS_KM:g} km")
+    return latitude, longitude, radius_km
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance between two points in kilometres.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """
+    Filters a Listing queryset to the listings within radius_km of a point.
+    """
+    box = bounding_box(latitude, longitude, radius_km)
+    ranges = cell_ranges(box)
+    if ranges is not None:
+        cells = Q()
+        for start, stop in ranges:
+            cells |= Q(geohash__gte=start, geohash__lt=stop) if stop else Q(geohash__gte=start)
+        queryset = queryset.filter(cells)
+
+    min_lat, max_lat, longitudes = box
+    in_longitudes = Q()
+    for low, high in longitudes:
+        in_longitudes |= Q(longitude__gte=low, longitude__lte=high)
+    queryset = queryset.filter(in_longitudes, latitude__gte=min_lat, latitude__lte=max_lat)
+
+    # distance <= r  <=>  haversine term a <= sin²(r / 2R), which needs no asin or sqrt.
+    half_lat = Radians(F('latitude') - Value(latitude)) / Value(2.0)
+    half_lng = Radians(F('longitude') - Value(longitude)) / Value(2.0)
+    a = (Power(Sin(half_lat), Value(2))
+         + Value(math.cos(math.radians(latitude))) * Cos(Radians('latitude')) * Power(Sin(half_lng), Value(2)))
+    threshold = math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2) ** 2
+    return queryset.alias(geo_haversine=a).filter(geo_haversine__lte=threshold)
+
+
+class NearFilterMixin:
+    """
+    ViewSet mixin: `?near=lat,lng&radius=km` on list() keeps the listings within the
+    radius, in the list's usual order. Sits after CachedReadMixin, so cached pages are
+    served before the parameters are parsed.
+    """
+    near = None
+
+    def list(self, request, *args, **kwargs):
+        try:
+            self.near = parse_near(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if self.near and request.query_params.get('q'):
+            # Search pages are cut from the text ranking alone, which knows nothing of the radius.
+            return Response({'error': "'near' can't be combined with 'q'"}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.near:
+            queryset = within_radius(queryset, *self.near)
+        return queryset
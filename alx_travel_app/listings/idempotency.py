@@ -0,0 +1,172 @@
+"""
+Idempotency-Key support for the POST endpoints that create bookings and payments.
+
+A client that times out and retries a POST would otherwise create a second booking,
+or a second Payment and a second Chapa checkout. With an `Idempotency-Key` header
+(any unique string up to 255 characters, e.g. a UUID), the first request claims the
+key by inserting an IdempotencyKey row and runs. Its rendered response is then stored
+on the row. A retry with the same key finds the row with one indexed SELECT and gets
+the stored bytes back, with an `Idempotent-Replayed: true` header. No serializer,
+write or gateway call runs again.
+
+- A duplicate that arrives while the first request is still running fails the insert
+  (unique on scope + key) and waits for the stored response, polling with backoff for
+  up to IDEMPOTENCY_WAIT_SECONDS. It gets 409 if the first request is still running by
+  then. A claim older than IDEMPOTENCY_LOCK_TIMEOUT is treated as abandoned (its
+  process died) and taken over by the next retry.
+- Reusing a key with a different payload gets 422 instead of the stored response.
+- Keys are scoped per endpoint and per user. Anonymous clients share one scope, where
+  only an identical payload can replay a response.
+- Responses of 500 and above, and requests that raise (validation errors included),
+  release the key so the retry runs again. Everything else is stored as JSON for
+  IDEMPOTENCY_KEY_TTL seconds; purge_idempotency_keys deletes the expired rows.
+
+Requests without the header are untouched.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .renderers import FastJSONRenderer
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+# Poll interval while a concurrent duplicate runs, doubling up to the maximum
+WAIT_INITIAL_DELAY = 0.05
+WAIT_MAX_DELAY = 0.5
+
+
+def request_fingerprint(request):
+    """
+    sha256 of the request method, path and parsed payload, so the same payload sent as
+    differently formatted JSON still matches.
+    """
+    data = request.data
+    if hasattr(data, 'lists'):  # QueryDict from form parsers
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{payload}'.encode()).hexdigest()
+
+
+def replay(entry):
+    """
+    The stored response of a completed key.
+    """
+    response = HttpResponse(entry.response_body, status=entry.response_status, content_type=entry.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def claim(scope, key, fingerprint):
+    """
+    Claims `key` in `scope` for this request, or waits for the request that holds it.
+    Returns (entry, claimed): claimed is True when the caller should run the request,
+    otherwise entry is the completed, mismatched or still running claim of another.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = WAIT_INITIAL_DELAY
+    while True:
+        now = timezone.now()
+        entry = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if entry is None:
+            try:
+                with transaction.atomic():
+                    entry = IdempotencyKey.objects.create(
+                        scope=scope, key=key, fingerprint=fingerprint,
+                        locked_until=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT),
+                        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+                return entry, True
+            except IntegrityError:
+                continue  # A concurrent duplicate claimed it first
+        if entry.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=entry.pk, expires_at__lte=now).delete()
+            continue
+        if entry.fingerprint != fingerprint or entry.status == 'completed':
+            return entry, False
+        if entry.locked_until <= now:
+            # Abandoned claim: take it over, unless another retry just did.
+            locked_until = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            if IdempotencyKey.objects.filter(
+                pk=entry.pk, status='in_progress', locked_until=entry.locked_until,
+            ).update(locked_until=locked_until):
+                entry.locked_until = locked_until
+                return entry, True
+            continue
+        if time.monotonic() >= deadline:
+            return entry, False
+        time.sleep(delay)
+        delay = min(delay * 2, WAIT_MAX_DELAY)
+
+
+def complete(entry, response):
+    """
+    Stores the response of the request that holds `entry`, rendered as JSON.
+    """
+    entry.response_status = response.status_code
+    entry.response_body = FastJSONRenderer().render(response.data)
+    entry.content_type = 'application/json'
+    entry.status = 'completed'
+    IdempotencyKey.objects.filter(pk=entry.pk).update(
+        status=entry.status, response_status=entry.response_status,
+        response_body=entry.response_body, content_type=entry.content_type,
+    )
+
+
+def release(entry):
+    """
+    Drops the claim of a request whose outcome isn't stored, so a retry runs again.
+    """
+    IdempotencyKey.objects.filter(pk=entry.pk).delete()
+
+
+def idempotent(scope):
+    """
+    Decorator for a DRF view function (or, through method_decorator, a viewset action)
+    that honours the Idempotency-Key header. `scope` names the endpoint; the user's id
+    is appended to it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.META.get(HEADER)
+            if key is None:
+                return view(request, *args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return Response({'error': f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            fingerprint = request_fingerprint(request)
+            entry, claimed = claim(f'{scope}:{request.user.pk or "-"}', key, fingerprint)
+            if not claimed:
+                if entry.fingerprint != fingerprint:
+                    return Response({'error': 'Idempotency-Key was already used with a different request'},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                if entry.status != 'completed':
+                    return Response({'error': 'A request with this Idempotency-Key is still being processed'},
+                                    status=status.HTTP_409_CONFLICT)
+                return replay(entry)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                release(entry)
+                raise
+            if response.status_code >= 500 or not isinstance(response, Response):
+                release(entry)
+            else:
+                complete(entry, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+"""
+Per-request timing breakdown: database, serialization and outbound HTTP.
+
+RequestMetricsMiddleware (listings/middleware.py) starts a RequestTimings for each
+sampled request and stores it in a context variable. Code on the hot path reports into
+it with `timed('serializer')` / `timed('http')`, and database queries are captured with
+an execute wrapper, so no debug cursor is needed. Outside a sampled request every hook
+is a context-variable lookup and nothing else.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_timings', default=None)
+
+# Collapses IN (...) lists so "the same query with different ids" shares a fingerprint.
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+
+def fingerprint(sql):
+    """
+    Normalizes a SQL statement for duplicate detection. Parameters are already
+    placeholders, so only variable-length IN lists need folding.
+    """
+    return _PLACEHOLDER_LIST.sub('(%s, ...)', sql)
+
+
+class RequestTimings:
+    """
+    Accumulated durations (seconds) and query statistics for one request.
+    """
+    def __init__(self):
+        self.durations = {'db': 0.0, 'serializer': 0.0, 'http': 0.0}
+        self.query_count = 0
+        self.statements = Counter()
+        self._depth = {}
+
+    def duplicates(self, threshold):
+        """
+        Returns {fingerprint: count} for statements run at least `threshold` times.
+        """
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+    # Execute wrapper, installed on every connection for the request (see
+    # django.db.backends.base.base.BaseDatabaseWrapper.execute_wrapper).
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - started
+            self.query_count += 1
+            self.statements[fingerprint(sql)] += 1
+
+
+def current_timings():
+    return _current.get()
+
+
+def start_request():
+    """
+    Begins collecting for the current request. Returns (timings, token) for finish_request().
+    """
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(kind):
+    """
+    Adds the time spent in the block to the current request's `kind` duration.
+    Re-entrant: nested blocks of the same kind (e.g. nested serializers) count once.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    depth = timings._depth.get(kind, 0)
+    timings._depth[kind] = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._depth[kind] = depth
+        if depth == 0:
+            timings.durations[kind] += time.perf_counter() - started
+
+
+class TimedRepresentationMixin:
+    """
+    Serializer mixin that reports to_representation() time as serializer time.
+    A ListSerializer calls its child's to_representation per item, so list endpoints are
+    covered by mixing this into the child serializer.
+    """
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return super().to_representation(instance)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from listings.snapshots import backfill_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the denormalized listing/user snapshot on bookings that have none '
+        '(rows created before the column existed, or by bulk loaders such as seed).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of bookings written per bulk update.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Backfilling booking snapshots...")
+        updated = backfill_snapshots(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Filled snapshots on {updated} bookings."))
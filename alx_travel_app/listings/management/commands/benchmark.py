@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from listings.benchmarks import BENCHMARK_NAMES, compare_results, run_benchmarks, seed_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the listings API hot paths (listing list/detail, booking create, payment '
+        'initiate/verify, confirmation email tasks) and writes latency percentiles, throughput '
+        'and query counts as JSON. Runs in a throwaway test database seeded with fixed data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1000, help='Listings to seed.')
+        parser.add_argument('--users', type=int, default=200, help='Users to seed.')
+        parser.add_argument('--bookings-per-listing', type=int, default=10, help='Average bookings per listing.')
+        parser.add_argument('--reviews-per-listing', type=int, default=5, help='Reviews per listing.')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed iterations per benchmark.')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed iterations before timing.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the data set.')
+        parser.add_argument('--only', nargs='+', choices=BENCHMARK_NAMES, help='Run only these benchmarks.')
+        parser.add_argument('--output', '-o', help='Write the JSON results to this file (default: stdout).')
+        parser.add_argument('--compare', help='A previous results file to report changes against.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read {options['compare']}: {exc}")
+
+        # Never touch the configured database: seed and measure in a fresh test database.
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stderr.write("Seeding benchmark data...")
+            data = seed_data(options['listings'], options['users'], options['bookings_per_listing'],
+                             options['reviews_per_listing'], options['seed'])
+            self.stderr.write(f"Seeded {data}. Running benchmarks...")
+            results = run_benchmarks(iterations=options['iterations'], warmup=options['warmup'],
+                                     only=options['only'], data=data, seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        document = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(document + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+        else:
+            self.stdout.write(document)
+
+        for name, stats in results['benchmarks'].items():
+            self.stderr.write(
+                f"  {name:28} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                f"{stats['ops_per_sec']:8.1f} ops/s  {stats['queries_per_op']:5.1f} queries/op"
+            )
+        if baseline:
+            self.stderr.write(f"Compared with {options['compare']} ({baseline['meta'].get('commit')}):")
+            for name, metric, before, after, change in compare_results(baseline, results):
+                change_text = f"{change:+.1f}%" if change is not None else 'n/a'
+                self.stderr.write(f"  {name:28} {metric:15} {before:>10} -> {after:<10} {change_text}")
@@ -0,0 +1,110 @@
+import itertools
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from listings.benchmarks import seed_listings, summarize
+from listings.models import Listing, ListingTerm
+from listings.textsearch import index_rows, index_stats
+from listings.views import ListingViewSet
+
+PROPERTY_TYPES = ['Apartment', 'House', 'Studio', 'Villa', 'Cottage', 'Loft', 'Cabin', 'Penthouse']
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'tu', 'ne', 'so', 'vi', 'da', 'pe', 'zu', 'ha', 'ri', 'mo', 'ba', 'ye']
+
+
+def vocabulary(rng, size):
+    """
+    `size` distinct made-up words. Word choice is Zipf-like (weight 1/rank), so a few
+    words appear in a large share of listings and most are rare, as in real text.
+    """
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    # Cumulative, so rng.choices() doesn't re-add the weights on every call.
+    return words, list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks full-text search (GET /api/listings/?q=) by query shape: a common word, '
+        'a rare word, a prefix and two words. Seeds synthetic listings and their search index '
+        'into the CONFIGURED database unless --skip-seed is given, so point it at a throwaway database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1_000_000, help='Listings to seed.')
+        parser.add_argument('--vocabulary', type=int, default=20_000, help='Distinct words in the seeded text.')
+        parser.add_argument('--queries', type=int, default=50, help='Search requests to time per query shape.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Listings per transaction.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and queries.')
+        parser.add_argument('--skip-seed', action='store_true', help='Benchmark the existing data as-is.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words, weights = vocabulary(rng, options['vocabulary'])
+        if not options['skip_seed']:
+            self.seed(rng, words, weights, options['listings'], options['batch_size'])
+
+        started = time.perf_counter()
+        documents, avg_length = index_stats()
+        self.stdout.write(
+            f"{documents} listings, {ListingTerm.objects.count()} index rows, "
+            f"average weighted length {avg_length:.1f} (stats computed in {time.perf_counter() - started:.2f} s)"
+        )
+
+        common, rare = words[:50], words[len(words) // 2:]
+        shapes = {
+            'common word': lambda: rng.choice(common),
+            'rare word': lambda: rng.choice(rare),
+            'prefix': lambda: rng.choice(words)[:4],
+            'two words': lambda: f'{rng.choice(common)} {rng.choice(words[:2000])}',
+        }
+        view = ListingViewSet.as_view({'get': 'list'})
+        factory = RequestFactory(HTTP_HOST='localhost', HTTP_ACCEPT='application/json')
+        for number, (shape, make_query) in enumerate(shapes.items()):
+            timings, hits = [], []
+            for i in range(options['queries']):
+                # A distinct URL per request, so the listing response cache never answers.
+                request = factory.get('/api/listings/', {'q': make_query(), 'run': f'{number}-{i}'})
+                began = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append(time.perf_counter() - began)
+                hits.append(len(response.data['results']))
+
+            stats = summarize(timings)
+            self.stdout.write(self.style.SUCCESS(
+                f"  {shape:12} mean {stats['mean_ms']:8.2f} ms  p50 {stats['p50_ms']:8.2f} ms  "
+                f"p95 {stats['p95_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms  ({statistics.mean(hits):.1f} results/page)"
+            ))
+
+    def seed(self, rng, words, weights, num_listings, batch_size):
+        """
+        Bulk-loads listings with their index rows; bulk_create skips the indexing signal.
+        """
+        self.stdout.write(f"Seeding {num_listings} listings...")
+        locations = [word.title() for word in words[:200]]
+
+        def build(host, index):
+            name_words = rng.choices(words, cum_weights=weights, k=2)
+            text_words = rng.choices(words, cum_weights=weights, k=12)
+            return Listing(
+                host=host,
+                name=f"{' '.join(name_words).title()} {rng.choice(PROPERTY_TYPES)}",
+                description=' '.join(text_words).capitalize() + '.',
+                location=rng.choice(locations),
+                pricepernight=Decimal(rng.randrange(5000, 50000)) / 100,
+            )
+
+        def index_batch(listings):
+            ListingTerm.objects.bulk_create(
+                [row for listing in listings for row in index_rows(listing)], batch_size=batch_size,
+            )
+
+        seed_listings(num_listings, build, batch_size, with_batch=index_batch, stdout=self.stdout)
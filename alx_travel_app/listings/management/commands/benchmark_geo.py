@@ -0,0 +1,105 @@
+import math
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from listings.benchmarks import seed_listings, summarize
+from listings.geo import encode
+from listings.models import Listing
+from listings.views import ListingViewSet
+
+RADII_KM = [1, 10, 50]
+
+
+def cities(rng, count):
+    """
+    `count` random city centres between latitudes -60 and 70, each with a weight: a few
+    large cities and many small ones.
+    """
+    return [
+        (rng.uniform(-60, 70), rng.uniform(-180, 180), 1 / rank)
+        for rank in range(1, count + 1)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks radius search (GET /api/listings/?near=lat,lng&radius=) at several radii, '
+        'with the geohash cell prefilter and with the bounding box alone (GEO_MAX_CELLS=0). '
+        'Seeds synthetic listings clustered around random cities into the CONFIGURED database '
+        'unless --skip-seed is given, so point it at a throwaway database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=500_000, help='Listings to seed.')
+        parser.add_argument('--cities', type=int, default=200, help='City centres the listings cluster around.')
+        parser.add_argument('--queries', type=int, default=50, help='Search requests to time per radius and mode.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Listings per transaction.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and queries.')
+        parser.add_argument('--skip-seed', action='store_true', help='Benchmark the existing data as-is.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        centres = cities(rng, options['cities'])
+        if not options['skip_seed']:
+            self.seed(rng, centres, options['listings'], options['batch_size'])
+        self.stdout.write(f"{Listing.objects.filter(latitude__isnull=False).count()} listings with coordinates")
+
+        view = ListingViewSet.as_view({'get': 'list'})
+        factory = RequestFactory(HTTP_HOST='localhost', HTTP_ACCEPT='application/json')
+        modes = [('geohash cells', {}), ('bounding box', {'GEO_MAX_CELLS': 0})]
+        for radius in RADII_KM:
+            for mode, overrides in modes:
+                # The same points for both modes, a few km off a city centre.
+                points = random.Random(f"{options['seed']}:{radius}")
+                timings, hits = [], []
+                with override_settings(**overrides):
+                    for i in range(options['queries']):
+                        latitude, longitude, _ = points.choice(centres[:50])
+                        near = f'{latitude + points.gauss(0, 0.05):.5f},{longitude + points.gauss(0, 0.05):.5f}'
+                        # A distinct URL per request, so the listing response cache never answers.
+                        request = factory.get('/api/listings/', {
+                            'near': near, 'radius': radius, 'run': f'{mode}-{radius}-{i}',
+                        })
+                        began = time.perf_counter()
+                        response = view(request)
+                        response.render()
+                        timings.append(time.perf_counter() - began)
+                        hits.append(len(response.data['results']))
+
+                stats = summarize(timings)
+                self.stdout.write(self.style.SUCCESS(
+                    f"  {radius:>3} km {mode:14} mean {stats['mean_ms']:8.2f} ms  p50 {stats['p50_ms']:8.2f} ms  "
+                    f"p95 {stats['p95_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms  ({statistics.mean(hits):.1f} results/page)"
+                ))
+
+    def seed(self, rng, centres, num_listings, batch_size):
+        """
+        Bulk-loads listings scattered around the city centres (about 10 km spread), with
+        the geohash filled in since bulk_create skips Listing.save().
+        """
+        self.stdout.write(f"Seeding {num_listings} listings...")
+        weights = [weight for _, _, weight in centres]
+
+        def build(host, index):
+            centre_lat, centre_lng, _ = rng.choices(centres, weights)[0]
+            latitude = max(-90.0, min(90.0, centre_lat + rng.gauss(0, 0.1)))
+            spread = 0.1 / max(0.1, math.cos(math.radians(latitude)))
+            longitude = (centre_lng + rng.gauss(0, spread) + 180) % 360 - 180
+            return Listing(
+                host=host,
+                name=f'Geo bench {index}',
+                description='Seeded by benchmark_geo.',
+                location='Benchmark',
+                pricepernight=Decimal(rng.randrange(5000, 50000)) / 100,
+                latitude=latitude,
+                longitude=longitude,
+                geohash=encode(latitude, longitude),
+            )
+
+        seed_listings(num_listings, build, batch_size, stdout=self.stdout)
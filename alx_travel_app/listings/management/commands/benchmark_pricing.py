@@ -0,0 +1,110 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from listings.models import Listing, PricingRule
+from listings.pricing import PriceCalendar, calendars_for
+from listings.views import ListingViewSet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks stay quotes per second: evaluating the pricing rules night by night, '
+        'slicing the precomputed price calendars (listings/pricing.py), and the '
+        'GET /api/listings/{id}/quote/ endpoint. Runs in a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=200, help='Listings to seed, each with 6 rules.')
+        parser.add_argument('--quotes', type=int, default=20000, help='Quotes per engine path.')
+        parser.add_argument('--requests', type=int, default=2000, help='Quote requests to the endpoint.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and stays.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            cache.clear()
+            rng = random.Random(options['seed'])
+            listing_ids = self.seed(rng, options['listings'])
+            today = timezone.localdate()
+            stays = []
+            for _ in range(options['quotes']):
+                start = today + timedelta(days=rng.randrange(0, 365))
+                stays.append((rng.choice(listing_ids), start, start + timedelta(days=rng.choice([1, 2, 3, 7, 14, 28]))))
+            self.run(listing_ids, stays, options['requests'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def seed(self, rng, count):
+        host = User.objects.create_user(username='pricebench', email='pricebench@example.com')
+        listings = Listing.objects.bulk_create([
+            Listing(host=host, name=f'Price bench {i}', description='d', location='Bench',
+                    pricepernight=Decimal(rng.randrange(5000, 50000)) / 100)
+            for i in range(count)
+        ])
+        today = timezone.localdate()
+        rules = []
+        for listing in listings:
+            season = today + timedelta(days=rng.randrange(0, 300))
+            rules += [
+                PricingRule(listing=listing, name='Weekends', weekdays='45', multiplier=Decimal('1.2')),
+                PricingRule(listing=listing, name='High season', start_date=season,
+                            end_date=season + timedelta(days=60), multiplier=Decimal('1.5')),
+                PricingRule(listing=listing, name='Holidays', start_date=season + timedelta(days=20),
+                            end_date=season + timedelta(days=30), multiplier=Decimal('1.3')),
+                PricingRule(listing=listing, name='Low season', start_date=season + timedelta(days=120),
+                            end_date=season + timedelta(days=200), multiplier=Decimal('0.8')),
+                PricingRule(listing=listing, kind='length_of_stay', min_nights=7, discount_percent=Decimal('10')),
+                PricingRule(listing=listing, kind='length_of_stay', min_nights=28, discount_percent=Decimal('25')),
+            ]
+        PricingRule.objects.bulk_create(rules)
+        return [listing.pk for listing in listings]
+
+    def run(self, listing_ids, stays, requests):
+        started = time.perf_counter()
+        calendars = calendars_for(listing_ids)
+        build_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"Built {len(calendars)} price calendars in {build_seconds * 1000:.0f} ms "
+            f"({build_seconds / len(calendars) * 1000:.2f} ms each)"
+        )
+        # The same rules with no precomputed nights: every quote evaluates them night by night.
+        loops = {
+            pk: PriceCalendar(calendar.price_cents, calendar.nightly_rules, calendar.discounts, calendar.first_night)
+            for pk, calendar in calendars.items()
+        }
+        for pk, start, end in stays[:1000]:
+            if loops[pk].quote(start, end) != calendars[pk].quote(start, end):
+                raise CommandError(f"The calendar and the rule loop disagree on {pk} {start}..{end}")
+
+        rates = {}
+        for path, source in (('rule loop', lambda pk: loops[pk]), ('calendar', lambda pk: calendars[pk]),
+                             ('calendars_for()', lambda pk: calendars_for([pk])[pk])):
+            began = time.perf_counter()
+            for pk, start, end in stays:
+                source(pk).quote(start, end)
+            rates[path] = len(stays) / (time.perf_counter() - began)
+            self.stdout.write(self.style.SUCCESS(f"  {path:16} {rates[path]:12,.0f} quotes/s"))
+
+        view = ListingViewSet.as_view({'get': 'quote'})
+        factory = RequestFactory(HTTP_HOST='localhost', HTTP_ACCEPT='application/json')
+        began = time.perf_counter()
+        for pk, start, end in stays[:requests]:
+            response = view(factory.get(f'/api/listings/{pk}/quote/', {'from': str(start), 'to': str(end)}), pk=str(pk))
+            response.render()
+        endpoint = min(requests, len(stays)) / (time.perf_counter() - began)
+        self.stdout.write(self.style.SUCCESS(f"  {'endpoint':16} {endpoint:12,.0f} quotes/s"))
+        self.stdout.write(f"  calendar/rule loop: x{rates['calendar'] / rates['rule loop']:.1f}")
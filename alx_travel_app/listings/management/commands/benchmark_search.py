@@ -0,0 +1,113 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from listings.benchmarks import seed_listings, summarize
+from listings.models import Booking, Listing, OccupiedNight
+from listings.views import ListingViewSet
+
+LOCATIONS = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Malindi"]
+BASE_DATE = date(2025, 1, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks GET /api/listings/search/ (location + price band + free dates). '
+        'Seeds synthetic listings/bookings into the CONFIGURED database unless --skip-seed '
+        'is given, so point it at a throwaway database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100_000, help='Listings to seed.')
+        parser.add_argument('--bookings', type=int, default=10_000_000, help='Bookings to seed.')
+        parser.add_argument('--queries', type=int, default=200, help='Search requests to time.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and queries.')
+        parser.add_argument('--skip-seed', action='store_true', help='Benchmark the existing data as-is.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if not options['skip_seed']:
+            self.seed(rng, options['listings'], options['bookings'], options['batch_size'])
+
+        view = ListingViewSet.as_view({'get': 'search'})
+        factory = RequestFactory(HTTP_HOST='localhost')
+        timings = []
+        for _ in range(options['queries']):
+            start = BASE_DATE + timedelta(days=rng.randrange(0, 330))
+            low = rng.randrange(50, 400)
+            request = factory.get('/api/listings/search/', {
+                'location': rng.choice(LOCATIONS),
+                'min_price': low,
+                'max_price': low + 100,
+                'from': start.isoformat(),
+                'to': (start + timedelta(days=rng.randint(1, 7))).isoformat(),
+            })
+            began = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append(time.perf_counter() - began)
+
+        stats = summarize(timings)
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['iterations']} searches over {Listing.objects.count()} listings: "
+            f"mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, "
+            f"p95 {stats['p95_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms"
+        ))
+
+    def seed(self, rng, num_listings, num_bookings, batch_size):
+        """
+        Bulk-loads listings and non-overlapping bookings (with their occupied nights).
+        Bypasses Booking.save(), so nights are written directly alongside each batch.
+        """
+        self.stdout.write(f"Seeding {num_listings} listings and {num_bookings} bookings...")
+        per_listing = max(1, num_bookings // max(1, num_listings))
+        created = 0
+
+        def build(host, index):
+            return Listing(
+                host=host,
+                name=f"Bench Listing {index}",
+                description="Benchmark listing.",
+                location=rng.choice(LOCATIONS),
+                pricepernight=Decimal(rng.randrange(5000, 50000)) / 100,
+            )
+
+        def add_bookings(listings):
+            nonlocal created
+            bookings, nights = [], []
+            for listing in listings:
+                night = BASE_DATE
+                for _ in range(per_listing):
+                    if created >= num_bookings:
+                        break
+                    night += timedelta(days=rng.randint(0, 3))
+                    length = rng.randint(1, 7)
+                    booking = Booking(
+                        listing_id=listing.pk, user=listing.host, start_date=night,
+                        end_date=night + timedelta(days=length), total_price=Decimal('100.00') * length,
+                        status=rng.choice(['pending', 'confirmed', 'confirmed']),
+                    )
+                    bookings.append(booking)
+                    nights.extend(
+                        OccupiedNight(listing_id=listing.pk, booking_id=booking.pk, night=night + timedelta(days=d))
+                        for d in range(length)
+                    )
+                    night += timedelta(days=length)
+                    created += 1
+                if len(bookings) >= batch_size:
+                    self.flush(bookings, nights, batch_size)
+            self.flush(bookings, nights, batch_size)
+
+        seed_listings(num_listings, build, batch_size, with_batch=add_bookings)
+        self.stdout.write(f"Seeded {created} bookings.")
+
+    def flush(self, bookings, nights, batch_size):
+        Booking.objects.bulk_create(bookings, batch_size=batch_size)
+        OccupiedNight.objects.bulk_create(nights, batch_size=batch_size)
+        bookings.clear()
+        nights.clear()
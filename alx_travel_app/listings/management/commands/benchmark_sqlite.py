@@ -0,0 +1,160 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from listings.availability import booked_nights
+from listings.models import Booking, Listing, Payment
+from listings.payments import apply_verification
+
+User = get_user_model()
+
+# SQLite's own defaults: rollback journal, deferred transactions, Python's 5 s busy timeout.
+DEFAULT_OPTIONS = {'timeout': 5}
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrency benchmark for the SQLite settings: writer threads book stays and settle '
+        'their payments while reader threads page through listings and check availability. '
+        "Runs once with SQLite's defaults and once with SQLITE_PRAGMAS and BEGIN IMMEDIATE "
+        'writes (listings/sqlite.py), and reports reads and writes per second and lock errors. '
+        'Runs against a throwaway database file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads.')
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads.')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per run.')
+        parser.add_argument('--listings', type=int, default=40, help='Listings to seed.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('DATABASE_URL does not point at SQLite.')
+        setup_test_environment()
+        db_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        saved_test_name = test_settings.get('NAME')
+        saved_options = dict(connection.settings_dict.get('OPTIONS', {}))
+        # A file, not the shared in-memory database, so every thread gets its own connection.
+        test_settings['NAME'] = db_file
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(options['listings'])
+            runs = [
+                ('defaults', DEFAULT_OPTIONS, 'DELETE', False),
+                ('tuned', saved_options, settings.SQLITE_PRAGMAS['journal_mode'], True),
+            ]
+            results = {}
+            for index, (name, sqlite_options, journal_mode, immediate) in enumerate(runs):
+                connections.close_all()
+                connection.settings_dict['OPTIONS'] = sqlite_options
+                # The journal mode is a property of the file; it can only change with no other
+                # connections open, so it is set here before the threads connect.
+                with connection.cursor() as cursor:
+                    cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+                with override_settings(SQLITE_IMMEDIATE_WRITES=immediate):
+                    # Each run books its own decade, so it never overlaps the last one's bookings.
+                    results[name] = self.run(options, date(2030 + 10 * index, 1, 1))
+        finally:
+            connections.close_all()
+            connection.settings_dict['OPTIONS'] = saved_options
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if saved_test_name is None:
+                test_settings.pop('NAME', None)
+            else:
+                test_settings['NAME'] = saved_test_name
+            teardown_test_environment()
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(db_file + suffix):
+                    os.remove(db_file + suffix)
+
+        self.stdout.write(
+            f"{options['writers']} writers, {options['readers']} readers, {options['duration']:g} s per run:"
+        )
+        for name, counts in results.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"  {name:8} reads {counts['reads'] / options['duration']:8.1f}/s  "
+                f"writes {counts['writes'] / options['duration']:7.1f}/s  "
+                f"lock errors: {counts['read_errors']} reads, {counts['write_errors']} writes"
+            ))
+        before, after = results['defaults'], results['tuned']
+        if before['writes'] and before['reads']:
+            self.stdout.write(
+                f"  tuned/defaults: reads x{after['reads'] / before['reads']:.1f}, "
+                f"writes x{after['writes'] / before['writes']:.1f}"
+            )
+
+    def seed(self, listing_count):
+        self.guest = User.objects.create_user(username='sqlitebench', email='sqlitebench@example.com')
+        Listing.objects.bulk_create([
+            Listing(host=self.guest, name=f'Bench {i}', description='d', location='Nairobi', pricepernight=10)
+            for i in range(listing_count)
+        ])
+        self.listings = list(Listing.objects.order_by('pk'))
+
+    def run(self, options, first_night):
+        """
+        Runs the reader and writer threads for `duration` seconds and returns the counts
+        of completed operations and lock errors.
+        """
+        counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+        writers = options['writers']
+
+        def count(key):
+            with lock:
+                counts[key] += 1
+
+        def writer(index):
+            # Each writer books its own listings night by night, so its bookings never overlap.
+            own = self.listings[index::writers] or self.listings
+            night = 0
+            while not stop.is_set():
+                listing = own[night % len(own)]
+                start = first_night + timedelta(days=night // len(own))
+                night += 1
+                try:
+                    booking = Booking.objects.create(
+                        listing=listing, user=self.guest, start_date=start,
+                        end_date=start + timedelta(days=1), total_price=10,
+                    )
+                    payment = Payment.objects.create(booking=booking, amount=10)
+                    apply_verification(payment.pk, {'data': {'status': 'failed'}})
+                    count('writes')
+                except OperationalError:
+                    count('write_errors')
+
+        def reader(index):
+            listing = self.listings[index % len(self.listings)]
+            while not stop.is_set():
+                try:
+                    list(Listing.objects.order_by('-created_at').values('listing_id', 'name', 'pricepernight')[:20])
+                    booked_nights(listing.pk, first_night, first_night + timedelta(days=30))
+                    count('reads')
+                except OperationalError:
+                    count('read_errors')
+
+        def thread_main(target, index):
+            try:
+                target(index)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=thread_main, args=(writer, i)) for i in range(writers)]
+        threads += [threading.Thread(target=thread_main, args=(reader, i)) for i in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return counts
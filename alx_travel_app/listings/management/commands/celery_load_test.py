@@ -0,0 +1,238 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from contextlib import ExitStack, contextmanager
+
+from celery.contrib.testing.worker import TestWorkController
+from celery.signals import task_postrun
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from kombu.transport import memory
+
+from alx_travel_app.celery import app
+from listings.benchmarks import summarize
+from listings.fake_chapa import FakeChapaServer
+from listings.models import Booking, EmailOutbox, Listing, OccupiedNight, Payment
+from listings.tasks import flush_confirmation_emails, verify_payment_task
+
+User = get_user_model()
+
+
+class SlowEmailBackend(BaseEmailBackend):
+    """
+    Stands in for a slow SMTP server: every message takes `latency` seconds to send.
+    """
+    latency = 0.02
+
+    def send_messages(self, messages):
+        for _ in messages:
+            time.sleep(self.latency)
+        return len(messages)
+
+
+class LoadTestTransport(memory.Transport):
+    """
+    The in-memory transport, with drain_events() waits capped at 50 ms.
+
+    Non-AMQP transports run Celery's blocking worker loop, which waits up to 2 s for a
+    message before running deferred work such as late acks. With prefetch 1 that parks
+    a free worker slot for up to 2 s, which an AMQP broker's event loop would not do.
+    """
+    max_wait = 0.05
+
+    def drain_events(self, connection, timeout=None):
+        return super().drain_events(connection, timeout=min(timeout or self.max_wait, self.max_wait))
+
+
+@contextmanager
+def running_worker(name, queues, concurrency, prefetch_multiplier):
+    """
+    Runs a thread-pool Celery worker for the given queues in this process.
+    """
+    worker = TestWorkController(
+        app=app, hostname=f'{name}@loadtest', queues=queues, pool='threads', concurrency=concurrency,
+        prefetch_multiplier=prefetch_multiplier, loglevel='ERROR', ready_callback=None,
+        without_heartbeat=True, without_mingle=True, without_gossip=True,
+    )
+    thread = threading.Thread(target=worker.start, daemon=True)
+    thread.start()
+    worker.ensure_started()
+    try:
+        yield worker
+    finally:
+        worker.stop(in_sighandler=False)
+        thread.join(10)
+
+
+def use_routes(routes):
+    """
+    Swaps the app's task routes; the router is cached, so rebuild it too.
+    """
+    app.conf['CELERY_TASK_ROUTES'] = routes
+    app.amqp.flush_routes()
+    app.amqp.__dict__.pop('router', None)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test for the Celery topology: floods the email queue with slow confirmation '
+        'flushes, then measures how long payment verifications take to complete. Runs once '
+        'with every task on one shared queue (the old setup) and once with the dedicated '
+        'queues and CELERY_WORKER_TOPOLOGY. Workers run in-process on an in-memory broker '
+        'against a throwaway database and the fake Chapa gateway.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flushes', type=int, default=40, help='Email flush tasks in the flood.')
+        parser.add_argument('--batch-size', type=int, default=25, help='Emails sent per flush.')
+        parser.add_argument('--smtp-latency', type=float, default=0.02, help='Seconds per email sent.')
+        parser.add_argument('--payments', type=int, default=50, help='Payment verifications to time.')
+        parser.add_argument('--gateway-latency', type=float, default=0.01, help='Fake Chapa latency, seconds.')
+        parser.add_argument('--timeout', type=float, default=120, help='Seconds to wait for each run.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        db_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        test_settings = settings.DATABASES['default'].setdefault('TEST', {})
+        saved_test_name = test_settings.get('NAME')
+        saved_options = dict(connection.settings_dict.get('OPTIONS', {}))
+        if connection.vendor == 'sqlite':
+            # A file, not the shared in-memory database, so worker threads get real connections.
+            # IMMEDIATE transactions queue concurrent writers on the busy timeout instead of
+            # failing the read-to-write lock upgrade.
+            test_settings['NAME'] = db_file
+            connection.settings_dict['OPTIONS'] = {**saved_options, 'transaction_mode': 'IMMEDIATE', 'timeout': 30}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        saved_rate_limit = flush_confirmation_emails.rate_limit
+        # The memory transport polls; the default 1s interval would swamp the measurement.
+        broker_conf = {
+            'CELERY_BROKER_URL': 'memory://',
+            'CELERY_BROKER_TRANSPORT': f'{__name__}:LoadTestTransport',
+            'CELERY_BROKER_TRANSPORT_OPTIONS': {'polling_interval': 0.005},
+            'CELERY_TASK_IGNORE_RESULT': True,
+        }
+        saved_conf = {key: app.conf.get(key) for key in broker_conf}
+        saved_routes = settings.CELERY_TASK_ROUTES
+        try:
+            app.conf.update(broker_conf)
+            # The flush rate limit would throttle the flood itself; this test is about isolation.
+            flush_confirmation_emails.rate_limit = None
+            SlowEmailBackend.latency = options['smtp_latency']
+
+            with ExitStack() as stack:
+                server = stack.enter_context(FakeChapaServer(latency=options['gateway_latency']))
+                stack.enter_context(override_settings(
+                    CHAPA_BASE_URL=server.base_url,
+                    CHAPA_SECRET_KEY=settings.CHAPA_SECRET_KEY or 'load-test-secret',
+                    EMAIL_BACKEND='listings.management.commands.celery_load_test.SlowEmailBackend',
+                    CONFIRMATION_EMAIL_BATCH_SIZE=options['batch_size'],
+                ))
+                payment_ids = self.seed(server, options)
+
+                total = sum(spec['concurrency'] for spec in settings.CELERY_WORKER_TOPOLOGY.values())
+                shared = {'shared': {'queues': ['default'], 'concurrency': total, 'prefetch_multiplier': 4}}
+                results = {
+                    'shared queue': self.run(shared, {}, payment_ids, options),
+                    'dedicated queues': self.run(settings.CELERY_WORKER_TOPOLOGY, saved_routes, payment_ids, options),
+                }
+        finally:
+            use_routes(saved_routes)
+            app.conf.update(saved_conf)
+            flush_confirmation_emails.rate_limit = saved_rate_limit
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if saved_test_name is None:
+                test_settings.pop('NAME', None)
+            else:
+                test_settings['NAME'] = saved_test_name
+            connection.settings_dict['OPTIONS'] = saved_options
+            teardown_test_environment()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_file + suffix):
+                    os.remove(db_file + suffix)
+
+        self.stdout.write(
+            f"{options['payments']} payment verifications behind {options['flushes']} email flushes "
+            f"({options['batch_size']} emails x {options['smtp_latency'] * 1000:.0f} ms each):"
+        )
+        for name, latencies in results.items():
+            stats = summarize(latencies)
+            self.stdout.write(self.style.SUCCESS(
+                f"  {name:17} payment latency p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+                f"max {stats['max_ms']:8.1f} ms  (mean {stats['mean_ms']:.1f} ms)"
+            ))
+
+    def seed(self, server, options):
+        """
+        Creates the bookings the flood emails about and the pending payments to verify,
+        and registers the payments with the fake gateway so verification succeeds.
+        """
+        user = User.objects.create_user(username='loadtest', email='loadtest@example.com')
+        listing = Listing.objects.create(host=user, name='Load Test', description='d', location='Nairobi',
+                                         pricepernight=10)
+        first_night = date(2030, 1, 1)
+        # Consecutive nights, so confirming every payment's booking never overlaps.
+        bookings = Booking.objects.bulk_create([
+            Booking(listing=listing, user=user, start_date=first_night + timedelta(days=i),
+                    end_date=first_night + timedelta(days=i + 1), total_price=10, status='canceled')
+            for i in range(max(options['payments'], options['batch_size']))
+        ])
+        payments = Payment.objects.bulk_create([
+            Payment(booking=booking, amount=10) for booking in bookings[:options['payments']]
+        ])
+        for payment in payments:
+            server.state.transactions[str(payment.pk)] = {'amount': '10', 'currency': 'ETB'}
+        self.booking_ids = [booking.pk for booking in bookings]
+        return [str(payment.pk) for payment in payments]
+
+    def reset(self, options):
+        Payment.objects.update(status='pending')
+        Booking.objects.update(status='canceled')
+        OccupiedNight.objects.all().delete()
+        EmailOutbox.objects.all().delete()
+        EmailOutbox.objects.bulk_create([
+            EmailOutbox(kind='booking_confirmation', object_id=self.booking_ids[i % len(self.booking_ids)])
+            for i in range(options['flushes'] * options['batch_size'])
+        ])
+
+    def run(self, topology, routes, payment_ids, options):
+        """
+        Starts the workers, enqueues the email flood and then the payments, and returns
+        each payment's latency from enqueue to completion (seconds).
+        """
+        self.reset(options)
+        use_routes(routes)
+        enqueued, finished = {}, {}
+        done = threading.Event()
+
+        def on_postrun(sender=None, task_id=None, **kwargs):
+            if task_id in enqueued:
+                finished[task_id] = time.perf_counter()
+                if len(finished) == len(payment_ids):
+                    done.set()
+
+        task_postrun.connect(on_postrun, weak=False)
+        try:
+            with ExitStack() as stack:
+                for name, spec in topology.items():
+                    stack.enter_context(running_worker(
+                        name, spec['queues'], spec['concurrency'], spec['prefetch_multiplier']))
+                for _ in range(options['flushes']):
+                    flush_confirmation_emails.delay()
+                for payment_id in payment_ids:
+                    task_id = verify_payment_task.delay(payment_id).id
+                    enqueued[task_id] = time.perf_counter()
+                if not done.wait(options['timeout']):
+                    self.stderr.write(self.style.WARNING(
+                        f"Timed out with {len(finished)}/{len(payment_ids)} payments verified."))
+                # Let the flood drain before stopping, so the next run starts clean.
+                while EmailOutbox.objects.exists():
+                    time.sleep(0.05)
+        finally:
+            task_postrun.disconnect(on_postrun)
+        return [finished[task_id] - enqueued[task_id] for task_id in finished]
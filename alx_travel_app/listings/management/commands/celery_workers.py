@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def worker_command(name, spec, app='alx_travel_app'):
+    """
+    The `celery worker` command line for one entry of CELERY_WORKER_TOPOLOGY.
+    """
+    return (
+        f"celery -A {app} worker -n {name}@%h -Q {','.join(spec['queues'])} "
+        f"--concurrency {spec['concurrency']} --prefetch-multiplier {spec['prefetch_multiplier']} "
+        f"--loglevel=info"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints the celery worker command for each worker in CELERY_WORKER_TOPOLOGY '
+        '(one per queue group), e.g. for a Procfile or systemd units.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procfile', action='store_true', help='Print as Procfile entries.')
+        parser.add_argument('workers', nargs='*', help='Only these workers (default: all).')
+
+    def handle(self, *args, **options):
+        topology = settings.CELERY_WORKER_TOPOLOGY
+        unknown = set(options['workers']) - set(topology)
+        if unknown:
+            raise CommandError(f"Unknown worker(s): {', '.join(sorted(unknown))}. Choose from {', '.join(topology)}")
+        for name, spec in topology.items():
+            if options['workers'] and name not in options['workers']:
+                continue
+            command = worker_command(name, spec)
+            self.stdout.write(f"worker-{name}: {command}" if options['procfile'] else command)
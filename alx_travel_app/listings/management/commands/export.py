@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.exports import EXPORT_FORMATS, EXPORTS, parse_export_filters, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Streams every booking or payment (optionally filtered) to a CSV or NDJSON file for reconciliation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='What to export.')
+        parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--from', dest='from', help='Only rows created on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='to', help='Only rows created before this date (YYYY-MM-DD).')
+        parser.add_argument('--status', help='Comma-separated statuses to include.')
+        parser.add_argument('--output', '-o', help='File to write; defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        try:
+            filters = parse_export_filters(kind, options)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        chunks = stream_export(kind, options['export_format'], filters, options['chunk_size'])
+        header_lines = 1 if options['export_format'] == 'csv' else 0
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                lines = self.write(chunks, output.write)
+            self.stderr.write(self.style.SUCCESS(
+                f"Exported {lines - header_lines} {kind} to {options['output']}."
+            ))
+        else:
+            self.write(chunks, lambda chunk: self.stdout.write(chunk, ending=''))
+
+    def write(self, chunks, write):
+        """
+        Writes each chunk as it is produced and returns how many lines were written.
+        """
+        lines = 0
+        for lines, chunk in enumerate(chunks, 1):
+            write(chunk)
+        return lines
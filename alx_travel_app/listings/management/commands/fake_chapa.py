@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from listings.fake_chapa import FakeChapaServer
+
+
+class Command(BaseCommand):
+    help = 'Runs a local fake Chapa gateway for development and load tests (set CHAPA_BASE_URL to its URL).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to bind.')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on.')
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every response.')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for injected failures.')
+
+    def handle(self, *args, **options):
+        server = FakeChapaServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            failure_rate=options['failure_rate'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fake Chapa listening on {server.base_url} (Ctrl+C to stop)"))
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.httpd.server_close()
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.cache import invalidate_all
+from listings.gazetteer import geocode_listings
+
+
+class Command(BaseCommand):
+    help = (
+        'Sets listing coordinates from a local gazetteer file by matching each listing location '
+        'to a place name. Reads a GeoNames dump (tab-separated) or a CSV file with name, latitude '
+        'and longitude columns. Only listings without coordinates are updated unless --overwrite is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('gazetteer', help='Path to the gazetteer file.')
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Also replace coordinates that are already set.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Geocoding listings from {options['gazetteer']}...")
+        try:
+            updated, unmatched = geocode_listings(options['gazetteer'], overwrite=options['overwrite'])
+        except (OSError, KeyError, ValueError) as exc:
+            raise CommandError(f"Could not read the gazetteer: {exc!r}")
+        invalidate_all()  # The bulk update skipped the cache invalidation signals
+        self.stdout.write(self.style.SUCCESS(f"Geocoded {updated} listings."))
+        if unmatched:
+            shown = ', '.join(sorted(unmatched)[:20])
+            more = f' and {len(unmatched) - 20} more' if len(unmatched) > 20 else ''
+            self.stdout.write(self.style.WARNING(f"No gazetteer match for {len(unmatched)} locations: {shown}{more}"))
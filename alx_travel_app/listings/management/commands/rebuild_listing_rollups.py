@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from listings.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the host stats rollups (ListingStatsRollup) from every booking, payment '
+        'and review. Run after loading data with bulk writes or fixtures, which skip the '
+        'signals that queue rollup changes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of listings rolled up per transaction.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding the listing stats rollups...")
+        rolled_up = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {rolled_up} listings."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from listings.cache import invalidate_all
+from listings.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized rating aggregates on every Listing from the Review table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of listings written per bulk update.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding listing rating aggregates...")
+        reviewed = rebuild_rating_aggregates(batch_size=options['batch_size'])
+        invalidate_all()  # The bulk update skipped the signals that invalidate cached listings
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt aggregates ({reviewed} listings have reviews)."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from listings.cache import invalidate_all
+from listings.textsearch import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the full-text search index (ListingTerm) from every Listing. Run after '
+        'loading listings with bulk writes or fixtures, which skip the signal that indexes them. '
+        'Searches return nothing until the rebuild finishes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of listings indexed per transaction.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding the listing search index...")
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        invalidate_all()  # Cached `?q=` responses were built from the old index
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} listings."))
@@ -1,13 +1,155 @@
+import multiprocessing
 import random
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model # Best practice to get the active User model
-from listings.models import Listing # Import your Listing model
+from django.db import connection, connections, transaction
+from listings.cache import invalidate_all
+from listings.models import Booking, Listing, ListingTerm, OccupiedNight, Payment, Review
+from listings.rollups import rebuild_rollups
+from listings.textsearch import index_rows
 
 # Get the User model dynamically (important for custom user models)
 User = get_user_model()
 
+LOCATIONS = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Malindi"]
+PROPERTY_TYPES = ['Apartment', 'House', 'Studio', 'Villa']
+DESCRIPTIONS = [
+    "A cozy apartment in the city center.",
+    "Spacious villa with a private pool.",
+    "Modern studio near public transport.",
+    "Charming cottage with garden access.",
+    "Luxury penthouse with panoramic views.",
+    "Budget-friendly room for travelers.",
+    "Family home with ample space.",
+    "Beachfront property with stunning ocean views."
+]
+COMMENTS = ["Great stay!", "Clean and comfortable.", "Would book again.", "Good value.", "Not as pictured."]
+BOOKING_STATUSES = ['confirmed', 'pending', 'canceled']
+BOOKING_STATUS_WEIGHTS = [60, 25, 15]
+RATING_WEIGHTS = [5, 5, 15, 35, 40] # Skewed towards 4-5 stars, like real review data
+BOOKINGS_START = date(2025, 1, 1)
+UNUSABLE_PASSWORD = '!seed' # A '!' prefix marks the password unusable, and skips hashing
+
+
+def listing_rng(seed, index):
+    """
+    Each listing gets its own RNG derived from (seed, index), so the generated data is
+    identical for a given --seed no matter how the work is split across --workers.
+    """
+    return random.Random(f"{seed}:listing:{index}")
+
+
+def seeded_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def seeded_listing_id(seed, index):
+    """
+    The primary key generate_listing() gives listing `index` (the first value its RNG draws).
+    """
+    return seeded_uuid(listing_rng(seed, index))
+
+
+def generate_listing(index, seed, user_ids, bookings_per_listing, reviews_per_listing):
+    """
+    Generates one listing with its search index rows, bookings (non-overlapping),
+    occupied nights, payments and reviews. Rating aggregates and index rows are filled
+    in directly, since bulk_create skips the signals that normally maintain them.
+    Returns a dict of model name -> list of unsaved instances.
+    """
+    rng = listing_rng(seed, index)
+    listing = Listing(
+        listing_id=seeded_uuid(rng),
+        host_id=user_ids[rng.randrange(len(user_ids))],
+        name=f"Sample Listing {index + 1} - {rng.choice(PROPERTY_TYPES)}",
+        description=rng.choice(DESCRIPTIONS),
+        location=rng.choice(LOCATIONS),
+        pricepernight=Decimal(rng.randrange(5000, 50000)) / 100, # Random price between 50 and 500
+    )
+    rows = {'listings': [listing], 'terms': index_rows(listing), 'bookings': [], 'nights': [], 'payments': [],
+            'reviews': []}
+
+    # Bookings follow each other with random gaps, so they never overlap.
+    night = BOOKINGS_START + timedelta(days=rng.randrange(0, 30))
+    num_bookings = rng.randint(bookings_per_listing // 2, bookings_per_listing + bookings_per_listing // 2)
+    for _ in range(num_bookings):
+        night += timedelta(days=rng.randrange(0, 5))
+        length = rng.randint(1, 7)
+        status = rng.choices(BOOKING_STATUSES, BOOKING_STATUS_WEIGHTS)[0]
+        booking = Booking(
+            booking_id=seeded_uuid(rng),
+            listing_id=listing.pk,
+            user_id=user_ids[rng.randrange(len(user_ids))],
+            start_date=night,
+            end_date=night + timedelta(days=length),
+            total_price=listing.pricepernight * length,
+            status=status,
+        )
+        rows['bookings'].append(booking)
+        if status != 'canceled':
+            rows['nights'].extend(
+                OccupiedNight(listing_id=listing.pk, booking_id=booking.pk, night=night + timedelta(days=d))
+                for d in range(length)
+            )
+            rows['payments'].append(Payment(
+                payment_id=seeded_uuid(rng),
+                booking_id=booking.pk,
+                amount=booking.total_price,
+                status='completed' if status == 'confirmed' else 'pending',
+                transaction_id=f"seed-{booking.pk.hex[:12]}" if status == 'confirmed' else None,
+            ))
+        night += timedelta(days=length)
+
+    # One review per distinct user (Review is unique on listing + user).
+    reviewers = rng.sample(user_ids, min(reviews_per_listing, len(user_ids)))
+    for user_id in reviewers:
+        rating = rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+        rows['reviews'].append(Review(
+            review_id=seeded_uuid(rng),
+            listing_id=listing.pk,
+            user_id=user_id,
+            rating=rating,
+            comment=rng.choice(COMMENTS),
+        ))
+        listing.review_count += 1
+        listing.rating_sum += rating
+        setattr(listing, f'rating_{rating}_count', getattr(listing, f'rating_{rating}_count') + 1)
+    return rows
+
+
+def seed_chunk(args):
+    """
+    Generates and inserts listings [start, stop) in one transaction.
+    Runs in the main process or in a --workers child. Returns the number of rows written.
+    """
+    start, stop, seed, user_ids, bookings_per_listing, reviews_per_listing, batch_size = args
+    batch = {'listings': [], 'terms': [], 'bookings': [], 'nights': [], 'payments': [], 'reviews': []}
+    for index in range(start, stop):
+        for name, instances in generate_listing(index, seed, user_ids, bookings_per_listing,
+                                                reviews_per_listing).items():
+            batch[name].extend(instances)
+
+    # Parents before children, so foreign keys resolve inside the transaction.
+    with transaction.atomic():
+        Listing.objects.bulk_create(batch['listings'], batch_size=batch_size)
+        ListingTerm.objects.bulk_create(batch['terms'], batch_size=batch_size)
+        Booking.objects.bulk_create(batch['bookings'], batch_size=batch_size)
+        OccupiedNight.objects.bulk_create(batch['nights'], batch_size=batch_size)
+        Payment.objects.bulk_create(batch['payments'], batch_size=batch_size)
+        Review.objects.bulk_create(batch['reviews'], batch_size=batch_size)
+    return sum(len(instances) for instances in batch.values())
+
+
 class Command(BaseCommand):
-    help = 'Seeds the database with sample Listing data.'
+    help = (
+        'Seeds the database with sample users, listings, bookings, reviews and payments. '
+        'Rows are generated deterministically from --seed and written with chunked bulk_create.'
+    )
 
     def add_arguments(self, parser):
         # Optional: Allow specifying the number of listings to create
@@ -17,80 +159,104 @@ class Command(BaseCommand):
             default=10, # Default to 10 listings
             help='Number of sample listings to create.'
         )
+        parser.add_argument('--num_users', type=int, default=10, help='Number of sample users (guests and hosts).')
+        parser.add_argument('--bookings_per_listing', type=int, default=5, help='Average bookings per listing.')
+        parser.add_argument('--reviews_per_listing', type=int, default=3, help='Reviews per listing (capped by users).')
+        parser.add_argument('--chunk_size', type=int, default=500, help='Listings generated per transaction.')
+        parser.add_argument('--batch_size', type=int, default=2000, help='Rows per INSERT statement.')
+        parser.add_argument('--workers', type=int, default=1, help='Processes to split the chunks across.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed yields the same data.')
         # Optional: Allow specifying if existing data should be cleared
         parser.add_argument(
             '--clear',
             action='store_true', # A boolean flag
-            help='Clear existing listings before seeding.'
+            help='Clear existing listings (and their bookings, reviews and payments) before seeding.'
         )
 
     def handle(self, *args, **options):
         num_listings = options['num_listings']
-        clear_data = options['clear']
+        workers = options['workers']
+        if options['num_users'] < 1:
+            raise CommandError("--num_users must be at least 1.")
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING("SQLite allows a single writer; ignoring --workers."))
+            workers = 1
+        if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            self.stdout.write(self.style.WARNING("Process forking is unavailable here; ignoring --workers."))
+            workers = 1
 
         self.stdout.write(self.style.SUCCESS(f"Starting database seeding for {num_listings} listings..."))
 
-        if clear_data:
+        if options['clear']:
             self.stdout.write(self.style.WARNING("Clearing existing Listing data..."))
             Listing.objects.all().delete()
             self.stdout.write(self.style.SUCCESS("Existing listings cleared."))
 
-        # Ensure there's at least one user to act as a host
-        # For a real app, you might pick existing hosts or create specific ones.
-        # Here, we'll create a dummy host if no users exist.
-        if not User.objects.exists():
-            self.stdout.write(self.style.WARNING("No users found. Creating a dummy host user."))
-            # Create a dummy user. In a real app, you might use a more robust way
-            # to get or create a host user.
-            try:
-                # Use create_user for proper password hashing
-                host_user = User.objects.create_user(
-                    username='seed_host',
-                    email='seed_host@example.com',
-                    password='seedpassword123', # Use a strong password in production
-                    first_name='Seed',
-                    last_name='Host',
-                    # Assuming your custom User model has a 'role' field
-                    # and 'host' is a valid choice. Adjust if your User model differs.
-                    role='host' if hasattr(User, 'role') else None
-                )
-                self.stdout.write(self.style.SUCCESS(f"Created dummy host: {host_user.username}"))
-            except Exception as e:
-                raise CommandError(f"Failed to create dummy host user: {e}. Please ensure your User model supports 'username', 'email', 'password', 'first_name', 'last_name', and 'role' (if applicable).")
-        else:
-            # Get a random host from existing users, or the first one if only one exists
-            host_user = User.objects.order_by('?').first() # '?' for random order (might be slow on large tables)
-            # Or just get the first user: host_user = User.objects.first()
-            self.stdout.write(self.style.SUCCESS(f"Using existing host: {host_user.username}"))
-
-
-        # Generate sample listings
-        listings_created = 0
-        locations = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Malindi"]
-        descriptions = [
-            "A cozy apartment in the city center.",
-            "Spacious villa with a private pool.",
-            "Modern studio near public transport.",
-            "Charming cottage with garden access.",
-            "Luxury penthouse with panoramic views.",
-            "Budget-friendly room for travelers.",
-            "Family home with ample space.",
-            "Beachfront property with stunning ocean views."
+        # Every row's key derives from --seed and the listing index, so a second run with
+        # the same seed would collide with the first.
+        first_ids = [
+            seeded_listing_id(options['seed'], index) for index in range(min(num_listings, options['chunk_size']))
         ]
+        if Listing.objects.filter(pk__in=first_ids).exists():
+            raise CommandError(
+                f"Listings seeded with --seed {options['seed']} already exist. Re-run with --clear to "
+                f"replace them, or pass a different --seed to add more."
+            )
+
+        user_ids = self.seed_users(options['num_users'], options['seed'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Using {len(user_ids)} seed users."))
+
+        chunk_size = options['chunk_size']
+        chunks = [
+            (start, min(start + chunk_size, num_listings), options['seed'], user_ids,
+             options['bookings_per_listing'], options['reviews_per_listing'], options['batch_size'])
+            for start in range(0, num_listings, chunk_size)
+        ]
+
+        started = time.perf_counter()
+        rows_written = 0
+        if workers > 1:
+            # Children must not inherit the parent's open database connection.
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                for rows in pool.imap_unordered(seed_chunk, chunks):
+                    rows_written = self.report(rows_written + rows, started)
+        else:
+            for chunk in chunks:
+                rows_written = self.report(rows_written + seed_chunk(chunk), started)
+
+        # bulk_create skipped the signals that invalidate cached listing responses
+        # and queue the host stats rollups.
+        invalidate_all()
+        rebuild_rollups()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully created {num_listings} sample listings ({rows_written} rows in {elapsed:.1f}s)."
+        ))
+        self.stdout.write(self.style.SUCCESS("Database seeding complete."))
+
+    def seed_users(self, num_users, seed, batch_size):
+        """
+        Creates the seed users that don't exist yet and returns all of their ids.
+        Usernames are derived from --seed, so re-running with the same seed reuses them.
+        """
+        usernames = [f"seed{seed}_user{i}" for i in range(num_users)]
+        User.objects.bulk_create(
+            [
+                User(username=username, email=f"{username}@example.com", password=UNUSABLE_PASSWORD,
+                     first_name="Seed", last_name=f"User {i}")
+                for i, username in enumerate(usernames)
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        ids = {}
+        for offset in range(0, num_users, batch_size):
+            ids.update(User.objects.filter(username__in=usernames[offset:offset + batch_size])
+                       .values_list('username', 'pk'))
+        return [ids[username] for username in usernames]
 
-        for i in range(num_listings):
-            try:
-                Listing.objects.create(
-                    host=host_user,
-                    name=f"Sample Listing {i+1} - {random.choice(['Apartment', 'House', 'Studio', 'Villa'])}",
-                    description=random.choice(descriptions),
-                    location=random.choice(locations),
-                    pricepernight=random.uniform(50.00, 500.00) # Random price between 50 and 500
-                )
-                listings_created += 1
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error creating listing {i+1}: {e}"))
-                # Continue even if one fails, but log the error
-
-        self.stdout.write(self.style.SUCCESS(f"Successfully created {listings_created} sample listings."))
-        self.stdout.write(self.style.SUCCESS("Database seeding complete."))
\ No newline at end of file
+    def report(self, rows_written, started):
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(f"  {rows_written} rows written ({rows_written / elapsed:,.0f} rows/s)")
+        return rows_written
@@ -0,0 +1,258 @@
+"""
+Metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms live in module-level objects registered in REGISTRY.
+
+- Request metrics are kept in process memory. Each web process has its own values,
+  so scrape every process separately. Updates take a per-metric lock and touch a
+  handful of integers, which is cheap enough for the request path.
+- Celery task metrics are recorded in worker processes. They use the Shared* variants,
+  which add to counters in the Django cache (METRICS_CACHE_ALIAS), so the web metrics
+  endpoint reports every worker's tasks. This needs a cache shared between processes,
+  such as Redis via CACHE_URL.
+"""
+import bisect
+import math
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+REGISTRY = []
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-second timeouts.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base for a labelled metric. Values are keyed by the tuple of label values, in
+    `labelnames` order.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in self._items():
+            lines.extend(self._samples(list(zip(self.labelnames, key)), value))
+        return lines
+
+    def _items(self):
+        with self._lock:
+            return sorted((key, self._copy(value)) for key, value in self._values.items())
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    """
+    A monotonically increasing count.
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, labels, value):
+        return [f'{self.name}_total{_format_labels(labels)} {_format_value(value)}']
+
+
+class Histogram(Metric):
+    """
+    Bucketed observations with a running sum and count. Buckets are stored
+    non-cumulatively and summed when rendered.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _copy(self, state):
+        return [list(state[0]), state[1], state[2]]
+
+    def _samples(self, labels, state):
+        counts, total, count = state
+        samples, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append(
+                f'{self.name}_bucket{_format_labels(labels + [("le", _format_value(bound))])} {cumulative}'
+            )
+        samples.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+        samples.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return samples
+
+
+class SharedMetricMixin:
+    """
+    Keeps a metric's values in the Django cache instead of process memory, so every
+    process adds to the same series. Increments are atomic on shared backends (Redis,
+    Memcached). `label_sets` is a callable returning the label-value tuples to render,
+    because the cache cannot list its keys.
+    """
+    def __init__(self, *args, label_sets, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.label_sets = label_sets
+
+    def _cache(self):
+        return caches[settings.METRICS_CACHE_ALIAS]
+
+    def _cache_key(self, key, part):
+        return ':'.join(('metrics', self.name) + key + (part,))
+
+    def _incr(self, cache_key, amount):
+        cache = self._cache()
+        try:
+            cache.incr(cache_key, amount)
+        except ValueError:
+            # First increment: create the key, unless another process just did.
+            if not cache.add(cache_key, amount, timeout=None):
+                cache.incr(cache_key, amount)
+
+    def _parts(self):
+        raise NotImplementedError
+
+    def _load(self, keys):
+        """
+        Returns {label key: {part: value}} for the given label keys, with one cache read.
+        """
+        parts = self._parts()
+        cache_keys = {self._cache_key(key, part): (key, part) for key in keys for part in parts}
+        found = self._cache().get_many(list(cache_keys))
+        values = {}
+        for cache_key, value in found.items():
+            key, part = cache_keys[cache_key]
+            values.setdefault(key, {})[part] = value
+        return values
+
+    def clear(self):
+        keys = [tuple(str(value) for value in labels) for labels in self.label_sets()]
+        self._cache().delete_many([self._cache_key(key, part) for key in keys for part in self._parts()])
+
+
+class SharedCounter(SharedMetricMixin, Counter):
+    """
+    A Counter whose value is shared by every process through the cache.
+    """
+    def _parts(self):
+        return ('total',)
+
+    def inc(self, amount=1, **labels):
+        self._incr(self._cache_key(self._key(labels), 'total'), amount)
+
+    def value(self, **labels):
+        return self._cache().get(self._cache_key(self._key(labels), 'total'), 0)
+
+    def _items(self):
+        keys = [tuple(str(value) for value in labels) for labels in self.label_sets()]
+        return sorted((key, parts['total']) for key, parts in self._load(keys).items())
+
+
+class SharedHistogram(SharedMetricMixin, Histogram):
+    """
+    A Histogram whose buckets are shared by every process through the cache.
+    The sum is kept in integer microseconds, because cache increments are integers.
+    """
+    def _parts(self):
+        return tuple(f'b{index}' for index in range(len(self.buckets))) + ('sum_us',)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        self._incr(self._cache_key(key, f'b{index}'), 1)
+        self._incr(self._cache_key(key, 'sum_us'), int(round(value * 1_000_000)))
+
+    def count(self, **labels):
+        parts = self._load([self._key(labels)]).get(self._key(labels), {})
+        return sum(value for part, value in parts.items() if part != 'sum_us')
+
+    def _items(self):
+        keys = [tuple(str(value) for value in labels) for labels in self.label_sets()]
+        items = []
+        for key, parts in self._load(keys).items():
+            counts = [parts.get(f'b{index}', 0) for index in range(len(self.buckets))]
+            if any(counts):
+                items.append((key, [counts, parts.get('sum_us', 0) / 1_000_000, sum(counts)]))
+        return sorted(items)
+
+
+def render_metrics():
+    """
+    Returns every registered metric in the Prometheus text format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Request metrics (recorded by listings.middleware.RequestMetricsMiddleware) ---
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Wall time of sampled requests.', ['view', 'method'])
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per sampled request.', ['view', 'method'], buckets=COUNT_BUCKETS)
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in database queries per sampled request.', ['view', 'method'])
+REQUEST_SERIALIZER_DURATION = Histogram(
+    'http_request_serializer_duration_seconds', 'Time spent serializing per sampled request.', ['view', 'method'])
+REQUEST_OUTBOUND_DURATION = Histogram(
+    'http_request_outbound_duration_seconds', 'Time spent in outbound HTTP calls (Chapa) per sampled request.',
+    ['view', 'method'])
+REQUEST_DUPLICATE_QUERIES = Counter(
+    'http_request_duplicate_queries', 'Sampled requests that repeated the same SQL statement (N+1 shaped).',
+    ['view'])
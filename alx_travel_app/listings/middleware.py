@@ -0,0 +1,70 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+from .instrumentation import finish_request, start_request
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records, for a sampled fraction of requests, the view name, wall time, database query
+    count and time, serializer time and outbound HTTP time. The breakdown is returned in a
+    Server-Timing header and aggregated into the histograms in listings/metrics.py, which
+    are served by the metrics endpoint. Statements repeated REQUEST_METRICS_DUPLICATE_THRESHOLD
+    times or more in one request (the N+1 shape) are flagged and logged.
+
+    Enabled with REQUEST_METRICS_ENABLED; unsampled requests pay only for a random() call.
+    """
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        self.duplicate_threshold = settings.REQUEST_METRICS_DUPLICATE_THRESHOLD
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timings, token = start_request()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            finish_request(token)
+        total = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else 'unresolved'
+        labels = {'view': view, 'method': request.method}
+        metrics.REQUEST_DURATION.observe(total, **labels)
+        metrics.REQUEST_DB_QUERIES.observe(timings.query_count, **labels)
+        metrics.REQUEST_DB_DURATION.observe(timings.durations['db'], **labels)
+        metrics.REQUEST_SERIALIZER_DURATION.observe(timings.durations['serializer'], **labels)
+        metrics.REQUEST_OUTBOUND_DURATION.observe(timings.durations['http'], **labels)
+
+        server_timing = [
+            f'total;dur={total * 1000:.2f}',
+            f'db;dur={timings.durations["db"] * 1000:.2f};desc="{timings.query_count} queries"',
+            f'serializer;dur={timings.durations["serializer"] * 1000:.2f}',
+            f'http;dur={timings.durations["http"] * 1000:.2f}',
+        ]
+        duplicates = timings.duplicates(self.duplicate_threshold)
+        if duplicates:
+            metrics.REQUEST_DUPLICATE_QUERIES.inc(view=view)
+            server_timing.append(f'dupq;desc="{len(duplicates)} repeated statements"')
+            for sql, count in duplicates.items():
+                logger.warning("%s %s ran the same query %d times: %s", request.method, view, count, sql)
+        response['Server-Timing'] = ', '.join(server_timing)
+        return response
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:52
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_occupied_nights(apps, schema_editor):
+    """
+    Claims nights for existing active bookings. Pre-existing overlaps can't be
+    represented, so the earliest booking keeps a contested night.
+    """
+    Booking = apps.get_model('listings', 'Booking')
+    OccupiedNight = apps.get_model('listings', 'OccupiedNight')
+    active = Booking.objects.filter(status__in=['pending', 'confirmed']).order_by('created_at')
+    for booking in active.iterator(chunk_size=1000):
+        nights = []
+        night = booking.start_date
+        while night < booking.end_date:
+            nights.append(OccupiedNight(listing_id=booking.listing_id, booking_id=booking.pk, night=night))
+            night += timedelta(days=1)
+        OccupiedNight.objects.bulk_create(nights, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupiedNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupied_nights', to='listings.booking')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupied_nights', to='listings.listing')),
+            ],
+            options={
+                'verbose_name': 'Occupied Night',
+                'verbose_name_plural': 'Occupied Nights',
+                'ordering': ['listing', 'night'],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'night'), name='unique_listing_night')],
+            },
+        ),
+        migrations.RunPython(backfill_occupied_nights, migrations.RunPython.noop),
+    ]
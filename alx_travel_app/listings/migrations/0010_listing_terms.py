@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_listing_terms(apps, schema_editor):
+    """
+    Indexes the text of existing listings, with the tokenizer the app uses.
+    """
+    from listings.textsearch import SEARCH_FIELD_WEIGHTS, listing_terms
+
+    Listing = apps.get_model('listings', 'Listing')
+    ListingTerm = apps.get_model('listings', 'ListingTerm')
+    rows = []
+    for listing in Listing.objects.only('pk', *SEARCH_FIELD_WEIGHTS).iterator(chunk_size=1000):
+        frequencies = listing_terms(listing)
+        doc_length = sum(frequencies.values())
+        rows.extend(
+            ListingTerm(listing_id=listing.pk, term=term, frequency=frequency, doc_length=doc_length)
+            for term, frequency in frequencies.items()
+        )
+        if len(rows) >= 5000:
+            ListingTerm.objects.bulk_create(rows)
+            rows = []
+    ListingTerm.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_booking_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('frequency', models.PositiveIntegerField()),
+                ('doc_length', models.PositiveIntegerField()),
+                ('listing', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='listings.listing')),
+            ],
+            options={
+                'verbose_name': 'Listing Term',
+                'verbose_name_plural': 'Listing Terms',
+                'indexes': [models.Index(fields=['term', 'listing', 'frequency', 'doc_length'], name='listing_term_postings_idx')],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'term'), name='unique_listing_term')],
+            },
+        ),
+        migrations.RunPython(backfill_listing_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:33
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_listing_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('nightly', 'Nightly'), ('length_of_stay', 'Length of stay')], default='nightly', max_length=16)),
+                ('name', models.CharField(blank=True, default='', max_length=100)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('weekdays', models.CharField(blank=True, default='', max_length=7, validators=[django.core.validators.RegexValidator('^[0-6]*$', 'Weekdays are digits from 0 (Monday) to 6 (Sunday).')])),
+                ('multiplier', models.DecimalField(decimal_places=3, default=Decimal('1'), max_digits=6, validators=[django.core.validators.MinValueValidator(Decimal('0'))])),
+                ('min_nights', models.PositiveSmallIntegerField(default=1)),
+                ('discount_percent', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=5, validators=[django.core.validators.MinValueValidator(Decimal('0')), django.core.validators.MaxValueValidator(Decimal('100'))])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='listings.listing')),
+            ],
+            options={
+                'verbose_name': 'Pricing Rule',
+                'verbose_name_plural': 'Pricing Rules',
+                'ordering': ['listing', 'created_at'],
+            },
+        ),
+    ]
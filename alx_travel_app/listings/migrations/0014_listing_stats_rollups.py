@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_idempotency_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingStatsChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.UUIDField()),
+                ('first_day', models.DateField()),
+                ('last_day', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Listing Stats Change',
+                'verbose_name_plural': 'Listing Stats Changes',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListingStatsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], default='day', max_length=5)),
+                ('period', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('nights_sold', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('host', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stats_rollups', to='listings.listing')),
+            ],
+            options={
+                'verbose_name': 'Listing Stats Rollup',
+                'verbose_name_plural': 'Listing Stats Rollups',
+                'ordering': ['listing', 'period'],
+                'indexes': [models.Index(fields=['host', 'period'], name='rollup_host_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'granularity', 'period'), name='unique_listing_rollup_period')],
+            },
+        ),
+    ]
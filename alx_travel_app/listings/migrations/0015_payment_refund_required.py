@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_listing_stats_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='refund_required',
+            field=models.BooleanField(default=False),
+        ),
+    ]
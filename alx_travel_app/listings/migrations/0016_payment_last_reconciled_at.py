@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0015_payment_refund_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='last_reconciled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'last_reconciled_at', 'created_at'], name='payment_reconcile_idx'),
+        ),
+    ]
@@ -1,7 +1,10 @@
 import uuid
+from decimal import Decimal
 from django.db import models
 from django.conf import settings # Used to reference the AUTH_USER_MODEL
-from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 
 # --- Listing Model ---
 class Listing(models.Model):
@@ -36,6 +39,29 @@ class Listing(models.Model):
         auto_now=True        # Automatically updates the timestamp on each save
     )
 
+    # --- Coordinates ---
+    # Optional; set through the API or backfilled from `location` by the `geocode_listings`
+    # command. The geohash is derived from them in save() and backs radius search (listings/geo.py).
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
+
+    # --- Denormalized rating aggregates ---
+    # Maintained incrementally by the Review signal handlers in listings/signals.py
+    # and rebuilt from scratch by the `rebuild_rating_aggregates` management command.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    # Per-star histogram buckets (rating_1_count holds the number of 1-star reviews, etc.)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         """
         Meta options for the Listing model.
@@ -43,6 +69,26 @@ class Listing(models.Model):
         verbose_name = "Listing"
         verbose_name_plural = "Listings"
         ordering = ['-created_at'] # Default ordering: newest listings first
+        indexes = [
+            # Backs keyset pagination on (created_at, pk), see listings/pagination.py
+            models.Index(fields=['-created_at', '-listing_id'], name='listing_created_pk_idx'),
+            # Backs the location + price band filter of the search endpoint
+            models.Index(fields=['location', 'pricepernight'], name='listing_location_price_idx'),
+            # Backs the cell ranges of radius search, see listings/geo.py
+            models.Index(fields=['geohash'], name='listing_geohash_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Keeps the geohash in step with the coordinates.
+        """
+        from .geo import encode
+
+        self.geohash = encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'}.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """
@@ -50,6 +96,33 @@ class Listing(models.Model):
         """
         return f"{self.name} in {self.location} by {self.host.username if hasattr(self.host, 'username') else self.host.email}"
 
+    @property
+    def average_rating(self):
+        """
+        Returns the average review rating rounded to 2 places, or None when there are no reviews.
+        Read from the stored aggregates, so no query is issued.
+        """
+        return self.average_rating_of(self.review_count, self.rating_sum)
+
+    @property
+    def rating_histogram(self):
+        """
+        Returns the number of reviews per star rating as a dict keyed '1' to '5'.
+        """
+        return self.rating_histogram_of(*(getattr(self, f'rating_{star}_count') for star in range(1, 6)))
+
+    # The computations behind the two properties, on plain column values, so the fast
+    # read path (listings/fastpath.py) can apply them to .values() rows.
+    @staticmethod
+    def average_rating_of(review_count, rating_sum):
+        if not review_count:
+            return None
+        return round(rating_sum / review_count, 2)
+
+    @staticmethod
+    def rating_histogram_of(*star_counts):
+        return {str(star): count for star, count in enumerate(star_counts, start=1)}
+
 
 # --- Booking Model ---
 
@@ -99,6 +172,9 @@ class Booking(models.Model):
     created_at = models.DateTimeField(
         auto_now_add=True # TIMESTAMP, DEFAULT CURRENT_TIMESTAMP
     )
+    # The nested listing and user representations at booking time, served by the compact
+    # read path without a join; see listings/snapshots.py. NULL until filled.
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
 
     class Meta:
         """
@@ -107,9 +183,57 @@ class Booking(models.Model):
         verbose_name = "Booking"
         verbose_name_plural = "Bookings"
         ordering = ['-created_at'] # Default ordering: newest bookings first
-        # Optional: Add a unique constraint to prevent double-booking the same listing by the same user on the same dates
-        # This can be complex for date ranges and might require custom validation or database triggers for strict enforcement.
-        # For exact date conflicts: unique_together = ('listing', 'start_date', 'end_date')
+        indexes = [
+            # Backs keyset pagination on (created_at, pk), see listings/pagination.py
+            models.Index(fields=['-created_at', '-booking_id'], name='booking_created_pk_idx'),
+            # Backs status + date-range filtering in the streaming exports, see listings/exports.py
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ]
+        # Double-booking is prevented by the per-night OccupiedNight table (unique on listing + night),
+        # which is kept in sync with active bookings by save() below; see listings/availability.py.
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the fields that determine which nights the booking occupies, so save()
+        only touches the occupancy table when they actually change.
+        """
+        instance = super().from_db(db, field_names, values)
+        # Deferred loads (e.g. the pk-only rows a cascade delete collects) pass a short
+        # `values` tuple, so ask the instance rather than scanning for DEFERRED.
+        if not instance.get_deferred_fields():
+            instance._loaded_night_state = instance.night_state()
+        return instance
+
+    def night_state(self):
+        """
+        Returns the (listing, start, end, status) tuple the occupied nights are derived from.
+        """
+        return (self.listing_id, str(self.start_date), str(self.end_date), self.status)
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the booking and claims/releases its nights in the same transaction.
+        Raises availability.BookingOverlapError (rolling back the save) if an active
+        booking would overlap another active booking on the same listing.
+        """
+        from .availability import sync_booking_nights
+        from .snapshots import build_snapshot, snapshot_is_current
+        from .sqlite import write_transaction
+
+        # Snapshot on creation, and again if the booking moves to another listing or user.
+        # Skipped for partial saves and instances loaded without those columns.
+        if kwargs.get('update_fields') is None and not (
+            {'snapshot', 'listing_id', 'user_id'} & self.get_deferred_fields()
+        ) and not snapshot_is_current(self):
+            self.snapshot = build_snapshot(self.listing, self.user)
+
+        with write_transaction():
+            super().save(*args, **kwargs)
+            state = self.night_state()
+            if state != getattr(self, '_loaded_night_state', None):
+                sync_booking_nights(self)
+                self._loaded_night_state = state
 
     def __str__(self):
         """
@@ -118,6 +242,163 @@ class Booking(models.Model):
         return f"Booking {self.booking_id.hex[:8]} for {self.listing.name} by {self.user.username if hasattr(self.user, 'username') else self.user.email}"
 
 
+# --- Availability Model ---
+class OccupiedNight(models.Model):
+    """
+    One row per night held by an active (pending or confirmed) booking.
+    The unique (listing, night) constraint makes overlapping bookings impossible
+    at the database level, and availability queries read this table instead of Booking.
+    """
+    listing = models.ForeignKey(
+        Listing,
+        on_delete=models.CASCADE,
+        related_name='occupied_nights',
+        null=False
+    )
+    booking = models.ForeignKey(
+        Booking,
+        on_delete=models.CASCADE, # Deleting a booking frees its nights
+        related_name='occupied_nights',
+        null=False
+    )
+    night = models.DateField(null=False) # The night starting on this date (check-out day is not occupied)
+
+    class Meta:
+        """
+        Meta options for the OccupiedNight model.
+        """
+        verbose_name = "Occupied Night"
+        verbose_name_plural = "Occupied Nights"
+        ordering = ['listing', 'night']
+        constraints = [
+            # Also serves as the (listing, night) index for availability range scans.
+            models.UniqueConstraint(fields=['listing', 'night'], name='unique_listing_night'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a human-readable string representation of the OccupiedNight object.
+        """
+        return f"{self.night} held by Booking {self.booking_id.hex[:8]}"
+
+
+# --- Full-text search index ---
+class ListingTerm(models.Model):
+    """
+    One row per distinct term in a listing's name, location and description: the
+    inverted index behind `?q=` search (see listings/textsearch.py).
+    Maintained on Listing save and rebuilt by the `rebuild_search_index` command.
+    """
+    listing = models.ForeignKey(
+        Listing,
+        on_delete=models.CASCADE, # Deleting a listing drops its terms
+        related_name='search_terms',
+        db_index=False, # The unique (listing, term) constraint serves listing lookups
+        null=False
+    )
+    term = models.CharField(max_length=64, null=False)
+    # Occurrences weighted by field (a term in the name counts more than in the description)
+    frequency = models.PositiveIntegerField(null=False)
+    # The listing's total weighted term count, copied onto each row for BM25 length normalization
+    doc_length = models.PositiveIntegerField(null=False)
+
+    class Meta:
+        """
+        Meta options for the ListingTerm model.
+        """
+        verbose_name = "Listing Term"
+        verbose_name_plural = "Listing Terms"
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'term'], name='unique_listing_term'),
+        ]
+        indexes = [
+            # Covers the ranking query, so postings are read from the index alone.
+            models.Index(fields=['term', 'listing', 'frequency', 'doc_length'], name='listing_term_postings_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a human-readable string representation of the ListingTerm object.
+        """
+        return f"{self.term!r} x{self.frequency} in Listing {self.listing_id.hex[:8]}"
+
+
+# --- Pricing rules ---
+
+PRICING_RULE_KIND_CHOICES = [
+    ('nightly', 'Nightly'),                 # Multiplies the price of matching nights
+    ('length_of_stay', 'Length of stay'),   # Discounts stays of at least min_nights
+]
+
+
+class PricingRule(models.Model):
+    """
+    Adjusts a listing's pricepernight for some nights or stays (see listings/pricing.py).
+
+    A nightly rule multiplies the price of the nights in [start_date, end_date) that fall
+    on one of its weekdays; either end of the range may be open, and no weekdays means
+    every day. The multipliers of all the rules matching a night compound. A
+    length-of-stay rule takes discount_percent off stays of min_nights or more; the
+    largest discount a stay qualifies for applies.
+    """
+    listing = models.ForeignKey(
+        Listing,
+        on_delete=models.CASCADE, # Deleting a listing deletes its rules
+        related_name='pricing_rules',
+        null=False
+    )
+    kind = models.CharField(max_length=16, choices=PRICING_RULE_KIND_CHOICES, default='nightly', null=False)
+    name = models.CharField(max_length=100, blank=True, default='') # e.g. "Weekends", "High season"
+    start_date = models.DateField(null=True, blank=True) # First night covered; open if null
+    end_date = models.DateField(null=True, blank=True)   # First night no longer covered; open if null
+    # Days of the week as digits, 0 = Monday to 6 = Sunday (e.g. '45' for Friday and Saturday nights)
+    weekdays = models.CharField(
+        max_length=7,
+        blank=True,
+        default='',
+        validators=[RegexValidator(r'^[0-6]*$', 'Weekdays are digits from 0 (Monday) to 6 (Sunday).')]
+    )
+    multiplier = models.DecimalField(
+        max_digits=6,
+        decimal_places=3,
+        default=Decimal('1'),
+        validators=[MinValueValidator(Decimal('0'))]
+    )
+    min_nights = models.PositiveSmallIntegerField(default=1)
+    discount_percent = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=Decimal('0'),
+        validators=[MinValueValidator(Decimal('0')), MaxValueValidator(Decimal('100'))]
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """
+        Meta options for the PricingRule model.
+        """
+        verbose_name = "Pricing Rule"
+        verbose_name_plural = "Pricing Rules"
+        ordering = ['listing', 'created_at']
+
+    def clean(self):
+        """
+        Checks that the dates form a range and that each kind only sets its own fields.
+        """
+        if self.start_date and self.end_date and self.end_date <= self.start_date:
+            raise ValidationError("end_date must be after start_date.")
+        if self.kind == 'length_of_stay' and (self.start_date or self.end_date or self.weekdays):
+            raise ValidationError("Length-of-stay rules apply to any stay; leave the dates and weekdays empty.")
+
+    def __str__(self):
+        """
+        Returns a human-readable string representation of the PricingRule object.
+        """
+        if self.kind == 'length_of_stay':
+            return f"{self.discount_percent}% off {self.min_nights}+ nights at Listing {self.listing_id.hex[:8]}"
+        return f"x{self.multiplier} {self.name or 'nightly'} rule for Listing {self.listing_id.hex[:8]}"
+
+
 # --- Review Model ---
 class Review(models.Model):
     """
@@ -160,6 +441,21 @@ class Review(models.Model):
         # Optional: Ensure a user can only review a specific listing once
         unique_together = ('listing', 'user')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the rating and listing the row was loaded with, so the signal handlers
+        can apply the exact delta to the listing aggregates when a review is edited.
+        """
+        instance = super().from_db(db, field_names, values)
+        loaded = {
+            name: value for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        instance._loaded_rating = loaded.get('rating')
+        instance._loaded_listing_id = loaded.get('listing_id')
+        return instance
+
     def __str__(self):
         """
         Returns a human-readable string representation of the Review object.
@@ -208,6 +504,10 @@ class Payment(models.Model):
         default='pending',
         null=False
     )
+    # Completed for a booking that could no longer be confirmed (its nights were taken); see listings/payments.py
+    refund_required = models.BooleanField(default=False)
+    # When the reconciliation sweep last queued a verification; the sweep takes the least recently checked first
+    last_reconciled_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -218,9 +518,185 @@ class Payment(models.Model):
         verbose_name = "Payment"
         verbose_name_plural = "Payments"
         ordering = ['-created_at']
+        indexes = [
+            # Backs the pending-payment reconciliation sweep
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+            models.Index(fields=['status', 'last_reconciled_at', 'created_at'], name='payment_reconcile_idx'),
+            # Backs date-range filtering without a status in the streaming exports
+            models.Index(fields=['created_at'], name='payment_created_idx'),
+        ]
         
     def __str__(self):
         """
         Returns a human-readable string representation of the Payment object.
         """
-        return f"Payment {self.payment_id.hex[:8]} for Booking {self.booking.booking_id.hex[:8]} - {self.status}"
\ No newline at end of file
+        return f"Payment {self.payment_id.hex[:8]} for Booking {self.booking.booking_id.hex[:8]} - {self.status}"
+
+
+# --- Email Outbox Model ---
+class EmailOutbox(models.Model):
+    """
+    A confirmation email waiting to be sent by the batching pipeline in listings/emails.py.
+    Rows are deleted once sent; rows that exhaust their retries are kept as 'failed'.
+    """
+    KIND_CHOICES = [
+        ('booking_confirmation', 'Booking confirmation'),
+        ('payment_confirmation', 'Payment confirmation'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES, null=False)
+    object_id = models.UUIDField(null=False) # booking_id or payment_id, depending on kind
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', null=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """
+        Meta options for the EmailOutbox model.
+        """
+        verbose_name = "Email Outbox Entry"
+        verbose_name_plural = "Email Outbox"
+        ordering = ['next_attempt_at']
+        indexes = [
+            # Backs the "due rows" scan of every flush
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a human-readable string representation of the EmailOutbox object.
+        """
+        return f"{self.get_kind_display()} for {self.object_id.hex[:8]} - {self.status}"
+
+
+# --- Idempotency Key Model ---
+class IdempotencyKey(models.Model):
+    """
+    The first request made with an Idempotency-Key header, and its response once it
+    finished; see listings/idempotency.py. Rows are purged after expires_at.
+    """
+    STATUS_CHOICES = [
+        ('in_progress', 'In progress'),
+        ('completed', 'Completed'),
+    ]
+
+    scope = models.CharField(max_length=150, null=False) # endpoint and user, e.g. "bookings.create:42"
+    key = models.CharField(max_length=255, null=False)
+    fingerprint = models.CharField(max_length=64, null=False) # sha256 of the request method, path and payload
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='in_progress', null=False)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.BinaryField(default=b'')
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField() # an in-progress claim older than this was abandoned
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """
+        Meta options for the IdempotencyKey model.
+        """
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+        constraints = [
+            # The insert that claims a key; a concurrent duplicate fails it and waits instead.
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_scope_key_uniq'),
+        ]
+        indexes = [
+            # Backs the purge_idempotency_keys sweep
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a human-readable string representation of the IdempotencyKey object.
+        """
+        return f"{self.scope} {self.key} - {self.status}"
+
+
+# --- Host dashboard rollups ---
+class ListingStatsRollup(models.Model):
+    """
+    One listing's activity over one day, or over one month once the day is older than
+    ROLLUP_DAILY_DAYS: the rows the host stats endpoint reads (see listings/rollups.py).
+    Only periods with some activity have a row.
+    """
+    GRANULARITY_CHOICES = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+    ]
+
+    listing = models.ForeignKey(
+        Listing,
+        on_delete=models.CASCADE, # Deleting a listing drops its rollups
+        related_name='stats_rollups',
+        db_index=False, # The unique (listing, granularity, period) constraint serves listing lookups
+        null=False
+    )
+    host = models.ForeignKey(
+        settings.AUTH_USER_MODEL, # The listing's host, copied so the endpoint never joins listings
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False, # Covered by the (host, period) index
+        null=False
+    )
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES, default='day', null=False)
+    period = models.DateField(null=False) # The day, or the first day of the month
+    bookings = models.PositiveIntegerField(default=0) # Active bookings checking in
+    nights_sold = models.PositiveIntegerField(default=0) # Nights held by active bookings
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0) # Completed payments, by check-in
+    reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """
+        Meta options for the ListingStatsRollup model.
+        """
+        verbose_name = "Listing Stats Rollup"
+        verbose_name_plural = "Listing Stats Rollups"
+        ordering = ['listing', 'period']
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'granularity', 'period'], name='unique_listing_rollup_period'),
+        ]
+        indexes = [
+            # Backs the host stats endpoint's range scan
+            models.Index(fields=['host', 'period'], name='rollup_host_period_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a human-readable string representation of the ListingStatsRollup object.
+        """
+        return f"{self.get_granularity_display()} {self.period} of Listing {self.listing_id.hex[:8]}"
+
+
+class ListingStatsChange(models.Model):
+    """
+    Days of one listing whose rollups are out of date, written in the same transaction
+    as the booking, payment or review change and drained by refresh_listing_rollups.
+    """
+    # Not a foreign key: a listing's cascade delete can queue changes for it while its
+    # rows are being removed. The refresh skips listings that no longer exist.
+    listing_id = models.UUIDField(null=False)
+    first_day = models.DateField(null=False)
+    last_day = models.DateField(null=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """
+        Meta options for the ListingStatsChange model.
+        """
+        verbose_name = "Listing Stats Change"
+        verbose_name_plural = "Listing Stats Changes"
+        ordering = ['id'] # Drained oldest first
+
+    def __str__(self):
+        """
+        Returns a human-readable string representation of the ListingStatsChange object.
+        """
+        return f"Listing {self.listing_id.hex[:8]} {self.first_day}..{self.last_day}"
@@ -0,0 +1,215 @@
+"""
+Keyset (cursor) pagination for the listings API.
+
+Pages are positioned on the (created_at, pk) pair of the last row served rather than
+on an OFFSET, so fetching page N costs the same single indexed range scan as page 1.
+Both models order by -created_at with UUID primary keys, and the composite
+(created_at, pk) indexes added in migration 0003 back the range filter.
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates a queryset ordered by (-created_at, -pk) using an opaque cursor token.
+
+    The token is a urlsafe base64 JSON object holding the boundary row's created_at,
+    its primary key and the paging direction. Clients should treat it as opaque.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_field = 'created_at'
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw is None:
+            return self.page_size
+        try:
+            requested = int(raw)
+        except ValueError:
+            return self.page_size
+        if requested <= 0:
+            return self.page_size
+        return min(requested, self.max_page_size)
+
+    # --- Cursor encoding ---
+
+    def encode_cursor(self, row, direction):
+        # Rows are model instances, or .values() dicts on the fast read path (listings/fastpath.py).
+        if isinstance(row, dict):
+            boundary_value, boundary_pk = row[self.ordering_field], row['pk']
+        else:
+            boundary_value, boundary_pk = getattr(row, self.ordering_field), row.pk
+        payload = {
+            'c': boundary_value.isoformat(),
+            'k': force_str(boundary_pk),
+            'd': direction,
+        }
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+    def decode_cursor(self, token):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            boundary_value, boundary_pk = datetime.fromisoformat(payload['c']), uuid.UUID(payload['k'])
+            direction = payload['d']
+        except (binascii.Error, ValueError, TypeError, AttributeError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p'):
+            raise NotFound(self.invalid_cursor_message)
+        return boundary_value, boundary_pk, direction
+
+    # --- Pagination ---
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        field = self.ordering_field
+        queryset = queryset.order_by(f'-{field}', '-pk')
+
+        token = request.query_params.get(self.cursor_query_param)
+        direction = 'n'
+        if token:
+            boundary_value, boundary_pk, direction = self.decode_cursor(token)
+            if direction == 'p':
+                # Walk backwards: rows strictly newer than the boundary, nearest first.
+                queryset = queryset.filter(
+                    Q(**{f'{field}__gt': boundary_value})
+                    | Q(**{field: boundary_value, 'pk__gt': boundary_pk})
+                ).order_by(field, 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lt': boundary_value})
+                    | Q(**{field: boundary_value, 'pk__lt': boundary_pk})
+                )
+
+        # Fetch one extra row to learn whether another page exists, without a COUNT.
+        rows = list(queryset[:self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+
+        if direction == 'p':
+            rows.reverse()
+            self.has_next = bool(token)
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = bool(token)
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1], 'n'))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[0], 'p'))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ListingPagination(KeysetPagination):
+    page_size = settings.LISTINGS_PAGE_SIZE
+    max_page_size = settings.LISTINGS_MAX_PAGE_SIZE
+
+
+class ListingSearchPagination(ListingPagination):
+    """
+    Pages `?q=` full-text search results in relevance order (listings/textsearch.py).
+
+    Scores change as listings are edited, so there is no stable boundary row to key a
+    cursor on. The cursor holds the offset into the ranking instead. Each page runs the
+    ranking query once and then loads only that page's rows.
+    """
+    ordering_field = None
+    search_query_param = 'q'
+
+    def encode_offset(self, offset):
+        payload = json.dumps({'o': offset}, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode()
+
+    def decode_offset(self, token):
+        try:
+            offset = json.loads(base64.urlsafe_b64decode(token.encode()))['o']
+        except (binascii.Error, ValueError, TypeError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(offset, int) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        return offset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        from .textsearch import rank
+
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        token = request.query_params.get(self.cursor_query_param)
+        self.offset = self.decode_offset(token) if token else 0
+
+        ranked = rank(request.query_params.get(self.search_query_param, ''), self.offset, self.page_size_value + 1)
+        self.has_next = len(ranked) > self.page_size_value
+        listing_ids = [listing_id for listing_id, _ in ranked[:self.page_size_value]]
+        # Rows are model instances, or .values() dicts on the fast read path.
+        rows = {
+            row['pk'] if isinstance(row, dict) else row.pk: row
+            for row in queryset.filter(pk__in=listing_ids)
+        }
+        self.page = [rows[listing_id] for listing_id in listing_ids if listing_id in rows]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_offset(self.offset + self.page_size_value))
+
+    def get_previous_link(self):
+        if not self.offset:
+            return None
+        url = self.request.build_absolute_uri()
+        previous = max(0, self.offset - self.page_size_value)
+        if not previous:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_offset(previous))
+
+
+class BookingPagination(KeysetPagination):
+    page_size = settings.BOOKINGS_PAGE_SIZE
+    max_page_size = settings.BOOKINGS_MAX_PAGE_SIZE
@@ -0,0 +1,38 @@
+"""
+Request parsers for the listings API.
+"""
+import json
+
+from rest_framework.parsers import BaseParser
+
+
+class InvalidLine:
+    """
+    Placeholder for an NDJSON line that isn't a JSON value, so the bulk endpoint can
+    report it as a per-item error instead of rejecting the whole stream.
+    """
+    def __init__(self, line_number, message):
+        self.line_number = line_number
+        self.message = message
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON (one item per line) into a list.
+    Blank lines are skipped; malformed lines become InvalidLine items.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        items = []
+        for line_number, raw in enumerate(stream, start=1):
+            line = raw.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                items.append(InvalidLine(line_number, f'Invalid JSON: {exc}'))
+        return items
@@ -0,0 +1,90 @@
+"""
+Payment verification and status transitions.
+
+Verification against Chapa happens in Celery (listings/tasks.py), triggered by the
+gateway webhook and by the periodic reconciliation sweep. The transition itself is
+applied here under a row lock in one transaction, so concurrent webhook deliveries,
+retries and sweeps can't double-confirm a booking or send two confirmation emails.
+"""
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from .availability import BookingOverlapError
+from .models import Payment
+from .sqlite import write_transaction
+
+logger = logging.getLogger(__name__)
+
+# Gateway transaction states (data.status in the verify response)
+GATEWAY_SUCCESS = 'success'
+GATEWAY_FAILED_STATES = ('failed', 'failure', 'cancelled', 'canceled', 'reversed')
+
+
+def gateway_status(response_data):
+    """
+    Extracts the transaction state from a verify response. The top-level 'status' only
+    says whether the lookup succeeded ("failed" with no 'data' for an unknown tx_ref or
+    a bad API key), so without 'data' the state is unknown and '' is returned.
+    """
+    data = response_data.get('data') or {}
+    return (data.get('status') or '').lower()
+
+
+def signature_is_valid(body, signature):
+    """
+    Checks a webhook signature: hex HMAC-SHA256 of the raw body keyed with
+    CHAPA_WEBHOOK_SECRET. Fails closed when no secret is configured.
+    """
+    secret = settings.CHAPA_WEBHOOK_SECRET
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+def apply_verification(payment_id, response_data, expire=False):
+    """
+    Moves a pending payment (and its booking) to its final state based on a verify
+    response. Returns the payment's status afterwards.
+
+    Success confirms the payment and booking and queues the confirmation email once the
+    transaction commits. A gateway failure marks the payment failed. A payment the gateway
+    still reports as pending stays pending, unless `expire` is set (used by the sweep for
+    payments past PAYMENT_PENDING_EXPIRY), in which case it is marked failed. A success
+    for a booking that can no longer be confirmed completes the payment with
+    refund_required set and leaves the booking unconfirmed.
+    """
+    from .tasks import send_payment_confirmation_email
+
+    state = gateway_status(response_data)
+    with write_transaction():
+        payment = Payment.objects.select_for_update().select_related('booking').get(pk=payment_id)
+        if payment.status != 'pending':
+            return payment.status  # Already settled by an earlier delivery
+
+        if state == GATEWAY_SUCCESS:
+            payment.status = 'completed'
+            booking = payment.booking
+            loaded_status, booking.status = booking.status, 'confirmed'
+            try:
+                booking.save()
+            except BookingOverlapError:
+                # The booking was canceled and its nights were taken before the charge
+                # went through. The money was still received: record it, leave the
+                # booking as it was, and flag the payment for a refund.
+                booking.status = loaded_status
+                payment.refund_required = True
+                payment.save(update_fields=['status', 'refund_required', 'updated_at'])
+                logger.warning('Payment %s completed for booking %s, whose nights are taken; refund required',
+                               payment.pk, booking.pk)
+                return payment.status
+            payment.save(update_fields=['status', 'updated_at'])
+            transaction.on_commit(lambda: send_payment_confirmation_email.delay(str(payment.pk)))
+        elif state in GATEWAY_FAILED_STATES or expire:
+            payment.status = 'failed'
+            payment.save(update_fields=['status', 'updated_at'])
+        return payment.status
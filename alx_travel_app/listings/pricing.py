@@ -0,0 +1,222 @@
+"""
+Nightly pricing: a listing's pricepernight adjusted by its PricingRules.
+
+Evaluating the rules night by night costs (nights x rules) per quote. Instead, each
+listing gets a price calendar: the price of every night from today to
+PRICE_CALENDAR_DAYS ahead, evaluated once and stored as running totals in an
+array('q') of cents. A stay's subtotal is then the difference of two entries, whatever
+its length:
+
+    subtotal(start, end) = running[end - first_night] - running[start - first_night]
+
+and the length-of-stay discount is applied to that. A calendar also carries the
+compiled rules, so stays outside its range (past nights, or beyond the horizon) are
+priced by evaluating the rules for those nights, without another query.
+
+Calendars are built on demand and cached per listing as one compact value (the
+array's bytes plus the compiled rules) under a version token. The signal handlers in
+listings/signals.py drop the token when the listing's price or rules change. Each
+process also keeps the calendars it has loaded, so a quote normally reads just the
+token from the cache and skips unpickling the calendar.
+
+Prices are rounded to whole cents per night, then the discount is rounded once on
+the subtotal (half up), so a listing without rules still costs pricepernight x nights.
+"""
+import uuid
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Listing, PricingRule
+
+CALENDAR_VERSION_KEY = 'listings:price-calendar:{pk}:version'
+CALENDAR_KEY = 'listings:price-calendar:{pk}:{token}'
+
+# Calendars this process has unpickled: {listing_id: (version token, PriceCalendar)}
+_local_calendars = {}
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal(100)
+
+
+class PriceCalendar:
+    """
+    One listing's nightly prices from first_night for `days` nights, with the rules
+    needed to price any other night.
+    """
+    __slots__ = ('price_cents', 'nightly_rules', 'discounts', 'first_night', 'running')
+
+    def __init__(self, price_cents, nightly_rules, discounts, first_night, running=None, days=0):
+        self.price_cents = price_cents
+        # (first ordinal or None, end ordinal or None, weekday bitmask, multiplier), see compile_rules()
+        self.nightly_rules = nightly_rules
+        # ((min_nights, percent), ...) ascending by min_nights
+        self.discounts = discounts
+        self.first_night = first_night
+        if running is None:
+            nights = range(first_night, first_night + days)
+            running = array('q', accumulate((self.night_cents(night) for night in nights), initial=0))
+        self.running = running
+
+    @classmethod
+    def from_cache(cls, value):
+        price_cents, nightly_rules, discounts, first_night, running = value
+        return cls(price_cents, nightly_rules, discounts, first_night, array('q', running))
+
+    def to_cache(self):
+        return self.price_cents, self.nightly_rules, self.discounts, self.first_night, self.running.tobytes()
+
+    def night_cents(self, night):
+        """
+        The price of the night starting on ordinal day `night`, in cents. This is the
+        rule loop the calendar precomputes.
+        """
+        weekday = 1 << ((night - 1) % 7)  # date.fromordinal(1) is a Monday
+        multiplier = Decimal(1)
+        for first, end, weekdays, rule_multiplier in self.nightly_rules:
+            if (first is None or night >= first) and (end is None or night < end) and weekdays & weekday:
+                multiplier *= rule_multiplier
+        if multiplier == 1:
+            return self.price_cents
+        return int((self.price_cents * multiplier).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    def subtotal_cents(self, start, end):
+        """
+        The summed nightly prices of the nights [start, end), as ordinal days.
+        """
+        offset = start - self.first_night
+        if offset >= 0 and end - self.first_night < len(self.running):
+            return self.running[end - self.first_night] - self.running[offset]
+        return sum(self.night_cents(night) for night in range(start, end))
+
+    def quote(self, start_date, end_date):
+        """
+        Prices the stay [start_date, end_date): returns the number of nights, the
+        subtotal, the length-of-stay discount and the total price.
+        """
+        start, end = start_date.toordinal(), end_date.toordinal()
+        nights = end - start
+        subtotal = Decimal(self.subtotal_cents(start, end)) * CENT
+        percent = max((percent for min_nights, percent in self.discounts if min_nights <= nights), default=Decimal(0))
+        discount = (subtotal * percent / HUNDRED).quantize(CENT, rounding=ROUND_HALF_UP)
+        return {
+            'nights': nights,
+            'subtotal': subtotal,
+            'discount_percent': percent,
+            'discount': discount,
+            'total_price': subtotal - discount,
+        }
+
+
+def compile_rules(rules):
+    """
+    Splits a listing's PricingRules into the tuples a PriceCalendar evaluates:
+    (nightly rules, length-of-stay discounts).
+    """
+    nightly, best_percent = [], {}
+    for rule in rules:
+        if rule.kind == 'length_of_stay':
+            best_percent[rule.min_nights] = max(rule.discount_percent, best_percent.get(rule.min_nights, 0))
+            continue
+        weekdays = sum(1 << int(day) for day in set(rule.weekdays)) or 0b1111111
+        nightly.append((
+            rule.start_date.toordinal() if rule.start_date else None,
+            rule.end_date.toordinal() if rule.end_date else None,
+            weekdays,
+            rule.multiplier,
+        ))
+    return tuple(nightly), tuple(sorted(best_percent.items()))
+
+
+def build_calendars(listing_ids, listings=None):
+    """
+    Builds the calendars of the given listings from today, with one query for their
+    prices (skipped when `listings` already maps every id to an instance) and one for
+    their rules. Ids with no listing are left out.
+    """
+    listings = listings or {}
+    prices = {pk: listings[pk].pricepernight for pk in listing_ids if pk in listings}
+    if len(prices) < len(listing_ids):
+        prices.update(
+            Listing.objects.filter(pk__in=[pk for pk in listing_ids if pk not in prices])
+            .values_list('pk', 'pricepernight')
+        )
+    rules = {pk: [] for pk in prices}
+    for rule in PricingRule.objects.filter(listing_id__in=list(prices)).order_by('created_at'):
+        rules[rule.listing_id].append(rule)
+
+    first_night = timezone.localdate().toordinal()
+    calendars = {}
+    for pk, price in prices.items():
+        nightly_rules, discounts = compile_rules(rules[pk])
+        price_cents = int((Decimal(str(price)) / CENT).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        calendars[pk] = PriceCalendar(
+            price_cents, nightly_rules, discounts, first_night, days=settings.PRICE_CALENDAR_DAYS,
+        )
+    return calendars
+
+
+def _remember(pk, token, calendar):
+    _local_calendars.pop(pk, None)
+    _local_calendars[pk] = (token, calendar)
+    while len(_local_calendars) > settings.PRICE_CALENDAR_LOCAL_ENTRIES:
+        del _local_calendars[next(iter(_local_calendars))]  # Oldest first
+    return calendar
+
+
+def calendars_for(listing_ids, listings=None):
+    """
+    Returns {listing_id: PriceCalendar} for listing ids (UUIDs), building and caching
+    the missing ones. `listings` optionally maps ids to loaded instances.
+    """
+    version_keys = {pk: CALENDAR_VERSION_KEY.format(pk=pk) for pk in listing_ids}
+    tokens = cache.get_many(version_keys.values())
+    calendars, fetch = {}, {}
+    for pk, version_key in version_keys.items():
+        token = tokens.get(version_key)
+        if token is None:
+            continue
+        remembered = _local_calendars.get(pk)
+        if remembered is not None and remembered[0] == token:
+            calendars[pk] = remembered[1]
+        else:
+            fetch[CALENDAR_KEY.format(pk=pk, token=token)] = (pk, token)
+    if fetch:
+        for key, value in cache.get_many(fetch).items():
+            pk, token = fetch[key]
+            calendars[pk] = _remember(pk, token, PriceCalendar.from_cache(value))
+
+    missing = [pk for pk in version_keys if pk not in calendars]
+    if missing:
+        built = build_calendars(missing, listings)
+        entries = {}
+        for pk, calendar in built.items():
+            token = uuid.uuid4().hex[:12]
+            entries[CALENDAR_KEY.format(pk=pk, token=token)] = calendar.to_cache()
+            entries[version_keys[pk]] = token
+            _remember(pk, token, calendar)
+        cache.set_many(entries, timeout=settings.PRICE_CALENDAR_TIMEOUT)
+        calendars.update(built)
+    return calendars
+
+
+def quote_stay(listing_id, start_date, end_date, listing=None):
+    """
+    Prices a stay at one listing (see PriceCalendar.quote), or returns None when the
+    listing doesn't exist.
+    """
+    calendar = calendars_for([listing_id], {listing_id: listing} if listing else None).get(listing_id)
+    return calendar.quote(start_date, end_date) if calendar else None
+
+
+def invalidate_calendars(listing_ids):
+    """
+    Drops the calendars of the given listings; the next quote rebuilds them.
+    """
+    cache.delete_many([CALENDAR_VERSION_KEY.format(pk=pk) for pk in listing_ids])
+    for pk in listing_ids:
+        _local_calendars.pop(pk, None)
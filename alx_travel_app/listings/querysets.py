@@ -0,0 +1,129 @@
+"""
+Queryset planning for the listings API viewsets.
+
+Instead of hand-writing select_related()/prefetch_related()/only() calls per view,
+the planner walks the serializer's declared fields once and derives them:
+
+- a nested serializer on a forward ForeignKey/OneToOne becomes select_related()
+- a nested serializer with many=True on a reverse or many-to-many relation
+  becomes a Prefetch() whose queryset is planned recursively
+- the readable model fields of every level become a single only() call
+
+SerializerMethodFields and model properties are opaque to the planner, so a serializer
+lists the model fields they read in `Meta.method_field_sources`. If any readable field
+cannot be resolved, only() is skipped for the whole plan rather than risking deferred
+loads (one query per row) at render time.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    """
+    The relations and columns a serializer reads, derived from its declared fields.
+    """
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+        self.only = set()
+        self.can_restrict_columns = True
+
+    def apply(self, queryset, restrict_columns=True):
+        """
+        Applies the plan to a queryset. Column restriction is optional because only()
+        is only safe for read actions (a partially loaded instance saves partially).
+        """
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if restrict_columns and self.can_restrict_columns and self.only:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+def _method_field_sources(serializer):
+    return getattr(getattr(serializer, 'Meta', None), 'method_field_sources', {})
+
+
+def _plan_serializer(serializer, model, plan, prefix=''):
+    """
+    Adds the lookups needed by `serializer` (rendering instances of `model`) to `plan`,
+    with every lookup path prefixed by `prefix`.
+    """
+    declared_sources = _method_field_sources(serializer)
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            relation = model._meta.get_field(field.source)
+            child_plan = QueryPlan()
+            _plan_serializer(field.child, relation.related_model, child_plan)
+            child_queryset = child_plan.apply(relation.related_model._default_manager.all())
+            plan.prefetch_related.append(Prefetch(prefix + field.source, queryset=child_queryset))
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            relation = model._meta.get_field(field.source)
+            if relation.many_to_one or (relation.one_to_one and relation.concrete):
+                plan.select_related.append(prefix + field.source)
+                plan.only.add(prefix + field.source)
+                _plan_serializer(field, relation.related_model, plan, prefix + field.source + '__')
+            else:
+                plan.can_restrict_columns = False
+            continue
+
+        if field.source == '*' or name in declared_sources:
+            if name in declared_sources:
+                plan.only.update(prefix + source for source in declared_sources[name])
+            else:
+                plan.can_restrict_columns = False
+            continue
+
+        source = field.source_attrs[0]
+        if source == 'pk':
+            continue  # The primary key is always loaded
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            # A property or other attribute the planner can't see through.
+            plan.can_restrict_columns = False
+            continue
+        if model_field.concrete:
+            plan.only.add(prefix + source)
+        else:
+            plan.can_restrict_columns = False
+
+
+_plan_cache = {}
+
+
+def plan_for_serializer(serializer_class):
+    """
+    Returns the (cached) QueryPlan for a serializer class.
+    """
+    plan = _plan_cache.get(serializer_class)
+    if plan is None:
+        plan = QueryPlan()
+        _plan_serializer(serializer_class(), serializer_class.Meta.model, plan)
+        _plan_cache[serializer_class] = plan
+    return plan
+
+
+class QueryPlanningMixin:
+    """
+    ViewSet mixin that plans get_queryset() from the serializer used by the current action.
+    Columns are only restricted for the actions listed in `column_restricted_actions`.
+    """
+    column_restricted_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        plan = plan_for_serializer(self.get_serializer_class())
+        return plan.apply(
+            queryset,
+            restrict_columns=getattr(self, 'action', None) in self.column_restricted_actions,
+        )
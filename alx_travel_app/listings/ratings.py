@@ -0,0 +1,59 @@
+"""
+Helpers for maintaining the denormalized rating aggregates stored on Listing.
+
+The serializers read `review_count`, `rating_sum` and the `rating_N_count` buckets
+directly from the Listing row, so these helpers are the only place that writes them.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Listing, Review
+
+RATING_STARS = range(1, 6)
+AGGREGATE_FIELDS = ['review_count', 'rating_sum'] + [f'rating_{star}_count' for star in RATING_STARS]
+
+
+def apply_rating_delta(listing_id, rating, sign):
+    """
+    Adds (sign=1) or removes (sign=-1) a single review's rating from a listing's aggregates.
+    Uses F() expressions so concurrent reviews on the same listing don't lose updates.
+    """
+    if listing_id is None or rating not in RATING_STARS:
+        return
+    bucket = f'rating_{rating}_count'
+    Listing.objects.filter(pk=listing_id).update(**{
+        'review_count': F('review_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+        bucket: F(bucket) + sign,
+    })
+
+
+def rebuild_rating_aggregates(listing_ids=None, batch_size=1000):
+    """
+    Recomputes the aggregates from the Review table in a single grouped query.
+    When listing_ids is None every listing is rebuilt. Returns the number of listings
+    that have at least one review.
+    """
+    listings = Listing.objects.all()
+    reviews = Review.objects.all()
+    if listing_ids is not None:
+        listings = listings.filter(pk__in=listing_ids)
+        reviews = reviews.filter(listing_id__in=listing_ids)
+
+    buckets = {
+        f'rating_{star}_count': Count('pk', filter=Q(rating=star)) for star in RATING_STARS
+    }
+    rows = (
+        reviews.order_by()  # Drop the default ordering so GROUP BY stays on listing_id only
+        .values('listing_id')
+        .annotate(review_count=Count('pk'), rating_sum=Sum('rating'), **buckets)
+    )
+
+    with transaction.atomic():
+        listings.update(**{field: 0 for field in AGGREGATE_FIELDS})
+        updated = [
+            Listing(pk=row['listing_id'], **{field: row[field] for field in AGGREGATE_FIELDS})
+            for row in rows
+        ]
+        Listing.objects.bulk_update(updated, AGGREGATE_FIELDS, batch_size=batch_size)
+    return len(updated)
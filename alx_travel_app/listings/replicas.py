@@ -0,0 +1,119 @@
+"""
+Read replicas for the listing and booking read endpoints.
+
+DATABASE_REPLICA_URLS adds one database alias per replica (replica_0, replica_1, ...;
+see settings.py). The rest of the code does not change. PrimaryReplicaRouter sends
+every write to `default` (the primary). Reads go to a replica only inside
+replica_reads(), and ReplicaReadMixin opens that around the safe-method requests of
+ListingViewSet and BookingViewSet. Everything else reads from the primary: payments,
+webhooks, exports, Celery tasks and the admin.
+
+Replicas lag the primary, so a client that has just written must not read from one:
+
+- A request that writes is never routed to a replica; only GET/HEAD/OPTIONS are.
+- Reads inside a transaction on the primary stay on the primary.
+- PinPrimaryMiddleware sets a short-lived cookie on every successful unsafe request
+  (DATABASE_REPLICA_PIN_SECONDS), and requests carrying it read from the primary. A
+  client that books and then lists its bookings sees the booking.
+- ListingViewSet also reads from the primary for a while after any listing change, so
+  a cache miss right after an invalidation is not refilled from a lagging replica.
+
+With no replicas configured the router returns None everywhere and the mixin and
+middleware do nothing.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Lets the router send reads in this block (and this thread or task) to a replica.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replicas_enabled():
+    return bool(settings.DATABASE_REPLICAS)
+
+
+def is_pinned(request):
+    """
+    Whether `request` must read from the primary: it may write, or its client wrote recently.
+    """
+    return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes and migrations go to the primary; reads inside replica_reads() go to a
+    random replica.
+    """
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not settings.DATABASE_REPLICAS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS  # The transaction may have written; keep its reads with it
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data, so objects read anywhere may be related.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema by replication.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """
+    ViewSet mixin that serves unpinned safe-method requests from a replica.
+    """
+    def use_replica(self, request):
+        return replicas_enabled() and not is_pinned(request)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.use_replica(request):
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PinPrimaryMiddleware:
+    """
+    Pins a client to the primary for DATABASE_REPLICA_PIN_SECONDS after a successful
+    unsafe request, so its next reads see its own writes.
+
+    Enabled when DATABASE_REPLICA_URLS names at least one replica.
+    """
+    def __init__(self, get_response):
+        if not replicas_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
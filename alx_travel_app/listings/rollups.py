@@ -0,0 +1,331 @@
+"""
+Per-listing activity rollups behind the host stats endpoint (GET /api/hosts/{id}/stats/).
+
+Computing a host's occupancy, revenue and ratings on demand means scanning their
+bookings, payments and reviews over the whole history. Instead, ListingStatsRollup
+keeps one row per listing per day with activity:
+
+- bookings: active (pending or confirmed) bookings checking in that day
+- nights_sold: nights held by active bookings (the OccupiedNight rows)
+- revenue: completed payments, counted on their booking's check-in day
+- reviews and rating_sum: reviews written that day (in the current time zone)
+
+Days older than ROLLUP_DAILY_DAYS are compacted into one row per month by the
+nightly compact_listing_rollups task, so a listing's row count stays bounded by its
+age in months. The endpoint reads a host's rows over the (host, period) index and
+sums them per month, whatever the size of the underlying tables.
+
+Rollups are maintained incrementally. Every booking, payment and review change writes
+a ListingStatsChange row (listing, first day, last day) in its own transaction. The
+refresh_listing_rollups task drains them every minute: it recomputes the listed days
+of each listing from the source tables and replaces their rollup rows. A range that
+reaches into the compacted months is widened to whole months, so a late change (a
+review deleted years later) rewrites its month row. Recomputing instead of applying
+deltas keeps the rows exact whatever order the changes arrive in, and running a
+change twice is harmless.
+
+Bulk loads that skip the signals (seed, fixtures) are followed by
+`python manage.py rebuild_listing_rollups`.
+"""
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .availability import ACTIVE_BOOKING_STATUSES, as_date
+from .models import Booking, Listing, ListingStatsChange, ListingStatsRollup, OccupiedNight, Payment, Review
+from .sqlite import write_transaction
+
+ROLLUP_FIELDS = ('bookings', 'nights_sold', 'revenue', 'reviews', 'rating_sum')
+
+CENT = Decimal('0.01')
+
+
+def _zero():
+    return [0, 0, Decimal(0), 0, 0]
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return day.replace(day=monthrange(day.year, day.month)[1])
+
+
+def compaction_cutoff(today=None):
+    """
+    The first day kept at daily granularity: days before it are rolled up by month.
+    """
+    return month_start((today or timezone.localdate()) - timedelta(days=settings.ROLLUP_DAILY_DAYS))
+
+
+# --- Change queue ---
+
+def stay_change(listing_id, start_date, end_date):
+    """
+    The change row covering a stay's check-in day and every night it holds.
+    """
+    start_date = as_date(start_date)
+    return ListingStatsChange(
+        listing_id=listing_id, first_day=start_date,
+        last_day=max(start_date, as_date(end_date) - timedelta(days=1)),
+    )
+
+
+def queue_stays(stays):
+    """
+    Queues a refresh of the days touched by (listing_id, start_date, end_date) stays,
+    one change row per listing.
+    """
+    ranges = {}
+    for listing_id, start_date, end_date in stays:
+        change = stay_change(listing_id, start_date, end_date)
+        first, last = ranges.get(listing_id, (change.first_day, change.last_day))
+        ranges[listing_id] = (min(first, change.first_day), max(last, change.last_day))
+    ListingStatsChange.objects.bulk_create([
+        ListingStatsChange(listing_id=listing_id, first_day=first, last_day=last)
+        for listing_id, (first, last) in ranges.items()
+    ])
+
+
+def queue_day(listing_id, day):
+    """
+    Queues a refresh of one day of a listing.
+    """
+    ListingStatsChange.objects.create(listing_id=listing_id, first_day=day, last_day=day)
+
+
+# --- Computing rollups ---
+
+def daily_activity(listing_ids, first_day=None, last_day=None):
+    """
+    Reads the given listings' activity from the source tables, optionally limited to
+    [first_day, last_day]. Returns {(listing_id, day): [value per ROLLUP_FIELDS]}.
+    """
+    def within(field):
+        bounds = {}
+        if first_day is not None:
+            bounds[f'{field}__gte'] = first_day
+        if last_day is not None:
+            bounds[f'{field}__lte'] = last_day
+        return bounds
+
+    activity = defaultdict(_zero)
+    bookings = (
+        Booking.objects.filter(listing_id__in=listing_ids, status__in=ACTIVE_BOOKING_STATUSES, **within('start_date'))
+        .order_by().values('listing_id', 'start_date').annotate(count=Count('pk'))
+        .values_list('listing_id', 'start_date', 'count')
+    )
+    for listing_id, day, count in bookings:
+        activity[listing_id, day][0] = count
+    nights = (
+        OccupiedNight.objects.filter(listing_id__in=listing_ids, **within('night'))
+        .order_by().values('listing_id', 'night').annotate(count=Count('pk'))
+        .values_list('listing_id', 'night', 'count')
+    )
+    for listing_id, day, count in nights:
+        activity[listing_id, day][1] = count
+    revenue = (
+        Payment.objects.filter(status='completed', booking__listing_id__in=listing_ids, **within('booking__start_date'))
+        .order_by().values('booking__listing_id', 'booking__start_date').annotate(total=Sum('amount'))
+        .values_list('booking__listing_id', 'booking__start_date', 'total')
+    )
+    for listing_id, day, total in revenue:
+        activity[listing_id, day][2] = total
+    reviews = (
+        Review.objects.filter(listing_id__in=listing_ids, **within('created_at__date'))
+        .annotate(day=TruncDate('created_at')).order_by()
+        .values('listing_id', 'day').annotate(count=Count('pk'), total=Sum('rating'))
+        .values_list('listing_id', 'day', 'count', 'total')
+    )
+    for listing_id, day, count, total in reviews:
+        activity[listing_id, day][3:] = [count, total]
+    return activity
+
+
+def rollup_rows(activity, hosts, cutoff):
+    """
+    Buckets daily activity into unsaved ListingStatsRollup rows: days from cutoff on
+    by day, earlier days by month. Listings missing from `hosts` are dropped.
+    """
+    periods = defaultdict(_zero)
+    for (listing_id, day), values in activity.items():
+        key = (listing_id, 'day', day) if day >= cutoff else (listing_id, 'month', month_start(day))
+        periods[key] = [total + value for total, value in zip(periods[key], values)]
+    return [
+        ListingStatsRollup(
+            listing_id=listing_id, host_id=hosts[listing_id], granularity=granularity, period=period,
+            **dict(zip(ROLLUP_FIELDS, values)),
+        )
+        for (listing_id, granularity, period), values in periods.items()
+        if listing_id in hosts
+    ]
+
+
+def apply_queued_changes(batch_size=None):
+    """
+    Drains up to `batch_size` queued changes: recomputes the days they cover and
+    replaces those rollup rows. Returns the number of changes applied.
+    """
+    batch_size = batch_size or settings.ROLLUP_REFRESH_BATCH_SIZE
+    changes = list(ListingStatsChange.objects.values_list('pk', 'listing_id', 'first_day', 'last_day')[:batch_size])
+    if not changes:
+        return 0
+    cutoff = compaction_cutoff()
+    ranges = {}
+    for _, listing_id, first_day, last_day in changes:
+        first, last = ranges.get(listing_id, (first_day, last_day))
+        ranges[listing_id] = (min(first, first_day), max(last, last_day))
+    for listing_id, (first, last) in ranges.items():
+        # Compacted months are recomputed whole.
+        ranges[listing_id] = (month_start(first) if first < cutoff else first,
+                              month_end(last) if last < cutoff else last)
+
+    # Read everything first, so the write transaction only holds the lock for the writes.
+    hosts = dict(Listing.objects.filter(pk__in=list(ranges)).values_list('pk', 'host_id'))
+    rows = []
+    for listing_id, (first, last) in ranges.items():
+        if listing_id in hosts:
+            rows += rollup_rows(daily_activity([listing_id], first, last), hosts, cutoff)
+    with write_transaction():
+        for listing_id, (first, last) in ranges.items():
+            ListingStatsRollup.objects.filter(listing_id=listing_id, period__range=(first, last)).delete()
+        ListingStatsRollup.objects.bulk_create(rows)
+        ListingStatsChange.objects.filter(pk__in=[pk for pk, *_ in changes]).delete()
+    return len(changes)
+
+
+def compact_rollups():
+    """
+    Merges the daily rows older than the cutoff into monthly rows, and moves rows to
+    their listing's current host. Returns (daily rows compacted, rows moved).
+    """
+    cutoff = compaction_cutoff()
+    daily = ListingStatsRollup.objects.filter(granularity='day', period__lt=cutoff)
+    months = (
+        daily.annotate(month=TruncMonth('period')).order_by()
+        .values('listing_id', 'host_id', 'month')
+        .annotate(**{f'total_{field}': Sum(field) for field in ROLLUP_FIELDS})
+    )
+    current_host = Listing.objects.filter(pk=OuterRef('listing_id')).values('host_id')[:1]
+    with write_transaction():
+        # A month is either all daily rows or one monthly row, since refreshes below
+        # the cutoff rewrite whole months, so nothing here collides with a monthly row.
+        ListingStatsRollup.objects.bulk_create([
+            ListingStatsRollup(
+                listing_id=row['listing_id'], host_id=row['host_id'], granularity='month', period=row['month'],
+                **{field: row[f'total_{field}'] for field in ROLLUP_FIELDS},
+            )
+            for row in months
+        ])
+        compacted, _ = daily.delete()
+        moved = (
+            ListingStatsRollup.objects.exclude(host_id=Subquery(current_host))
+            .update(host_id=Subquery(current_host))
+        )
+    return compacted, moved
+
+
+def rebuild_rollups(batch_size=200):
+    """
+    Recomputes every listing's rollups from the source tables, `batch_size` listings
+    at a time, replacing the queued changes made before it started. Returns the
+    number of listings rolled up.
+    """
+    cutoff = compaction_cutoff()
+    last_change = ListingStatsChange.objects.order_by('-pk').values_list('pk', flat=True).first()
+    ListingStatsRollup.objects.all().delete()
+    if last_change is not None:
+        ListingStatsChange.objects.filter(pk__lte=last_change).delete()
+
+    listings = Listing.objects.order_by('pk').values_list('pk', 'host_id')
+    rolled_up, after = 0, None
+    while True:
+        batch = listings.filter(pk__gt=after) if after else listings
+        hosts = dict(batch[:batch_size])
+        if not hosts:
+            return rolled_up
+        with write_transaction():
+            ListingStatsRollup.objects.bulk_create(rollup_rows(daily_activity(list(hosts)), hosts, cutoff))
+        rolled_up += len(hosts)
+        after = max(hosts)
+
+
+# --- Reading ---
+
+def parse_month(value, name):
+    """
+    Parses a YYYY-MM parameter into the first day of that month.
+    """
+    try:
+        year, month = (int(part) for part in value.split('-'))
+        return date(year, month, 1)
+    except ValueError:
+        raise ValueError(f"'{name}' must be a month in YYYY-MM format")
+
+
+def parse_month_range(params):
+    """
+    Reads `from` and `to` (YYYY-MM, inclusive) from query params. Defaults to the
+    twelve months ending with the current one. Raises ValueError with a client-facing
+    message.
+    """
+    this_month = month_start(timezone.localdate())
+    last = parse_month(params['to'], 'to') if params.get('to') else this_month
+    if params.get('from'):
+        first = parse_month(params['from'], 'from')
+    else:
+        months = last.year * 12 + last.month - 12
+        first = date(months // 12, months % 12 + 1, 1)
+    if first > last:
+        raise ValueError("'from' must not be after 'to'")
+    return first, last
+
+
+def _summary(values, days):
+    bookings, nights_sold, revenue, reviews, rating_sum = values
+    summary = {
+        'bookings': bookings,
+        'nights_sold': nights_sold,
+        'revenue': str(Decimal(revenue).quantize(CENT)),
+        'reviews': reviews,
+        'average_rating': round(rating_sum / reviews, 2) if reviews else None,
+    }
+    if days:
+        summary['occupancy'] = round(nights_sold / days, 4)
+    return summary
+
+
+def host_stats(host_id, first_month, last_month):
+    """
+    The host's per-listing monthly stats for [first_month, last_month], read from the
+    rollups alone. Months without activity are left out.
+    """
+    rows = (
+        ListingStatsRollup.objects
+        .filter(host_id=host_id, period__gte=first_month, period__lte=month_end(last_month))
+        .annotate(month=TruncMonth('period'))
+        .values('listing_id', 'month')
+        .annotate(**{f'total_{field}': Sum(field) for field in ROLLUP_FIELDS})
+        .order_by('listing_id', 'month')
+    )
+    listings, totals = {}, _zero()
+    for row in rows:
+        values = [row[f'total_{field}'] for field in ROLLUP_FIELDS]
+        totals = [total + value for total, value in zip(totals, values)]
+        month = {'month': row['month'].strftime('%Y-%m')}
+        month.update(_summary(values, monthrange(row['month'].year, row['month'].month)[1]))
+        listings.setdefault(row['listing_id'], []).append(month)
+    return {
+        'host_id': host_id,
+        'from': first_month.strftime('%Y-%m'),
+        'to': last_month.strftime('%Y-%m'),
+        'listings': [{'listing_id': listing_id, 'months': months} for listing_id, months in listings.items()],
+        'totals': _summary(totals, None),
+    }
@@ -1,14 +1,25 @@
 from rest_framework import serializers
-from .models import Listing, Booking, Review # Import your models
+from .models import Listing, Booking, Review, Payment # Import your models
+from .availability import BookingOverlapError
+from .instrumentation import TimedRepresentationMixin
+from .pricing import quote_stay
+from .snapshots import missing_snapshots
 from django.conf import settings # To reference AUTH_USER_MODEL
 
-# If you are using Django's built-in User model, uncomment the line below
-# and comment out 'from .models import User' if it's not defined in models.py
-# from django.contrib.auth import get_user_model
-# User = get_user_model()
-# Otherwise, ensure your custom User model is imported or accessible.
-# Assuming User is in listings/models.py for this example:
-from .models import User
+# The project uses Django's built-in User model (AUTH_USER_MODEL is not overridden),
+# so resolve it dynamically rather than importing it from listings.models.
+from django.contrib.auth import get_user_model
+User = get_user_model()
+
+
+def overlap_validation_error(exc):
+    """
+    Converts an availability.BookingOverlapError into a 400-producing ValidationError.
+    """
+    return serializers.ValidationError({
+        'non_field_errors': ["Listing is not available for the selected dates."],
+        'unavailable_nights': [str(night) for night in exc.nights],
+    })
 
 
 # --- Helper Serializers for Nested Relationships ---
@@ -18,6 +29,10 @@ class SimpleUserSerializer(serializers.ModelSerializer):
     A simplified serializer for User, used when nesting User objects
     to prevent excessive data or circular dependencies.
     """
+    # The built-in User model has an integer 'id' primary key; expose it as 'user_id'
+    # so the nested representation keeps the field name the API has always used.
+    user_id = serializers.ReadOnlyField(source='pk')
+
     class Meta:
         model = User
         # Adjust fields based on what minimal user info you want to expose when nested
@@ -38,7 +53,7 @@ class SimpleListingSerializer(serializers.ModelSerializer):
 
 # --- Main Serializers ---
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """
     Serializer for the Listing model.
     Includes nested representation of the host.
@@ -56,19 +71,33 @@ class ListingSerializer(serializers.ModelSerializer):
         required=True                # Host is a required field for a listing
     )
 
-    # Optional: Add a SerializerMethodField to get average rating for a listing
+    # Rating aggregates are stored on the Listing row (see listings/ratings.py),
+    # so these fields never issue per-listing queries.
     average_rating = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.SerializerMethodField()
 
     def get_average_rating(self, obj):
         """
-        Calculates the average rating for a listing based on its reviews.
+        Returns the stored average rating for a listing (None when it has no reviews).
+        """
+        return obj.average_rating
+
+    def get_rating_histogram(self, obj):
+        """
+        Returns the stored number of reviews per star rating.
         """
-        # Ensure 'Review' model is imported if you uncomment this
-        # from .models import Review # Or ensure Review is imported at the top
-        reviews = obj.reviews.all() # Access related reviews via the related_name
-        if reviews.exists():
-            return round(sum(review.rating for review in reviews) / reviews.count(), 2)
-        return None # Or 0.0, depending on desired representation for no reviews
+        return obj.rating_histogram
+
+    def validate(self, data):
+        """
+        A listing has both coordinates or neither.
+        """
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("'latitude' and 'longitude' must be set together.")
+        return data
 
     class Meta:
         model = Listing
@@ -78,16 +107,31 @@ class ListingSerializer(serializers.ModelSerializer):
             'name',
             'description',
             'location',
+            'latitude',
+            'longitude',
             'pricepernight',
             'created_at',
             'updated_at',
             'average_rating', # Include the calculated average rating
+            'review_count',
+            'rating_histogram',
             'host_id'        # Write-only field for setting host by ID
         ]
         read_only_fields = ['listing_id', 'created_at', 'updated_at']
+        # Model columns read by the SerializerMethodFields, used by listings/querysets.py
+        # to plan only() for read actions.
+        method_field_sources = {
+            'average_rating': ['review_count', 'rating_sum'],
+            'rating_histogram': [f'rating_{star}_count' for star in range(1, 6)],
+        }
+        # The same values computed from those columns, for the fast read path (listings/fastpath.py).
+        method_field_values = {
+            'average_rating': Listing.average_rating_of,
+            'rating_histogram': Listing.rating_histogram_of,
+        }
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """
     Serializer for the Booking model.
     Includes nested representation of the listing and the user who made the booking.
@@ -150,12 +194,88 @@ class BookingSerializer(serializers.ModelSerializer):
         if num_nights <= 0:
             raise serializers.ValidationError("Booking must be for at least one night.")
 
-        validated_data['total_price'] = listing.pricepernight * num_nights
-        return super().create(validated_data)
+        # Nightly rules and length-of-stay discounts, from the listing's price calendar
+        validated_data['total_price'] = quote_stay(listing.pk, start_date, end_date, listing=listing)['total_price']
+        try:
+            # Booking.save() claims the nights atomically; see listings/availability.py
+            return super().create(validated_data)
+        except BookingOverlapError as exc:
+            raise overlap_validation_error(exc)
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except BookingOverlapError as exc:
+            raise overlap_validation_error(exc)
+
+
+class CompactBookingListSerializer(serializers.ListSerializer):
+    """
+    Renders a page of compact bookings. Rows without a snapshot yet (created before the
+    column existed and not backfilled) get one built in memory, with one query per page.
+    """
+    def to_representation(self, data):
+        bookings = list(data)
+        missing = [booking.pk for booking in bookings if booking.snapshot is None]
+        if missing:
+            snapshots = missing_snapshots(missing)
+            for booking in bookings:
+                if booking.pk in snapshots:
+                    booking.snapshot = snapshots[booking.pk]
+        return super().to_representation(bookings)
+
+
+class CompactBookingSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    """
+    Read-only Booking serializer for `?compact=true`. Renders the same fields as
+    BookingSerializer, but the nested listing and user come from Booking.snapshot
+    (see listings/snapshots.py), so no Listing or User is joined or instantiated.
+    """
+    listing = serializers.SerializerMethodField()
+    user = serializers.SerializerMethodField()
+
+    def get_snapshot(self, obj):
+        if obj.snapshot is None:
+            obj.snapshot = missing_snapshots([obj.pk])[obj.pk]
+        return obj.snapshot
+
+    def get_listing(self, obj):
+        return self.get_snapshot(obj)['listing']
+
+    def get_user(self, obj):
+        return self.get_snapshot(obj)['user']
+
+    class Meta:
+        model = Booking
+        fields = ['booking_id', 'listing', 'user', 'start_date', 'end_date', 'total_price', 'status', 'created_at']
+        read_only_fields = fields
+        list_serializer_class = CompactBookingListSerializer
+        # Both nested objects are read from the snapshot column; see listings/querysets.py.
+        method_field_sources = {
+            'listing': ['snapshot'],
+            'user': ['snapshot'],
+        }
+        method_field_values = {
+            'listing': lambda snapshot: snapshot['listing'],
+            'user': lambda snapshot: snapshot['user'],
+        }
+
+    @classmethod
+    def prepare_rows(cls, rows):
+        """
+        Fast read path hook (listings/fastpath.py): fills in missing snapshots on a page of
+        .values() rows, like CompactBookingListSerializer does for instances.
+        """
+        missing = [row['pk'] for row in rows if row['snapshot'] is None]
+        if missing:
+            snapshots = missing_snapshots(missing)
+            for row in rows:
+                if row['pk'] in snapshots:
+                    row['snapshot'] = snapshots[row['pk']]
 
 
 # --- Payment Serializer ---
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """
     Serializer for the Payment model.
     """
@@ -0,0 +1,188 @@
+"""
+Signal handlers for the listings app.
+Connected in ListingsConfig.ready().
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_listings
+from .models import Booking, Listing, Payment, PricingRule, Review
+from .pricing import invalidate_calendars
+from .ratings import apply_rating_delta, rebuild_rating_aggregates
+from .rollups import queue_day, queue_stays
+from .serializers import SimpleUserSerializer
+from .textsearch import SEARCH_FIELD_WEIGHTS, reindex_listing
+
+User = get_user_model()
+
+
+# --- Review -> Listing rating aggregates ---
+
+@receiver(pre_save, sender=Review)
+def remember_previous_listing(sender, instance, raw=False, **kwargs):
+    """
+    Records the listing the review's row belongs to before the write, so a review moved
+    to another listing also updates the one it left. Read from the database when the
+    instance was not loaded with its listing (see Review.from_db).
+    """
+    if raw:
+        return
+    instance._previous_listing_id = getattr(instance, '_loaded_listing_id', None)
+    if instance._previous_listing_id is None:
+        instance._previous_listing_id = (
+            Review.objects.filter(pk=instance.pk).values_list('listing_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_aggregates_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Applies the delta of a created or edited review to its listing's aggregates.
+    """
+    if raw:
+        # Fixture loading; run `rebuild_rating_aggregates` afterwards instead.
+        return
+
+    if created:
+        apply_rating_delta(instance.listing_id, instance.rating, 1)
+    elif getattr(instance, '_loaded_rating', None) is None:
+        # Saved through an instance that was not loaded from the database (or was
+        # loaded with the rating deferred), so the previous rating is unknown;
+        # recompute the listing, and the one the review was moved from, from their reviews.
+        rebuild_rating_aggregates(listing_ids={instance.listing_id, instance._previous_listing_id} - {None})
+    elif (instance._loaded_rating, instance._loaded_listing_id) != (instance.rating, instance.listing_id):
+        apply_rating_delta(instance._loaded_listing_id, instance._loaded_rating, -1)
+        apply_rating_delta(instance.listing_id, instance.rating, 1)
+
+    # The stored values now match the row, so a later save only applies the new delta.
+    instance._loaded_rating = instance.rating
+    instance._loaded_listing_id = instance.listing_id
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_aggregates_on_delete(sender, instance, **kwargs):
+    """
+    Removes a deleted review's rating from its listing's aggregates.
+    """
+    # Prefer the values the row was loaded with, in case the instance was edited in memory.
+    listing_id = getattr(instance, '_loaded_listing_id', None) or instance.listing_id
+    rating = getattr(instance, '_loaded_rating', None) or instance.rating
+    apply_rating_delta(listing_id, rating, -1)
+
+
+# --- Listing -> full-text search index ---
+
+@receiver(post_save, sender=Listing)
+def update_search_index(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Re-indexes a saved listing's text. Deletes cascade to the index rows.
+    """
+    if raw:
+        # Fixture loading; run `rebuild_search_index` afterwards instead.
+        return
+    if update_fields is not None and not set(SEARCH_FIELD_WEIGHTS).intersection(update_fields):
+        return
+    reindex_listing(instance, created=created)
+
+
+# --- Listing price and rules -> price calendars ---
+
+@receiver(post_save, sender=Listing)
+def invalidate_price_calendar_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'pricepernight' not in update_fields):
+        return
+    transaction.on_commit(lambda: invalidate_calendars([instance.pk]))
+
+
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+def invalidate_price_calendar(sender, instance, **kwargs):
+    listing_id = instance.pk if sender is Listing else instance.listing_id
+    transaction.on_commit(lambda: invalidate_calendars([listing_id]))
+
+
+# --- Listing response cache invalidation ---
+
+def _invalidate_on_commit(listing_ids):
+    # Wait for the commit so a concurrent reader can't re-cache the pre-commit state.
+    transaction.on_commit(lambda: invalidate_listings(listing_ids))
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_cache(sender, instance, **kwargs):
+    _invalidate_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_listing_cache(sender, instance, **kwargs):
+    # Reviews change the listing's stored rating aggregates.
+    listing_ids = {instance.listing_id, getattr(instance, '_previous_listing_id', None),
+                   getattr(instance, '_loaded_listing_id', None)} - {None}
+    _invalidate_on_commit(list(listing_ids))
+
+
+# Host fields rendered inside ListingSerializer; saves touching only other fields
+# (e.g. the last_login update on every login) leave cached listings valid.
+HOST_RENDERED_FIELDS = set(SimpleUserSerializer.Meta.fields) - {'user_id'}
+
+
+@receiver(post_save, sender=User)
+def invalidate_hosted_listing_cache(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not HOST_RENDERED_FIELDS.intersection(update_fields)):
+        return
+    listing_ids = list(Listing.objects.filter(host_id=instance.pk).values_list('pk', flat=True))
+    if listing_ids:
+        _invalidate_on_commit(listing_ids)
+
+
+# --- Bookings, payments and reviews -> host stats rollups ---
+# Each change queues the days it touches, in its own transaction; the
+# refresh_listing_rollups task recomputes them (see listings/rollups.py).
+
+@receiver(post_save, sender=Booking)
+def queue_booking_stats_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    loaded, state = getattr(instance, '_loaded_night_state', None), instance.night_state()
+    if loaded == state:
+        return  # Saved without a change to its stay or status
+    # A moved or canceled booking frees its old days too.
+    queue_stays([stay[:3] for stay in (loaded, state) if stay is not None])
+
+
+@receiver(post_delete, sender=Booking)
+def queue_booking_stats_on_delete(sender, instance, **kwargs):
+    state = getattr(instance, '_loaded_night_state', None) or instance.night_state()
+    queue_stays([state[:3]])
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def queue_payment_stats(sender, instance, raw=False, **kwargs):
+    # Only completed payments count, and a payment only ever moves away from pending.
+    if raw or instance.status != 'completed':
+        return
+    if Payment.booking.is_cached(instance):
+        stay = (instance.booking.listing_id, instance.booking.start_date)
+    else:
+        stay = Booking.objects.filter(pk=instance.booking_id).values_list('listing_id', 'start_date').first()
+    if stay is not None:  # None when the booking's own delete cascaded here
+        queue_day(*stay)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def queue_review_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    day = timezone.localdate(instance.created_at)
+    queue_day(instance.listing_id, day)
+    previous = getattr(instance, '_previous_listing_id', None)
+    if previous is not None and previous != instance.listing_id:
+        queue_day(previous, day)  # Moved to another listing
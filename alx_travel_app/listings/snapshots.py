@@ -0,0 +1,87 @@
+"""
+Denormalized booking snapshots.
+
+Every booking row in the API nests its listing (SimpleListingSerializer) and its guest
+(SimpleUserSerializer), which costs a two-table join per page. Bookings do not change
+after they are made, so Booking.snapshot stores those two nested representations,
+rendered once when the booking is created:
+
+    {"listing": {"listing_id": ..., "name": ..., "location": ..., "pricepernight": ...},
+     "user": {"user_id": ..., "first_name": ..., "last_name": ..., "email": ...}}
+
+The compact booking read path (`?compact=true`, CompactBookingSerializer) serves these
+dicts as they are, without loading a Listing or User. The snapshot reflects the listing
+and guest at booking time. Later edits to them do not rewrite old bookings.
+Rows created before the column existed have no snapshot until `backfill_booking_snapshots`
+runs; until then the compact path renders them from one batched query per page.
+"""
+from django.db import transaction
+
+from .models import Booking
+
+# The columns build_snapshot() reads, for only() on a select_related('listing', 'user') query.
+SNAPSHOT_SOURCE_FIELDS = (
+    'listing', 'listing__name', 'listing__location', 'listing__pricepernight',
+    'user', 'user__first_name', 'user__last_name', 'user__email',
+)
+
+
+def build_snapshot(listing, user):
+    """
+    Returns the snapshot dict for a booking of `listing` by `user`. It is rendered by the
+    same serializers the full booking representation nests, so the two render identically.
+    """
+    from .serializers import SimpleListingSerializer, SimpleUserSerializer
+
+    return {
+        'listing': dict(SimpleListingSerializer(listing).data),
+        'user': dict(SimpleUserSerializer(user).data),
+    }
+
+
+def snapshot_is_current(booking):
+    """
+    Whether the booking's snapshot describes its current listing and user.
+    """
+    snapshot = booking.snapshot
+    return (
+        snapshot is not None
+        and snapshot['listing']['listing_id'] == str(booking.listing_id)
+        and snapshot['user']['user_id'] == booking.user_id
+    )
+
+
+def missing_snapshots(booking_ids):
+    """
+    Builds {booking_id: snapshot} for bookings that have none yet, with one query.
+    Used by the compact read path; nothing is written.
+    """
+    bookings = (
+        Booking.objects.filter(pk__in=booking_ids)
+        .select_related('listing', 'user')
+        .only(*SNAPSHOT_SOURCE_FIELDS)
+    )
+    return {booking.pk: build_snapshot(booking.listing, booking.user) for booking in bookings}
+
+
+def backfill_snapshots(batch_size=1000):
+    """
+    Fills Booking.snapshot for every booking that has none, batch_size rows per
+    bulk update. Returns the number of bookings updated.
+    """
+    updated = 0
+    while True:
+        batch = list(
+            Booking.objects.filter(snapshot__isnull=True)
+            .select_related('listing', 'user')
+            .only('snapshot', *SNAPSHOT_SOURCE_FIELDS)
+            .order_by('pk')[:batch_size]
+        )
+        if not batch:
+            return updated
+        for booking in batch:
+            booking.snapshot = build_snapshot(booking.listing, booking.user)
+        with transaction.atomic():
+            # bulk_update skips Booking.save(), so the occupancy table is not touched.
+            Booking.objects.bulk_update(batch, ['snapshot'])
+        updated += len(batch)
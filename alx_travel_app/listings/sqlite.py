@@ -0,0 +1,50 @@
+"""
+SQLite tuning for single-node deployments.
+
+Every new SQLite connection runs the SQLITE_PRAGMAS from settings (Django's
+`init_command` option; see the database section of settings.py):
+
+- journal_mode=WAL: readers no longer block the writer or each other, and the writer
+  no longer blocks readers (the rollback journal locks the whole file for a write)
+- synchronous=NORMAL: safe with WAL; fsyncs at checkpoints instead of every commit
+- mmap_size and cache_size: reads from the mapped file and a larger page cache
+- the busy timeout (SQLITE_BUSY_TIMEOUT): how long a writer waits for the lock
+
+WAL still allows one writer at a time. A deferred transaction (plain BEGIN) reads
+first and takes the write lock at its first write. If another connection committed in
+the meantime, SQLite fails that upgrade with `database is locked` right away, without
+waiting out the busy timeout. write_transaction() starts the transaction with
+BEGIN IMMEDIATE instead. The write lock is taken up front, and concurrent writers queue
+on the busy timeout. It is used for the read-then-write transactions on bookings,
+payments and the email outbox. On other databases it is plain transaction.atomic().
+
+Both `init_command` and the backend's `transaction_mode` are Django 5.1 features,
+hence the Django>=5.1 requirement.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    transaction.atomic() that takes SQLite's write lock when it begins (BEGIN IMMEDIATE).
+    Nested blocks are ordinary savepoints in the enclosing transaction.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block or not settings.SQLITE_IMMEDIATE_WRITES:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    connection.ensure_connection()  # Connecting resets transaction_mode from OPTIONS
+    configured = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = configured  # Only the BEGIN needed it
+            yield
+    finally:
+        connection.transaction_mode = configured
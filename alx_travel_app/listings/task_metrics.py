@@ -0,0 +1,114 @@
+"""
+Celery task instrumentation, recorded from Celery signals.
+
+- before_task_publish stamps each message with an `enqueued_at` header (wall clock).
+- task_prerun observes the queue wait: the time from enqueue to start. For a task
+  published with a countdown or ETA, the wait is measured from its ETA instead.
+- task_postrun observes the run time and counts the task's final state.
+- task_retry and task_failure count retries and failures.
+
+The metrics are the Shared* kind from listings/metrics.py. Values recorded in worker
+processes are added up in the cache and served by the web metrics endpoint.
+Connected from ListingsConfig.ready(), which runs in web and worker processes alike.
+"""
+import time
+from datetime import datetime
+
+from celery import current_app
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun, task_retry
+
+from .metrics import COUNT_BUCKETS, SharedCounter, SharedHistogram
+
+# Final states counted by task_postrun.
+TASK_STATES = ('SUCCESS', 'FAILURE', 'RETRY', 'IGNORED', 'REJECTED')
+# Outcomes counted for each confirmation email handled by flush_confirmation_emails.
+EMAIL_OUTCOMES = ('sent', 'retrying', 'failed', 'dropped')
+
+# Run times for this process's in-flight tasks, keyed by task id.
+_started = {}
+
+
+def task_names():
+    return sorted(name for name in current_app.tasks if not name.startswith('celery.'))
+
+
+TASK_QUEUE_WAIT = SharedHistogram(
+    'celery_task_queue_wait_seconds', 'Time from enqueue (or ETA) to the start of execution.', ['task'],
+    label_sets=lambda: [(name,) for name in task_names()])
+TASK_RUNTIME = SharedHistogram(
+    'celery_task_runtime_seconds', 'Task execution time.', ['task'],
+    label_sets=lambda: [(name,) for name in task_names()])
+TASK_RUNS = SharedCounter(
+    'celery_task_runs', 'Task executions by final state.', ['task', 'state'],
+    label_sets=lambda: [(name, state) for name in task_names() for state in TASK_STATES])
+TASK_RETRIES = SharedCounter(
+    'celery_task_retries', 'Retries requested by tasks.', ['task'],
+    label_sets=lambda: [(name,) for name in task_names()])
+TASK_FAILURES = SharedCounter(
+    'celery_task_failures', 'Task executions that raised.', ['task'],
+    label_sets=lambda: [(name,) for name in task_names()])
+CONFIRMATION_EMAILS = SharedCounter(
+    'confirmation_emails', 'Confirmation emails handled by flush_confirmation_emails, by outcome.', ['outcome'],
+    label_sets=lambda: [(outcome,) for outcome in EMAIL_OUTCOMES])
+CONFIRMATION_EMAIL_BATCH = SharedHistogram(
+    'confirmation_email_batch_size', 'Messages attempted per flush_confirmation_emails run.', [],
+    buckets=COUNT_BUCKETS, label_sets=lambda: [()])
+
+
+def record_email_outcomes(stats):
+    """
+    Counts a flush_outbox() result, so failed deliveries are visible even when the
+    task itself succeeds.
+    """
+    for outcome in EMAIL_OUTCOMES:
+        if stats[outcome]:
+            CONFIRMATION_EMAILS.inc(stats[outcome], outcome=outcome)
+    attempted = sum(stats[outcome] for outcome in EMAIL_OUTCOMES)
+    if attempted:
+        CONFIRMATION_EMAIL_BATCH.observe(attempted)
+
+
+def _eta_timestamp(eta):
+    if not eta:
+        return None
+    if isinstance(eta, str):
+        eta = datetime.fromisoformat(eta)
+    return eta.timestamp()
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+
+@task_prerun.connect
+def record_queue_wait(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+    request = task.request
+    # Custom message headers show up on the request itself, or under .headers on
+    # older protocol versions.
+    enqueued_at = getattr(request, 'enqueued_at', None) or (request.headers or {}).get('enqueued_at')
+    if enqueued_at is None:
+        return  # Called directly or eagerly: there was no queue
+    ready_at = max(float(enqueued_at), _eta_timestamp(request.eta) or 0)
+    TASK_QUEUE_WAIT.observe(max(0.0, time.time() - ready_at), task=task.name)
+
+
+@task_postrun.connect
+def record_runtime(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNTIME.observe(time.perf_counter() - started, task=task.name)
+    if state:
+        TASK_RUNS.inc(task=task.name, state=state)
+
+
+@task_retry.connect
+def record_retry(sender=None, **kwargs):
+    TASK_RETRIES.inc(task=sender.name)
+
+
+@task_failure.connect
+def record_failure(sender=None, **kwargs):
+    TASK_FAILURES.inc(task=sender.name)
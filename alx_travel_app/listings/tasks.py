@@ -1,98 +1,174 @@
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
-from .models import Payment, Booking
+from django.db import DatabaseError
+from django.db.models import F, Q
+from django.utils import timezone
+from .chapa import ChapaRejected, ChapaUnavailable, get_client
+from .emails import EmailDeliveryError, flush_outbox, queue_confirmation, queue_confirmations
+from .models import IdempotencyKey, Payment, Booking
+from .payments import apply_verification
+from .rollups import apply_queued_changes, compact_rollups
+from .task_metrics import record_email_outcomes
+from .textsearch import index_stats
 
-@shared_task
+# Queueing an email is one INSERT; a database hiccup is worth a few quick retries
+# rather than silently losing the confirmation.
+QUEUE_RETRY_OPTIONS = {
+    'autoretry_for': (DatabaseError,),
+    'retry_backoff': True,
+    'retry_backoff_max': 60,
+    'max_retries': 5,
+}
+
+
+@shared_task(**QUEUE_RETRY_OPTIONS)
 def send_payment_confirmation_email(payment_id):
     """
-    Send payment confirmation email to the user.
+    Queue a payment confirmation email for the user.
+    Delivery is batched by flush_confirmation_emails (see listings/emails.py).
     """
-    try:
-        payment = Payment.objects.get(payment_id=payment_id)
-        booking = payment.booking
-        user = booking.user
-        
-        subject = f"Payment Confirmation for Booking {booking.booking_id.hex[:8]}"
-        message = f"""
-        Hello {user.first_name or user.username},
-        
-        Your payment for booking {booking.listing.name} has been confirmed.
-        
-        Booking Details:
-        - Listing: {booking.listing.name}
-        - Dates: {booking.start_date} to {booking.end_date}
-        - Total Amount: {payment.amount} ETB
-        - Payment ID: {payment.payment_id}
-        
-        Thank you for using our service!
-        
-        Best regards,
-        ALX Travel Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'no-reply@alxtravel.com',
-            [user.email],
-            fail_silently=False,
+    queue_confirmation('payment_confirmation', payment_id)
+    return {'queued': 1, 'kind': 'payment_confirmation'}
+
+
+@shared_task(**QUEUE_RETRY_OPTIONS)
+def send_booking_confirmation_email(booking_id):
+    """
+    Queue a booking confirmation email for the user when a booking is created.
+    Delivery is batched by flush_confirmation_emails (see listings/emails.py).
+    """
+    queue_confirmation('booking_confirmation', booking_id)
+    return {'queued': 1, 'kind': 'booking_confirmation'}
+
+
+@shared_task(**QUEUE_RETRY_OPTIONS)
+def send_booking_confirmation_emails(booking_ids):
+    """
+    Queue booking confirmation emails for a group of bookings (bulk creation) in one task.
+    """
+    queue_confirmations('booking_confirmation', booking_ids)
+    return {'queued': len(booking_ids), 'kind': 'booking_confirmation'}
+
+
+@shared_task(bind=True, max_retries=None)
+def flush_confirmation_emails(self):
+    """
+    Send the confirmation emails that are due, in one batch over one mail connection.
+    Scheduled by queue_confirmation() and run periodically to pick up retries.
+
+    Fails with EmailDeliveryError if any message gave up for good, and retries (at the
+    time the earliest rescheduled message is due) if any send failed transiently.
+    Per-message attempts are bounded by CONFIRMATION_EMAIL_MAX_ATTEMPTS in the outbox.
+    """
+    stats = flush_outbox()
+    record_email_outcomes(stats)
+    if stats['remaining']:
+        # A backlog larger than one batch: keep draining without waiting for the window.
+        flush_confirmation_emails.delay()
+
+    result = {key: stats[key] for key in ('sent', 'retrying', 'failed', 'dropped')}
+    if stats['failed']:
+        raise EmailDeliveryError(f"{stats['failed']} confirmation emails failed permanently: {result}")
+    if stats['retrying']:
+        raise self.retry(
+            exc=EmailDeliveryError(f"{stats['retrying']} confirmation emails will be retried: {result}"),
+            countdown=stats['retry_in'],
         )
-        
-        return f"Confirmation email sent to {user.email}"
+    return result
+
+
+# Verification is idempotent (apply_verification only moves pending payments), so the
+# message is acknowledged after the run: a worker crash re-delivers it instead of losing it.
+@shared_task(bind=True, max_retries=5, acks_late=True, reject_on_worker_lost=True)
+def verify_payment_task(self, payment_id, expire=False):
+    """
+    Verify a payment with Chapa and apply the resulting status transition atomically.
+    Queued by the payment webhook and by the reconciliation sweep.
+    """
+    try:
+        response_data = get_client().verify(str(payment_id))
+    except ChapaUnavailable as exc:
+        # Back off exponentially: 30s, 60s, 120s, ... then fail with the last error.
+        raise self.retry(exc=exc, countdown=30 * (2 ** self.request.retries))
+    except ChapaRejected as exc:
+        if exc.status_code != 404:
+            raise  # e.g. a rejected API key says nothing about the payment; it stays pending
+        # Chapa has no such transaction (yet): the state is unknown, so the payment
+        # stays pending until it expires.
+        response_data = {}
+    # Any other ChapaError (an unexpected gateway response) propagates and fails the task;
+    # the reconciliation sweep will try the payment again later.
+
+    try:
+        new_status = apply_verification(payment_id, response_data, expire=expire)
     except Payment.DoesNotExist:
-        return f"Payment with ID {payment_id} does not exist"
-    except Exception as e:
-        return f"Failed to send email: {str(e)}"
+        # Deleted since it was queued: nothing to verify, and retrying cannot help.
+        return {'payment_id': str(payment_id), 'status': None}
+    return {'payment_id': str(payment_id), 'status': new_status}
+
+
+@shared_task(acks_late=True)
+def reconcile_pending_payments(batch_size=None):
+    """
+    Periodic sweep for payments whose webhook never arrived (or was lost).
+    Queues verification for one batch of stale pending payments per run, least recently
+    checked first, and stamps them with last_reconciled_at. A payment the gateway still
+    reports as pending is checked again PAYMENT_RECONCILE_AFTER later, behind the ones
+    not checked yet, so a backlog of them cannot starve newer payments.
+    Payments pending longer than PAYMENT_PENDING_EXPIRY are failed if still unpaid.
+    """
+    batch_size = batch_size or settings.PAYMENT_RECONCILE_BATCH_SIZE
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.PAYMENT_RECONCILE_AFTER)
+    expire_before = now - timedelta(seconds=settings.PAYMENT_PENDING_EXPIRY)
+
+    stale = list(
+        Payment.objects.filter(status='pending', created_at__lt=stale_before)
+        .filter(Q(last_reconciled_at__isnull=True) | Q(last_reconciled_at__lt=stale_before))
+        .order_by(F('last_reconciled_at').asc(nulls_first=True), 'created_at')
+        .values_list('payment_id', 'created_at')[:batch_size]
+    )
+    Payment.objects.filter(pk__in=[payment_id for payment_id, _ in stale]).update(last_reconciled_at=now)
+    for payment_id, created_at in stale:
+        verify_payment_task.delay(str(payment_id), expire=created_at < expire_before)
+    return {'queued': len(stale)}
 
 
 @shared_task
-def send_booking_confirmation_email(booking_id):
+def refresh_search_stats():
     """
-    Send booking confirmation email to the user when a booking is created.
+    Recounts the full-text search corpus stats (see listings/textsearch.py), so the
+    aggregate over the whole index runs here on beat instead of in a search request.
     """
-    try:
-        booking = Booking.objects.get(booking_id=booking_id)
-        user = booking.user
-        listing = booking.listing
-        
-        subject = f"Booking Confirmation - {listing.name}"
-        message = f"""
-        Hello {user.first_name or user.username or 'Valued Customer'},
-        
-        Your booking has been successfully created!
-        
-        Booking Details:
-        - Booking ID: {booking.booking_id}
-        - Listing: {listing.name}
-        - Location: {listing.location}
-        - Check-in: {booking.start_date}
-        - Check-out: {booking.end_date}
-        - Total Price: ${booking.total_price}
-        - Status: {booking.get_status_display()}
-        
-        Host Information:
-        - Host: {listing.host.first_name or listing.host.username or 'Host'}
-        - Contact: {listing.host.email}
-        
-        We'll send you another confirmation once your payment is processed.
-        
-        Thank you for choosing ALX Travel!
-        
-        Best regards,
-        ALX Travel Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
-        
-        return f"Booking confirmation email sent to {user.email}"
-    except Booking.DoesNotExist:
-        return f"Booking with ID {booking_id} does not exist"
-    except Exception as e:
-        return f"Failed to send booking confirmation email: {str(e)}"
\ No newline at end of file
+    documents, avg_length = index_stats(refresh=True)
+    return {'documents': documents, 'avg_length': avg_length}
+
+
+@shared_task
+def purge_idempotency_keys():
+    """
+    Deletes the Idempotency-Key entries whose TTL has passed (see listings/idempotency.py).
+    """
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return {'deleted': deleted}
+
+
+@shared_task
+def refresh_listing_rollups(batch_size=None):
+    """
+    Applies the queued booking, payment and review changes to the host stats rollups
+    (see listings/rollups.py). Runs every minute; a backlog larger than one batch is
+    worked through by the following runs.
+    """
+    return {'applied': apply_queued_changes(batch_size)}
+
+
+@shared_task
+def compact_listing_rollups():
+    """
+    Nightly: merges daily rollups older than ROLLUP_DAILY_DAYS into monthly rows.
+    """
+    compacted, moved = compact_rollups()
+    return {'compacted': compacted, 'moved': moved}
@@ -1,7 +1,56 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core import mail
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.mail.backends import locmem
+from django.utils import timezone
+from django.test import RequestFactory, TestCase, override_settings
 from django.contrib.auth import get_user_model
-from .models import Listing, Booking, Payment
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APITestCase, APITransactionTestCase
+from asgiref.sync import async_to_sync
+from .availability import BookingOverlapError
+from .chapa import AsyncChapaClient, ChapaClient, ChapaRejected, ChapaUnavailable, CircuitBreaker
+from .fake_chapa import FakeChapaServer
+from .models import (
+    Listing, ListingStatsChange, ListingStatsRollup, ListingTerm, Booking, EmailOutbox, IdempotencyKey, OccupiedNight,
+    Payment, PricingRule, Review,
+)
+from .pagination import ListingPagination
+from .emails import EmailDeliveryError, flush_outbox
+from . import fastpath
+from .renderers import FastJSONRenderer
+from .replicas import PIN_COOKIE, PrimaryReplicaRouter, replica_reads
+from .sqlite import write_transaction
+from . import geo, idempotency, pricing, rollups, textsearch
+from .serializers import BookingSerializer, CompactBookingSerializer, ListingSerializer, PaymentSerializer
+from . import emails
+from .middleware import RequestMetricsMiddleware
+from . import metrics
+from . import task_metrics
+from .benchmarks import BENCHMARK_NAMES, compare_results, run_benchmarks, seed_data
+from .tasks import (
+    compact_listing_rollups, flush_confirmation_emails, purge_idempotency_keys, reconcile_pending_payments,
+    refresh_listing_rollups, refresh_search_stats, send_booking_confirmation_email, send_payment_confirmation_email, verify_payment_task,
+)
+import base64
+import hashlib
+import hmac
+import json
+import time
+import math
+import os
+import tempfile
 import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
 User = get_user_model()
 
@@ -55,3 +104,1945 @@ class PaymentModelTest(TestCase):
         
         expected_str = f"Payment {payment.payment_id.hex[:8]} for Booking {self.booking.booking_id.hex[:8]} - completed"
         self.assertEqual(str(payment), expected_str)
+
+
+class RatingAggregatesTest(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com')
+        self.guests = [
+            User.objects.create_user(username=f'guest{i}', email=f'guest{i}@example.com')
+            for i in range(3)
+        ]
+        self.listing = Listing.objects.create(
+            host=self.host,
+            name='Rated Listing',
+            description='Test description',
+            location='Nairobi',
+            pricepernight=80.00
+        )
+
+    def review(self, guest, rating, listing=None):
+        return Review.objects.create(listing=listing or self.listing, user=guest, rating=rating, comment='ok')
+
+    def test_created_reviews_update_aggregates(self):
+        """Test that creating reviews increments the stored aggregates"""
+        self.review(self.guests[0], 5)
+        self.review(self.guests[1], 4)
+        self.listing.refresh_from_db()
+
+        self.assertEqual(self.listing.review_count, 2)
+        self.assertEqual(self.listing.rating_sum, 9)
+        self.assertEqual(self.listing.average_rating, 4.5)
+        self.assertEqual(self.listing.rating_histogram, {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1})
+
+    def test_edited_and_deleted_reviews_update_aggregates(self):
+        """Test that editing and deleting a review applies the exact delta"""
+        review = self.review(self.guests[0], 2)
+        self.review(self.guests[1], 4)
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 5
+        review.save()
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.review_count, self.listing.rating_sum), (2, 9))
+        self.assertEqual(self.listing.rating_2_count, 0)
+        self.assertEqual(self.listing.rating_5_count, 1)
+
+        review.delete()
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.review_count, self.listing.rating_sum), (1, 4))
+        self.assertEqual(self.listing.average_rating, 4.0)
+
+    def test_moving_an_unloaded_review_rebuilds_both_listings(self):
+        """Test that a review saved without its loaded values is removed from its old listing"""
+        other = Listing.objects.create(host=self.host, name='Other Listing', description='d',
+                                       location='Nairobi', pricepernight=60)
+        review = self.review(self.guests[0], 4)
+        self.review(self.guests[1], 2)
+
+        # force_update: Django inserts an unsaved instance whose primary key has a default.
+        Review(pk=review.pk, listing=other, user=self.guests[0], rating=5, comment='moved',
+               created_at=review.created_at).save(force_update=True)
+        self.listing.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.listing.review_count, self.listing.rating_sum), (1, 2))
+        self.assertEqual(self.listing.rating_4_count, 0)
+        self.assertEqual((other.review_count, other.rating_sum), (1, 5))
+
+    def test_rebuild_command_restores_aggregates(self):
+        """Test that the rebuild command recomputes aggregates from scratch"""
+        self.review(self.guests[0], 3)
+        self.review(self.guests[1], 1)
+        Listing.objects.update(review_count=0, rating_sum=0, rating_1_count=7)
+
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.listing.refresh_from_db()
+
+        self.assertEqual((self.listing.review_count, self.listing.rating_sum), (2, 4))
+        self.assertEqual(self.listing.rating_histogram, {'1': 1, '2': 0, '3': 1, '4': 0, '5': 0})
+
+
+class ListingEndpointQueryCountTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def create_listings(self, count):
+        # Run the on-commit cache invalidation the test transaction would otherwise swallow.
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_listings(count)
+
+    def _create_listings(self, count):
+        for i in range(count):
+            host = User.objects.create_user(username=f'qhost{uuid.uuid4().hex[:8]}')
+            listing = Listing.objects.create(
+                host=host,
+                name=f'Listing {i}',
+                description='Test description',
+                location='Mombasa',
+                pricepernight=120.00
+            )
+            Review.objects.create(listing=listing, user=host, rating=4, comment='nice')
+
+    def list_query_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/listings/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_listing_list_uses_constant_queries(self):
+        """Test that the listing endpoint query count does not grow with the number of listings"""
+        self.create_listings(3)
+        small, _ = self.list_query_count()
+        self.create_listings(12)
+        large, response = self.list_query_count()
+
+        self.assertEqual(small, large)
+        self.assertEqual(response.json()['results'][0]['average_rating'], 4.0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTest(APITestCase):
+    """
+    Query-count regression suite: every list/retrieve endpoint must stay within a fixed
+    budget no matter how many rows it renders. The response cache is disabled so the
+    budgets cover the uncached path.
+    """
+    QUERY_BUDGETS = {
+        'listing-list': 1,
+        'listing-detail': 1,
+        'booking-list': 1,
+        'booking-detail': 1,
+        'booking-list-compact': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.listings = []
+        cls.bookings = []
+        for i in range(10):
+            host = User.objects.create_user(username=f'bhost{i}', email=f'bhost{i}@example.com')
+            guest = User.objects.create_user(username=f'bguest{i}', email=f'bguest{i}@example.com')
+            listing = Listing.objects.create(
+                host=host,
+                name=f'Budget Listing {i}',
+                description='Test description',
+                location='Kisumu',
+                pricepernight=90.00
+            )
+            Review.objects.create(listing=listing, user=guest, rating=3, comment='fine')
+            cls.listings.append(listing)
+            cls.bookings.append(Booking.objects.create(
+                listing=listing,
+                user=guest,
+                start_date='2024-03-01',
+                end_date='2024-03-04',
+                total_price=270.00
+            ))
+
+    def assertWithinBudget(self, name, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx.captured_queries), self.QUERY_BUDGETS[name],
+            f"{name} exceeded its query budget:\n" + "\n".join(q['sql'] for q in ctx.captured_queries)
+        )
+        return response
+
+    def test_listing_list_budget(self):
+        """Test that listing the listings stays within budget"""
+        response = self.assertWithinBudget('listing-list', '/api/listings/')
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_listing_detail_budget(self):
+        """Test that retrieving a listing stays within budget"""
+        response = self.assertWithinBudget('listing-detail', f'/api/listings/{self.listings[0].pk}/')
+        self.assertEqual(response.json()['host']['email'], 'bhost0@example.com')
+
+    def test_booking_list_budget(self):
+        """Test that listing the bookings stays within budget"""
+        response = self.assertWithinBudget('booking-list', '/api/bookings/')
+        self.assertEqual({b['listing']['location'] for b in response.json()['results']}, {'Kisumu'})
+
+    def test_booking_detail_budget(self):
+        """Test that retrieving a booking stays within budget"""
+        response = self.assertWithinBudget('booking-detail', f'/api/bookings/{self.bookings[0].pk}/')
+        self.assertEqual(response.json()['user']['email'], 'bguest0@example.com')
+
+
+    def test_compact_booking_list_budget(self):
+        """Test that the compact booking list stays within budget without joining"""
+        response = self.assertWithinBudget('booking-list-compact', '/api/bookings/?compact=true')
+        self.assertEqual({b['listing']['location'] for b in response.json()['results']}, {'Kisumu'})
+
+
+class BookingSnapshotTest(APITestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='shost', email='shost@example.com')
+        self.guest = User.objects.create_user(username='sguest', email='sguest@example.com', first_name='Sami')
+        self.listing = Listing.objects.create(host=self.host, name='Snapshotted', description='d',
+                                              location='Malindi', pricepernight=75)
+        for i in range(3):
+            Booking.objects.create(listing=self.listing, user=self.guest, start_date=f'2025-06-{1 + 3 * i:02d}',
+                                   end_date=f'2025-06-{2 + 3 * i:02d}', total_price=75)
+
+    def get_both(self, url):
+        full = self.client.get(url, HTTP_ACCEPT='application/json')
+        with CaptureQueriesContext(connection) as ctx:
+            compact = self.client.get(url + '?compact=true', HTTP_ACCEPT='application/json')
+        return full.json(), compact.json(), [q['sql'] for q in ctx.captured_queries]
+
+    def test_compact_mode_matches_full_representation(self):
+        """Test that ?compact=true renders the same bookings from the snapshot, with no join"""
+        booking = Booking.objects.first()
+        self.assertEqual(booking.snapshot['listing']['name'], 'Snapshotted')
+        self.assertEqual(booking.snapshot['user']['first_name'], 'Sami')
+
+        full, compact, queries = self.get_both('/api/bookings/')
+        self.assertEqual(compact, full)
+        self.assertFalse([sql for sql in queries if 'JOIN' in sql])
+
+        full, compact, _ = self.get_both(f'/api/bookings/{booking.pk}/')
+        self.assertEqual(compact, full)
+
+    def test_rows_without_snapshot_render_and_backfill(self):
+        """Test that pre-snapshot rows render in one extra query and are filled by the backfill command"""
+        Booking.objects.update(snapshot=None)
+        full, compact, queries = self.get_both('/api/bookings/')
+        self.assertEqual(compact, full)
+        self.assertEqual(len(queries), 2)  # The page, then one batched lookup for the missing snapshots
+
+        out = StringIO()
+        call_command('backfill_booking_snapshots', '--batch-size', '2', stdout=out)
+        self.assertIn('Filled snapshots on 3 bookings', out.getvalue())
+        self.assertFalse(Booking.objects.filter(snapshot__isnull=True).exists())
+
+    def test_snapshot_follows_a_moved_booking(self):
+        """Test that moving a booking to another listing refreshes its snapshot"""
+        other = Listing.objects.create(host=self.host, name='Elsewhere', description='d',
+                                       location='Kisumu', pricepernight=40)
+        booking = Booking.objects.first()
+        booking.listing = other
+        booking.save()
+        booking.refresh_from_db()
+        self.assertEqual(booking.snapshot['listing'], {
+            'listing_id': str(other.pk), 'name': 'Elsewhere', 'location': 'Kisumu', 'pricepernight': '40.00',
+        })
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class FastReadPathGoldenTest(APITestCase):
+    """
+    The fast read path (listings/fastpath.py) must render byte-identical responses to the
+    regular serializers, so every list endpoint is fetched both ways and compared.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user(username='ghost', email='ghost@example.com', first_name='Zoë',
+                                        last_name='O\u2028Brien')
+        guest = User.objects.create_user(username='gguest', email='gguest@example.com')
+        for i in range(4):
+            listing = Listing.objects.create(
+                host=host, name=f'Golden \u00e9t\u00e9 {i} "quoted"', description='Line one\nline two \U0001F3D6',
+                location='Mombasa', pricepernight=Decimal('99.5') + i,
+                # Coordinates on every other listing, so both floats and nulls are rendered
+                latitude=-4.0435 + i / 300 if i % 2 else None, longitude=39.6682 if i % 2 else None,
+            )
+            for j in range(i):  # 0 to 3 reviews, so averages include None and repeating decimals
+                reviewer = User.objects.create_user(username=f'greviewer{i}-{j}')
+                Review.objects.create(listing=listing, user=reviewer, rating=5 - j, comment='ok')
+            booking = Booking.objects.create(listing=listing, user=guest, start_date=f'2025-07-{1 + i:02d}',
+                                             end_date=f'2025-07-{2 + i:02d}', total_price=listing.pricepernight)
+            Payment.objects.create(booking=booking, amount=booking.total_price)
+        Booking.objects.filter(listing__name__endswith='1 "quoted"').update(snapshot=None)  # Pre-backfill row
+
+    def assertSameBytes(self, url):
+        with override_settings(FAST_READ_SERIALIZERS=False):
+            expected = self.client.get(url, HTTP_ACCEPT='application/json')
+        actual = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(actual.status_code, 200)
+        self.assertEqual(actual.content, expected.content)
+        return actual
+
+    def test_list_endpoints_are_byte_identical(self):
+        """Test that listings, both searches and bookings (full and compact) render the same bytes"""
+        # Both paths would trivially agree if a serializer silently fell back to DRF.
+        for serializer_class in (ListingSerializer, BookingSerializer, CompactBookingSerializer):
+            self.assertIsNotNone(fastpath.reader_for_serializer(serializer_class), serializer_class)
+
+        expected_counts = {
+            '/api/listings/': 4, '/api/listings/?page_size=2': 2, '/api/listings/search/?location=Mombasa': 4,
+            '/api/listings/?q=golden': 4, '/api/listings/?near=-4.04,39.67&radius=5': 2, '/api/bookings/': 4,
+            '/api/bookings/?compact=true': 4, '/api/bookings/?page_size=3': 3,
+        }
+        for url, count in expected_counts.items():
+            with self.subTest(url=url):
+                response = self.assertSameBytes(url)
+                self.assertEqual(len(response.json()['results']), count)
+
+        # The next cursor encodes the same boundary from a .values() row.
+        next_url = self.assertSameBytes('/api/bookings/?page_size=3').json()['next']
+        self.assertSameBytes(next_url.replace('http://testserver', ''))
+
+    def test_payment_serializer_is_byte_identical(self):
+        """Test that the compiled PaymentSerializer matches the serializer through both renderers"""
+        queryset = Payment.objects.order_by('created_at')
+        reader = fastpath.RowReader(PaymentSerializer)
+        expected = JSONRenderer().render(PaymentSerializer(queryset, many=True).data)
+        self.assertEqual(FastJSONRenderer().render(reader.render(reader.values(queryset))), expected)
+
+    def test_renderer_matches_json_renderer(self):
+        """Test that FastJSONRenderer's bytes match JSONRenderer's for awkward values"""
+        data = {'text': 'caf\u00e9 \u2028 \u2029 \x00 "q" \\', 'uuid': uuid.uuid4(), 'price': Decimal('1.50'),
+                'when': timezone.now(), 'day': date(2025, 1, 2), 'float': 4.67, 'none': None, 1: [True, False]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        # Indented output (e.g. the browsable API) is delegated to JSONRenderer.
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user(username='phost', email='phost@example.com')
+        for i in range(7):
+            Listing.objects.create(
+                host=host,
+                name=f'Paged Listing {i}',
+                description='Test description',
+                location='Nakuru',
+                pricepernight=60.00
+            )
+        # Force timestamp ties so the pk tie-breaker is exercised.
+        tied = list(Listing.objects.values_list('pk', flat=True)[:4])
+        Listing.objects.filter(pk__in=tied).update(created_at=Listing.objects.get(pk=tied[0]).created_at)
+
+    def fetch(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_walk_returns_every_row_once_in_order(self):
+        """Test that following next links visits every listing once in (-created_at, -pk) order"""
+        seen = []
+        url = '/api/listings/?page_size=3'
+        while url:
+            page = self.fetch(url)
+            self.assertLessEqual(len(page['results']), 3)
+            seen.extend(row['listing_id'] for row in page['results'])
+            url = page['next']
+
+        expected = [str(pk) for pk in Listing.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)]
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_returns_prior_page(self):
+        """Test that the previous link of page 2 returns page 1"""
+        first = self.fetch('/api/listings/?page_size=3')
+        second = self.fetch(first['next'])
+        self.assertIsNone(first['previous'])
+        self.assertEqual(self.fetch(second['previous'])['results'], first['results'])
+
+    def test_page_size_is_capped(self):
+        """Test that page_size cannot exceed the configured maximum"""
+        with mock.patch.object(ListingPagination, 'max_page_size', 2):
+            page = self.fetch('/api/listings/?page_size=50')
+        self.assertEqual(len(page['results']), 2)
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test that a tampered cursor returns 404"""
+        response = self.client.get('/api/listings/?cursor=not-a-cursor', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 404)
+
+        # Well-formed tokens with a bad key or direction are rejected the same way.
+        def token(**payload):
+            payload = {'c': '2024-01-01T00:00:00+00:00', 'k': str(uuid.uuid4()), 'd': 'n', **payload}
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        for bad in (token(k='zzz'), token(k=5), token(d='x')):
+            for url in ('/api/listings/', '/api/bookings/'):
+                response = self.client.get(url, {'cursor': bad}, HTTP_ACCEPT='application/json')
+                self.assertEqual(response.status_code, 404, (url, bad))
+
+
+@mock.patch('listings.views.send_booking_confirmation_email')
+class AvailabilityTest(APITestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='ahost', email='ahost@example.com')
+        self.guest = User.objects.create_user(username='aguest', email='aguest@example.com')
+        self.listing = Listing.objects.create(
+            host=self.host,
+            name='Available Listing',
+            description='Test description',
+            location='Malindi',
+            pricepernight=50.00
+        )
+
+    def book(self, start_date, end_date):
+        return self.client.post('/api/bookings/', {
+            'listing_id': str(self.listing.pk),
+            'user_id': self.guest.pk,
+            'start_date': start_date,
+            'end_date': end_date,
+        }, format='json')
+
+    def test_booking_claims_nights_and_rejects_overlaps(self, send_email):
+        """Test that an overlapping booking is rejected and nothing is written for it"""
+        first = self.book('2024-05-01', '2024-05-04')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.json()['total_price'], '150.00')
+        self.assertEqual(OccupiedNight.objects.filter(listing=self.listing).count(), 3)
+
+        overlapping = self.book('2024-05-03', '2024-05-06')
+        self.assertEqual(overlapping.status_code, 400)
+        self.assertEqual(overlapping.json()['unavailable_nights'], ['2024-05-03'])
+        self.assertEqual(Booking.objects.filter(listing=self.listing).count(), 1)
+
+        # Check-out day is free for the next check-in.
+        self.assertEqual(self.book('2024-05-04', '2024-05-06').status_code, 201)
+        self.assertEqual(send_email.delay.call_count, 2)
+
+    def test_canceling_releases_nights(self, send_email):
+        """Test that canceling a booking frees its nights for new bookings"""
+        booking = Booking.objects.get(pk=self.book('2024-06-10', '2024-06-12').json()['booking_id'])
+        booking.status = 'canceled'
+        booking.save()
+
+        self.assertFalse(OccupiedNight.objects.filter(booking=booking).exists())
+        self.assertEqual(self.book('2024-06-10', '2024-06-12').status_code, 201)
+
+    def test_direct_overlapping_save_raises(self, send_email):
+        """Test that the model layer enforces the constraint outside the API too"""
+        Booking.objects.create(listing=self.listing, user=self.guest, start_date='2024-07-01',
+                               end_date='2024-07-05', total_price=200.00)
+        with self.assertRaises(BookingOverlapError):
+            Booking.objects.create(listing=self.listing, user=self.guest, start_date='2024-07-04',
+                                   end_date='2024-07-06', total_price=100.00)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_availability_endpoint_reads_index_only(self, send_email):
+        """Test that the availability endpoint reports booked nights without querying Booking"""
+        self.book('2024-08-02', '2024-08-04')
+        url = f'/api/listings/{self.listing.pk}/availability/?from=2024-08-01&to=2024-08-05'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['booked_nights'], ['2024-08-02', '2024-08-03'])
+        self.assertFalse(response.json()['available'])
+        self.assertFalse(any('listings_booking' in q['sql'] for q in ctx.captured_queries))
+
+    def test_availability_endpoint_validates_range(self, send_email):
+        """Test that missing or inverted ranges are rejected"""
+        url = f'/api/listings/{self.listing.pk}/availability/'
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url + '?from=2024-08-05&to=2024-08-01').status_code, 400)
+
+
+@mock.patch('listings.views.send_booking_confirmation_email')
+@mock.patch('listings.views.send_booking_confirmation_emails')
+class PricingTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create_user(username='phost', email='phost@example.com')
+        self.guest = User.objects.create_user(username='pguest', email='pguest@example.com')
+        self.listing = Listing.objects.create(host=self.host, name='Priced', description='d', location='Lamu',
+                                              pricepernight=Decimal('100.00'))
+        # A Monday a few weeks out, inside the price calendar
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=21 - today.weekday())
+        self.season_start = self.monday + timedelta(days=14)
+        rule = lambda **fields: PricingRule.objects.create(listing=self.listing, **fields)
+        rule(name='Weekends', weekdays='45', multiplier=Decimal('1.25'))  # Friday and Saturday nights
+        rule(name='High season', start_date=self.season_start, end_date=self.season_start + timedelta(days=7),
+             multiplier=Decimal('1.5'))
+        rule(kind='length_of_stay', min_nights=7, discount_percent=Decimal('10'))
+        rule(kind='length_of_stay', min_nights=28, discount_percent=Decimal('20'))
+
+    def quote(self, start, end, listing_id=None):
+        return self.client.get(f'/api/listings/{listing_id or self.listing.pk}/quote/',
+                               {'from': str(start), 'to': str(end)}, HTTP_ACCEPT='application/json')
+
+    def test_rules_price_nights_and_discount_stays(self, *mocks):
+        """Test that weekday and seasonal multipliers compound and the best stay discount applies"""
+        quote = pricing.quote_stay(self.listing.pk, self.monday, self.monday + timedelta(days=3))
+        self.assertEqual((quote['nights'], quote['total_price']), (3, Decimal('300.00')))
+        friday = self.monday + timedelta(days=4)
+        self.assertEqual(pricing.quote_stay(self.listing.pk, friday, friday + timedelta(days=3))['subtotal'],
+                         Decimal('350.00'))  # 125 + 125 + 100
+
+        week = pricing.quote_stay(self.listing.pk, self.monday, self.monday + timedelta(days=7))
+        self.assertEqual((week['subtotal'], week['discount_percent'], week['total_price']),
+                         (Decimal('750.00'), Decimal('10'), Decimal('675.00')))
+        # High season week: 5 x 150 + 2 x 187.50 (weekend x season), then 10% off
+        season = pricing.quote_stay(self.listing.pk, self.season_start, self.season_start + timedelta(days=7))
+        self.assertEqual((season['subtotal'], season['total_price']), (Decimal('1125.00'), Decimal('1012.50')))
+        month = pricing.quote_stay(self.listing.pk, self.monday, self.monday + timedelta(days=28))
+        self.assertEqual(month['discount_percent'], Decimal('20'))
+
+    def test_calendar_matches_the_rule_loop(self, *mocks):
+        """Test that calendar slices price every stay like evaluating the rules night by night"""
+        calendar = pricing.calendars_for([self.listing.pk])[self.listing.pk]
+        loop = pricing.PriceCalendar(calendar.price_cents, calendar.nightly_rules, calendar.discounts,
+                                     calendar.first_night)  # No precomputed nights
+        horizon = date.fromordinal(calendar.first_night + settings.PRICE_CALENDAR_DAYS)
+        starts = [self.monday - timedelta(days=60), self.monday, self.season_start - timedelta(days=3),
+                  horizon - timedelta(days=10)]  # Past nights, the calendar, and beyond the horizon
+        for start in starts:
+            for nights in (1, 2, 6, 7, 13, 30, 90):
+                end = start + timedelta(days=nights)
+                with self.subTest(start=start, nights=nights):
+                    self.assertEqual(calendar.quote(start, end), loop.quote(start, end))
+
+    def test_quote_endpoint(self, *mocks):
+        """Test that quotes are served from the cached calendar and report the discount"""
+        response = self.quote(self.monday, self.monday + timedelta(days=7))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'listing_id': str(self.listing.pk), 'from': str(self.monday), 'to': str(self.monday + timedelta(days=7)),
+            'nights': 7, 'subtotal': '750.00', 'discount_percent': '10.00', 'discount': '75.00',
+            'total_price': '675.00',
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(self.quote(self.monday, self.monday + timedelta(days=300)).status_code, 200)
+
+        self.assertEqual(self.quote(self.monday, self.monday).status_code, 400)
+        self.assertEqual(self.quote(self.monday, self.monday + timedelta(days=1), uuid.uuid4()).status_code, 404)
+        self.assertEqual(self.quote(self.monday, self.monday + timedelta(days=1), 'not-a-uuid').status_code, 404)
+
+    def test_bookings_are_priced_by_the_rules(self, send_emails, send_email):
+        """Test that single and bulk bookings cost what the quote says"""
+        friday = self.monday + timedelta(days=4)
+        response = self.client.post('/api/bookings/', {
+            'listing_id': str(self.listing.pk), 'user_id': self.guest.pk,
+            'start_date': str(friday), 'end_date': str(friday + timedelta(days=2)),
+        }, format='json')
+        self.assertEqual(response.json()['total_price'], '250.00')
+
+        start = self.monday + timedelta(days=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/bookings/bulk/', [{
+                'listing_id': str(self.listing.pk), 'user_id': self.guest.pk,
+                'start_date': str(start), 'end_date': str(start + timedelta(days=7)),
+            }], format='json')
+        self.assertEqual(response.json()['created'][0]['total_price'], '675.00')
+
+    def test_rule_and_price_changes_rebuild_the_calendar(self, *mocks):
+        """Test that editing rules or the nightly price invalidates the cached calendar"""
+        stay = (self.monday, self.monday + timedelta(days=1))
+        self.assertEqual(self.quote(*stay).json()['total_price'], '100.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            PricingRule.objects.create(listing=self.listing, start_date=self.monday, multiplier=Decimal('2'))
+        self.assertEqual(self.quote(*stay).json()['total_price'], '200.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.pricepernight = Decimal('80.00')
+            self.listing.save(update_fields=['pricepernight'])
+        self.assertEqual(self.quote(*stay).json()['total_price'], '160.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.delete()
+        self.assertEqual(self.quote(*stay).status_code, 404)
+
+    def test_rule_validation(self, *mocks):
+        """Test that rules reject inverted ranges and dates on length-of-stay discounts"""
+        with self.assertRaises(DjangoValidationError):
+            PricingRule(listing=self.listing, start_date=self.monday, end_date=self.monday).full_clean()
+        with self.assertRaises(DjangoValidationError):
+            PricingRule(listing=self.listing, kind='length_of_stay', weekdays='5', discount_percent=5).full_clean()
+        with self.assertRaises(DjangoValidationError):
+            PricingRule(listing=self.listing, weekdays='7').full_clean()
+
+
+class ListingSearchTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user(username='shost', email='shost@example.com')
+        cls.cheap = Listing.objects.create(host=host, name='Cheap', description='d', location='Eldoret', pricepernight=40)
+        cls.mid = Listing.objects.create(host=host, name='Mid', description='d', location='Eldoret', pricepernight=120)
+        cls.booked = Listing.objects.create(host=host, name='Booked', description='d', location='Eldoret', pricepernight=130)
+        cls.elsewhere = Listing.objects.create(host=host, name='Far', description='d', location='Nairobi', pricepernight=120)
+        Booking.objects.create(listing=cls.booked, user=host, start_date='2024-09-10',
+                               end_date='2024-09-15', total_price=650)
+
+    def search(self, **params):
+        response = self.client.get('/api/listings/search/', params, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return {row['name'] for row in response.json()['results']}
+
+    def test_combined_filters(self):
+        """Test that location, price band and free dates are all applied"""
+        self.assertEqual(
+            self.search(location='Eldoret', min_price=100, max_price=200, **{'from': '2024-09-12', 'to': '2024-09-14'}),
+            {'Mid'}
+        )
+
+    def test_dates_outside_bookings_match(self):
+        """Test that a listing is returned when the stay starts on the previous check-out day"""
+        self.assertEqual(
+            self.search(location='Eldoret', min_price=100, **{'from': '2024-09-15', 'to': '2024-09-17'}),
+            {'Mid', 'Booked'}
+        )
+
+    def test_search_is_a_single_query(self):
+        """Test that the whole search runs as one query"""
+        with self.assertNumQueries(1):
+            self.search(location='Eldoret', **{'from': '2024-09-12', 'to': '2024-09-14'})
+
+    def test_invalid_parameters_are_rejected(self):
+        """Test that malformed prices and dates return 400"""
+        self.assertEqual(self.client.get('/api/listings/search/?min_price=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/listings/search/?from=2024-09-12').status_code, 400)
+
+
+class FullTextSearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user(username='fthost', email='fthost@example.com')
+        make = lambda name, description, location: Listing.objects.create(
+            host=cls.host, name=name, description=description, location=location, pricepernight=100)
+        cls.loft = make('Harbour Loft', 'A quiet loft above the old harbour.', 'Mombasa')
+        cls.villa = make('Garden Villa', 'Villa near the harbour with a pool and a garden.', 'Mombasa')
+        cls.cabin = make('Lake Cabin', 'Wooden cabin by the lake.', 'Naivasha')
+        cls.studio = make('Café Studio', 'Studio flat in the city centre.', 'Nairóbi')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/listings/', {'q': q, **params}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def names(self, q, **params):
+        return [row['name'] for row in self.search(q, **params).json()['results']]
+
+    def test_tokenizer_folds_case_and_accents_and_drops_stopwords(self):
+        """Test that text is split into lowercase, accent-free terms without stopwords"""
+        self.assertEqual(textsearch.tokenize('The CAFÉ in Nairóbi, by_the-lake 24/7'),
+                         ['cafe', 'nairobi', 'lake', '24', '7'])
+
+    def test_index_follows_listing_saves(self):
+        """Test that saving a listing re-indexes its text and deleting it drops its terms"""
+        terms = dict(ListingTerm.objects.filter(listing=self.loft).values_list('term', 'frequency'))
+        self.assertEqual(terms['loft'], 3 + 1)  # Once in the name, once in the description
+        self.assertEqual(terms['mombasa'], 2)
+
+        self.loft.name = 'Harbour Penthouse'
+        self.loft.save()
+        self.assertEqual(self.names('penthouse'), ['Harbour Penthouse'])
+        self.loft.delete()
+        self.assertFalse(ListingTerm.objects.filter(term='penthouse').exists())
+
+        # Saves that don't touch the indexed fields leave the index alone.
+        with self.assertNumQueries(1):
+            self.cabin.save(update_fields=['pricepernight'])
+
+    def test_results_are_ranked_and_every_word_must_match(self):
+        """Test that name matches outrank description matches and all query words are required"""
+        self.assertEqual(self.names('harbour'), ['Harbour Loft', 'Garden Villa'])
+        self.assertEqual(self.names('harbour pool'), ['Garden Villa'])
+        self.assertEqual(self.names('harbour lake'), [])
+        self.assertEqual(self.names('cafe nairobi'), ['Café Studio'])
+
+    def test_prefix_matching(self):
+        """Test that a query word matches the longer terms it starts with"""
+        self.assertEqual(set(self.names('nai')), {'Lake Cabin', 'Café Studio'})
+        self.assertEqual(self.names('ha'), [])  # Below SEARCH_MIN_PREFIX: whole terms only
+
+    def test_one_term_can_match_words_that_prefix_each_other(self):
+        """Test that a term matching several query words counts for each of them"""
+        Listing.objects.create(host=self.host, name='Beachfront Hut', description='Steps from the sand.',
+                               location='Diani', pricepernight=80)
+        self.assertEqual(self.names('beach beachfront'), ['Beachfront Hut'])
+        self.assertEqual(self.names('beach beachfront lake'), [])
+
+    def test_pages_follow_the_ranking(self):
+        """Test that next/previous links page through the ranked results"""
+        first = self.search('mombasa', page_size=1).json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next'], HTTP_ACCEPT='application/json').json()
+        self.assertIsNone(second['next'])
+        self.assertEqual(
+            [first['results'][0]['name'], second['results'][0]['name']],
+            self.names('mombasa'),
+        )
+        self.assertEqual(self.client.get(second['previous'], HTTP_ACCEPT='application/json').json(), first)
+        self.assertEqual(self.client.get('/api/listings/?q=x&cursor=bad').status_code, 404)
+
+    def test_query_count(self):
+        """Test that a search runs one expansion query per word, the ranking and the page"""
+        textsearch.index_stats()  # Cached corpus statistics
+        with self.assertNumQueries(4):
+            self.search('harbour pool')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('!!'), [])
+
+    def test_refresh_search_stats_recounts_the_cached_stats(self):
+        """Test that the beat task replaces stale cached corpus statistics"""
+        cache.set(textsearch.STATS_KEY, (1, 1.0))
+        result = refresh_search_stats()
+        self.assertEqual(result['documents'], 4)
+        self.assertEqual(textsearch.index_stats(), (4, result['avg_length']))
+
+
+class GeoSearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user(username='geohost', email='geohost@example.com')
+        # A ring of listings at growing distances east and north-east of central Nairobi.
+        cls.centre = (-1.2864, 36.8172)
+        cls.ring = [
+            cls.make(f'Ring {km} km at {bearing}', *cls.offset(km, bearing), location='Nairobi')
+            for km in (0.5, 4, 9.5, 10.5, 30) for bearing in (90, 45)
+        ]
+        cls.make('Unplaced')
+
+    @classmethod
+    def make(cls, name, latitude=None, longitude=None, location='Nowhere'):
+        return Listing.objects.create(host=cls.host, name=name, description='d', location=location,
+                                      pricepernight=100, latitude=latitude, longitude=longitude)
+
+    @classmethod
+    def offset(cls, km, bearing):
+        """The point `km` along `bearing` degrees from the centre."""
+        lat, lng = map(math.radians, cls.centre)
+        angle, bearing = km / geo.EARTH_RADIUS_KM, math.radians(bearing)
+        lat2 = math.asin(math.sin(lat) * math.cos(angle) + math.cos(lat) * math.sin(angle) * math.cos(bearing))
+        lng2 = lng + math.atan2(math.sin(bearing) * math.sin(angle) * math.cos(lat),
+                                math.cos(angle) - math.sin(lat) * math.sin(lat2))
+        return math.degrees(lat2), math.degrees(lng2)
+
+    def near(self, latitude, longitude, radius, url='/api/listings/', **params):
+        response = self.client.get(url, {'near': f'{latitude},{longitude}', 'radius': radius, 'page_size': 100,
+                                         **params}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return {row['name'] for row in response.json()['results']}
+
+    def test_geohash_follows_the_coordinates(self):
+        """Test that geohashes match the reference encoding and are kept in step on save"""
+        self.assertEqual(geo.encode(57.64911, 10.40744, precision=11), 'u4pruydqqvj')
+        listing = self.ring[0]
+        self.assertEqual(listing.geohash, geo.encode(listing.latitude, listing.longitude))
+
+        listing.latitude, listing.longitude = 57.64911, 10.40744
+        listing.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(Listing.objects.get(pk=listing.pk).geohash, 'u4pruydqq')
+        listing.latitude = listing.longitude = None
+        listing.save()
+        self.assertEqual(Listing.objects.get(pk=listing.pk).geohash, '')
+
+    def test_radius_matches_haversine_distance(self):
+        """Test that `near` returns exactly the listings within the great-circle radius"""
+        for radius in (1, 5, 10, 20, 50):
+            for max_cells in (16, 2, 0):  # Fine cells, coarse cells, bounding box only
+                with self.subTest(radius=radius, max_cells=max_cells), override_settings(GEO_MAX_CELLS=max_cells):
+                    cache.clear()
+                    expected = {
+                        listing.name for listing in self.ring
+                        if geo.haversine_km(*self.centre, listing.latitude, listing.longitude) <= radius
+                    }
+                    self.assertEqual(self.near(*self.centre, radius), expected)
+        self.assertEqual(len(self.near(*self.centre, 10)), 6)
+
+    def test_antimeridian_and_poles(self):
+        """Test that boxes crossing the antimeridian or reaching a pole still find their listings"""
+        self.make('Fiji east', -17.0, 179.95)
+        self.make('Fiji west', -17.0, -179.95)
+        self.make('Far west', -17.0, -179.0)
+        self.assertEqual(self.near(-17.0, 179.99, 20), {'Fiji east', 'Fiji west'})
+        self.assertEqual(self.near(-17.0, -179.99, 20), {'Fiji east', 'Fiji west'})
+
+        self.make('Pole', 89.99, 120.0)
+        self.make('Across the pole', 89.95, -60.0)
+        self.assertEqual(self.near(89.98, 0.0, 20), {'Pole', 'Across the pole'})
+
+    def test_composes_with_search_filters(self):
+        """Test that the search endpoint combines the radius with its other filters"""
+        self.make('Elsewhere in range', *self.offset(1, 180), location='Kiambu')
+        self.assertEqual(self.near(*self.centre, 2, url='/api/listings/search/', location='Nairobi'),
+                         {'Ring 0.5 km at 90', 'Ring 0.5 km at 45'})
+        self.assertEqual(self.near(*self.centre, 2), {'Ring 0.5 km at 90', 'Ring 0.5 km at 45', 'Elsewhere in range'})
+
+    def test_rejects_bad_parameters(self):
+        """Test that malformed points, radii and `near` with `q` are 400s"""
+        for params in ({'near': 'nairobi'}, {'near': '91,0'}, {'near': '0,0', 'radius': 'far'},
+                       {'near': '0,0', 'radius': '0'}, {'near': '0,0', 'radius': '100000'},
+                       {'near': '0,0', 'q': 'loft'}):
+            for url in ('/api/listings/', '/api/listings/search/'):
+                if 'q' in params and url.endswith('search/'):
+                    continue
+                with self.subTest(params=params, url=url):
+                    response = self.client.get(url, params, HTTP_ACCEPT='application/json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.json())
+
+    def test_geocode_listings_from_a_gazetteer(self):
+        """Test that the backfill reads GeoNames and CSV gazetteers and only fills missing coordinates"""
+        self.make('Mombasa flat', location='Mombasa, Kenya')
+        self.make('Kisumu flat', location='KISUMU')
+        self.make('Atlantis flat', location='Atlantis')
+        placed = self.make('Placed', 1.0, 2.0, location='Mombasa')
+
+        with tempfile.TemporaryDirectory() as directory:
+            geonames = os.path.join(directory, 'cities.txt')
+            with open(geonames, 'w', encoding='utf-8') as out:
+                for row in [
+                    ['184745', 'Mombasa', 'Mombasa', 'MBA', '-4.05466', '39.66359'] + [''] * 8 + ['799668'],
+                    ['999999', 'Mombasa', 'Mombasa', '', '10.0', '10.0'] + [''] * 8 + ['12'],  # Smaller namesake
+                ]:
+                    out.write('\t'.join(row + ['', '', '', '']) + '\n')
+            out = StringIO()
+            call_command('geocode_listings', geonames, stdout=out)
+            self.assertIn('Geocoded 1 listings', out.getvalue())
+            self.assertIn('No gazetteer match for 3 locations', out.getvalue())  # Kisumu, Atlantis, Nowhere
+
+            gazetteer = os.path.join(directory, 'places.csv')
+            with open(gazetteer, 'w', encoding='utf-8') as out:
+                out.write('name,latitude,longitude\nKisumu,-0.10221,34.76171\n')
+            call_command('geocode_listings', gazetteer, stdout=StringIO())
+
+        mombasa = Listing.objects.get(name='Mombasa flat')
+        self.assertEqual((mombasa.latitude, mombasa.longitude), (-4.05466, 39.66359))
+        self.assertEqual(mombasa.geohash, geo.encode(-4.05466, 39.66359))
+        self.assertEqual(Listing.objects.get(name='Kisumu flat').latitude, -0.10221)
+        self.assertIsNone(Listing.objects.get(name='Atlantis flat').latitude)
+        self.assertEqual(Listing.objects.get(pk=placed.pk).latitude, 1.0)  # Not overwritten
+        self.assertEqual(self.near(-4.05, 39.66, 5), {'Mombasa flat'})
+
+
+class ListingResponseCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create_user(username='chost', email='chost@example.com', first_name='Ada')
+        self.guest = User.objects.create_user(username='cguest', email='cguest@example.com')
+        self.listing = Listing.objects.create(
+            host=self.host,
+            name='Cached Listing',
+            description='Test description',
+            location='Nairobi',
+            pricepernight=75.00
+        )
+        self.detail_url = f'/api/listings/{self.listing.pk}/'
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_ACCEPT='application/json', **headers)
+
+    def test_repeat_reads_are_served_from_cache(self):
+        """Test that a second read returns the same body without touching the database"""
+        first = self.get(self.detail_url)
+        with self.assertNumQueries(0):
+            second = self.get(self.detail_url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        """Test that a matching ETag short-circuits to 304 with no queries"""
+        etag = self.get('/api/listings/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.get('/api/listings/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_listing_change_invalidates(self):
+        """Test that saving a listing invalidates its detail and the list pages"""
+        etag = self.get(self.detail_url)['ETag']
+        self.get('/api/listings/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.name = 'Renamed Listing'
+            self.listing.save()
+
+        response = self.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Renamed Listing')
+        self.assertEqual(self.get('/api/listings/').json()['results'][0]['name'], 'Renamed Listing')
+
+    def test_review_change_invalidates(self):
+        """Test that a new review refreshes the cached rating"""
+        self.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(listing=self.listing, user=self.guest, rating=5, comment='great')
+        self.assertEqual(self.get(self.detail_url).json()['average_rating'], 5.0)
+
+    def test_host_change_invalidates_only_rendered_fields(self):
+        """Test that host renames invalidate, while last_login updates do not"""
+        self.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.host.save(update_fields=['last_login'])
+        self.assertEqual(self.get(self.detail_url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.host.first_name = 'Grace'
+            self.host.save()
+        response = self.get(self.detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['host']['first_name'], 'Grace')
+
+
+class ChapaClientTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeChapaServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.state.fail_next = 0
+        self.server.state.latency = 0.0
+        self.server.state.requests.clear()
+
+    def client_for(self, **kwargs):
+        kwargs.setdefault('sleep', lambda seconds: None)
+        return ChapaClient(self.server.base_url, 'test-key', **kwargs)
+
+    def test_initialize_and_verify(self):
+        """Test a round trip against the fake gateway over one pooled session"""
+        client = self.client_for()
+        tx_ref = str(uuid.uuid4())
+        self.assertEqual(client.initialize({'tx_ref': tx_ref, 'amount': '10.00'})['status'], 'success')
+        self.assertEqual(client.verify(tx_ref)['data']['status'], 'success')
+
+    def test_transient_failures_are_retried(self):
+        """Test that 503s are retried up to max_retries"""
+        self.server.state.fail_next = 2
+        client = self.client_for(max_retries=2)
+        with self.assertRaises(ChapaRejected) as caught:
+            client.verify('missing')  # 404 after two retries
+        self.assertEqual(caught.exception.status_code, 404)
+        self.assertEqual(len(self.server.state.requests), 3)
+
+    def test_post_read_timeout_is_not_retried(self):
+        """Test that a POST that may have reached the gateway is not resent"""
+        self.server.state.latency = 0.3
+        client = self.client_for(read_timeout=0.05, max_retries=3)
+        with self.assertRaises(ChapaUnavailable):
+            client.initialize({'tx_ref': str(uuid.uuid4()), 'amount': '10.00'})
+        self.assertEqual(len(self.server.state.requests), 1)
+
+    def test_circuit_breaker_fails_fast(self):
+        """Test that the breaker opens after repeated failures and then rejects calls"""
+        self.server.state.fail_next = 100
+        client = self.client_for(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        for _ in range(2):
+            with self.assertRaises(ChapaUnavailable):
+                client.verify('tx')
+        with self.assertRaises(ChapaUnavailable):
+            client.verify('tx')
+        self.assertEqual(len(self.server.state.requests), 2)
+
+    def test_async_client(self):
+        """Test that the async wrapper returns the same responses"""
+        client = AsyncChapaClient(self.client_for())
+        tx_ref = str(uuid.uuid4())
+        self.assertEqual(async_to_sync(client.initialize)({'tx_ref': tx_ref, 'amount': '5.00'})['status'], 'success')
+        self.assertEqual(async_to_sync(client.verify)(tx_ref)['status'], 'success')
+
+
+class PaymentViewsTest(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeChapaServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.state.fail_next = 0
+        self.user = User.objects.create_user(username='payer', email='payer@example.com')
+        listing = Listing.objects.create(host=self.user, name='Paid Listing', description='d',
+                                         location='Nairobi', pricepernight=100)
+        self.booking = Booking.objects.create(listing=listing, user=self.user, start_date='2024-10-01',
+                                              end_date='2024-10-03', total_price=200)
+        self.client.force_authenticate(self.user)
+        self.settings_override = override_settings(CHAPA_BASE_URL=self.server.base_url, CHAPA_MAX_RETRIES=0,
+                                                   CHAPA_BREAKER_THRESHOLD=100)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    @mock.patch('listings.tasks.send_payment_confirmation_email')
+    def test_initiate_then_verify_in_background(self, send_email):
+        """Test the payment flow: initiate, webhook-triggered verification, status read"""
+        response = self.client.post('/api/payments/initiate/', {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        payment_id = response.json()['payment_id']
+        self.assertIn(payment_id, response.json()['checkout_url'])
+        self.assertTrue(self.server.state.transactions[payment_id]['callback_url'].endswith('/api/payments/webhook/'))
+
+        # Until the task runs, the status read reports the payment as in progress.
+        response = self.client.get('/api/payments/verify/', {'tx_ref': payment_id})
+        self.assertEqual(response.status_code, 202)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            verify_payment_task.apply(args=[payment_id])
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'confirmed')
+        send_email.delay.assert_called_once_with(payment_id)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/payments/verify/', {'tx_ref': payment_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['payment_status'], 'completed')
+
+    @mock.patch('listings.tasks.send_payment_confirmation_email')
+    def test_verification_is_idempotent(self, send_email):
+        """Test that duplicate deliveries confirm once and email once"""
+        payment_id = self.client.post('/api/payments/initiate/', {'booking_id': str(self.booking.pk)},
+                                      format='json').json()['payment_id']
+        with self.captureOnCommitCallbacks(execute=True):
+            verify_payment_task.apply(args=[payment_id])
+            verify_payment_task.apply(args=[payment_id])
+        self.assertEqual(send_email.delay.call_count, 1)
+
+    def test_unknown_verify_responses_leave_the_payment_pending(self):
+        """Test that 401/404 verify responses and a missing 'data' never fail a payment"""
+        from .payments import apply_verification
+
+        payment = Payment.objects.create(booking=self.booking, amount=200)
+        rejected = ChapaRejected(401, {'status': 'failed', 'message': 'Invalid API Key', 'data': None})
+        with mock.patch('listings.tasks.get_client') as get_client:
+            get_client.return_value.verify.side_effect = rejected
+            self.assertEqual(verify_payment_task.apply(args=[str(payment.pk)], kwargs={'expire': True}).state,
+                             'FAILURE')
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+        # The fake gateway answers 404 for a tx_ref it has never seen.
+        self.assertEqual(verify_payment_task.apply(args=[str(payment.pk)]).result['status'], 'pending')
+        self.assertEqual(apply_verification(payment.pk, {'status': 'failed', 'data': None}), 'pending')
+        # ...until the payment expires.
+        self.assertEqual(verify_payment_task.apply(args=[str(payment.pk)], kwargs={'expire': True}).result['status'],
+                         'failed')
+
+    @mock.patch('listings.tasks.send_payment_confirmation_email')
+    def test_charge_for_a_booking_whose_nights_were_taken_is_flagged_for_refund(self, send_email):
+        """Test that a success for a canceled booking whose nights were rebooked completes the payment for refund"""
+        from .payments import apply_verification
+
+        payment = Payment.objects.create(booking=self.booking, amount=200)
+        self.booking.status = 'canceled'
+        self.booking.save()
+        Booking.objects.create(listing=self.booking.listing, user=self.user, start_date='2024-10-01',
+                               end_date='2024-10-03', total_price=200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(apply_verification(payment.pk, {'data': {'status': 'success'}}), 'completed')
+        payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertTrue(payment.refund_required)
+        self.assertEqual((payment.status, self.booking.status), ('completed', 'canceled'))
+        send_email.delay.assert_not_called()
+
+    def test_gateway_outage_returns_503(self):
+        """Test that an unreachable gateway fails the payment with 503"""
+        self.server.state.fail_next = 1
+        response = self.client.post('/api/payments/initiate/', {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(Payment.objects.get(booking=self.booking).status, 'failed')
+
+
+@override_settings(CHAPA_WEBHOOK_SECRET='whsec-test')
+@mock.patch('listings.views.verify_payment_task')
+class PaymentWebhookTest(APITestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='whuser', email='whuser@example.com')
+        listing = Listing.objects.create(host=user, name='Hooked', description='d', location='Nairobi', pricepernight=10)
+        booking = Booking.objects.create(listing=listing, user=user, start_date='2024-11-01',
+                                         end_date='2024-11-02', total_price=10)
+        self.payment = Payment.objects.create(booking=booking, amount=10)
+
+    def post(self, body, secret='whsec-test'):
+        raw = json.dumps(body).encode()
+        signature = hmac.new(secret.encode(), raw, hashlib.sha256).hexdigest()
+        return self.client.generic('POST', '/api/payments/webhook/', raw, content_type='application/json',
+                                   HTTP_X_CHAPA_SIGNATURE=signature)
+
+    def test_signed_webhook_queues_verification(self, task):
+        """Test that a correctly signed delivery queues the verification task"""
+        response = self.post({'tx_ref': str(self.payment.pk), 'status': 'success'})
+        self.assertEqual(response.status_code, 200)
+        task.delay.assert_called_once_with(str(self.payment.pk))
+
+    def test_bad_signature_is_rejected(self, task):
+        """Test that a delivery signed with the wrong secret is rejected"""
+        response = self.post({'tx_ref': str(self.payment.pk)}, secret='wrong')
+        self.assertEqual(response.status_code, 401)
+        task.delay.assert_not_called()
+
+    def test_checkout_callback_queues_verification(self, task):
+        """Test that Chapa's GET callback also triggers verification"""
+        response = self.client.get('/api/payments/webhook/', {'trx_ref': str(self.payment.pk), 'status': 'success'})
+        self.assertEqual(response.status_code, 200)
+        task.delay.assert_called_once_with(str(self.payment.pk))
+
+    def test_settled_payments_are_not_requeued(self, task):
+        """Test that deliveries for settled payments are acknowledged without work"""
+        Payment.objects.filter(pk=self.payment.pk).update(status='completed')
+        self.assertEqual(self.post({'tx_ref': str(self.payment.pk)}).status_code, 200)
+        task.delay.assert_not_called()
+
+
+@override_settings(PAYMENT_RECONCILE_AFTER=600, PAYMENT_PENDING_EXPIRY=3600)
+class PaymentReconciliationTest(TestCase):
+    def test_sweep_queues_stale_pending_payments(self):
+        """Test that only stale pending payments are swept, and expired ones are flagged"""
+        user = User.objects.create_user(username='recon', email='recon@example.com')
+        listing = Listing.objects.create(host=user, name='Swept', description='d', location='Nairobi', pricepernight=10)
+        booking = Booking.objects.create(listing=listing, user=user, start_date='2024-12-01',
+                                         end_date='2024-12-02', total_price=10)
+        fresh = Payment.objects.create(booking=booking, amount=10)
+        stale = Payment.objects.create(booking=booking, amount=10)
+        expired = Payment.objects.create(booking=booking, amount=10)
+        done = Payment.objects.create(booking=booking, amount=10, status='completed')
+        now = timezone.now()
+        Payment.objects.filter(pk=stale.pk).update(created_at=now - timedelta(minutes=20))
+        Payment.objects.filter(pk__in=[expired.pk, done.pk]).update(created_at=now - timedelta(hours=2))
+
+        with mock.patch('listings.tasks.verify_payment_task.delay') as delay:
+            reconcile_pending_payments()
+
+        delay.assert_has_calls([
+            mock.call(str(expired.pk), expire=True),
+            mock.call(str(stale.pk), expire=False),
+        ])
+        self.assertEqual(delay.call_count, 2)
+
+    def test_payments_left_pending_do_not_starve_the_rest(self):
+        """Test that payments still pending after verification rotate behind unchecked ones"""
+        user = User.objects.create_user(username='recon', email='recon@example.com')
+        listing = Listing.objects.create(host=user, name='Swept', description='d', location='Nairobi', pricepernight=10)
+        booking = Booking.objects.create(listing=listing, user=user, start_date='2024-12-01',
+                                         end_date='2024-12-02', total_price=10)
+        payments = [Payment.objects.create(booking=booking, amount=10) for _ in range(5)]
+        now = timezone.now()
+        for minutes, payment in enumerate(payments):
+            Payment.objects.filter(pk=payment.pk).update(created_at=now - timedelta(minutes=30 - minutes))
+
+        verified = []
+        with mock.patch('listings.tasks.verify_payment_task.delay') as delay:
+            for run in range(3):
+                # The gateway keeps reporting every payment as pending; each run is a sweep interval later.
+                with mock.patch('listings.tasks.timezone.now', return_value=now + timedelta(minutes=11 * run)):
+                    self.assertEqual(reconcile_pending_payments(batch_size=2)['queued'], 2)
+                verified += [call.args[0] for call in delay.call_args_list[-2:]]
+
+        self.assertEqual(verified[:5], [str(payment.pk) for payment in payments])
+        self.assertEqual(verified[5], str(payments[0].pk))  # Back to the least recently checked
+        self.assertFalse(Payment.objects.filter(last_reconciled_at__isnull=True).exists())
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    """
+    locmem backend that counts opened connections and can fail chosen recipients.
+    """
+    opened = 0
+    failing_recipients = set()
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.failing_recipients:
+                raise ConnectionResetError('SMTP connection dropped')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='listings.tests.CountingEmailBackend', CONFIRMATION_EMAIL_MAX_ATTEMPTS=2)
+class ConfirmationEmailBatchTest(TestCase):
+    def setUp(self):
+        CountingEmailBackend.opened = 0
+        CountingEmailBackend.failing_recipients = set()
+        cache.clear()
+        host = User.objects.create_user(username='mhost', email='mhost@example.com', first_name='Hana')
+        listing = Listing.objects.create(host=host, name='Mailed', description='d', location='Nairobi', pricepernight=30)
+        self.bookings = []
+        for i in range(5):
+            guest = User.objects.create_user(username=f'mguest{i}', email=f'mguest{i}@example.com')
+            self.bookings.append(Booking.objects.create(
+                listing=listing, user=guest, start_date=f'2025-01-{10 + 2 * i:02d}',
+                end_date=f'2025-01-{11 + 2 * i:02d}', total_price=30))
+        self.payment = Payment.objects.create(booking=self.bookings[0], amount=30)
+
+    @mock.patch('listings.tasks.flush_confirmation_emails')
+    def queue_all(self, flush_task):
+        with self.captureOnCommitCallbacks(execute=True):
+            for booking in self.bookings:
+                send_booking_confirmation_email(str(booking.pk))
+            send_payment_confirmation_email(str(self.payment.pk))
+        return flush_task
+
+    def test_burst_is_sent_as_one_batch(self):
+        """Test that a burst is flushed once, over one connection, with constant queries"""
+        flush_task = self.queue_all()
+        flush_task.apply_async.assert_called_once()  # One scheduled flush for the whole window
+
+        # outbox select, claim update, bookings, payments, delete (+ savepoint bookkeeping)
+        with CaptureQueriesContext(connection) as ctx:
+            stats = flush_outbox()
+        self.assertLessEqual(len(ctx.captured_queries), 7)
+        self.assertEqual(stats['sent'], 6)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(mail.outbox[0].subject, 'Booking Confirmation - Mailed')
+        self.assertIn('Contact: mhost@example.com', mail.outbox[0].body)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_failures_are_isolated_and_retried(self):
+        """Test that one failing message is rescheduled while the rest are delivered"""
+        self.queue_all()
+        CountingEmailBackend.failing_recipients = {'mguest2@example.com'}
+
+        stats = flush_outbox()
+        self.assertEqual((stats['sent'], stats['retrying']), (5, 1))
+        row = EmailOutbox.objects.get()
+        self.assertEqual(row.attempts, 1)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+
+        # Not due yet, then give up after CONFIRMATION_EMAIL_MAX_ATTEMPTS.
+        self.assertEqual(flush_outbox()['sent'], 0)
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(flush_outbox()['failed'], 1)
+        self.assertEqual(EmailOutbox.objects.get().status, 'failed')
+
+    def test_claimed_batch_is_hidden_from_concurrent_flushes(self):
+        """Test that rows being sent are leased, so an overlapping flush does not resend them"""
+        self.queue_all()
+        overlapping = []
+        load_messages = emails._load_messages
+
+        def load_and_flush_again(rows):
+            overlapping.append(flush_outbox())  # Runs while the first batch is in flight
+            return load_messages(rows)
+
+        with mock.patch('listings.emails._load_messages', side_effect=load_and_flush_again):
+            stats = flush_outbox()
+        self.assertEqual(stats['sent'], 6)
+        self.assertEqual(overlapping[0]['sent'], 0)
+        self.assertEqual(len(mail.outbox), 6)
+
+
+@mock.patch('listings.views.send_booking_confirmation_emails')
+class BulkBookingTest(APITestCase):
+    def setUp(self):
+        self.guest = User.objects.create_user(username='bulkguest', email='bulkguest@example.com')
+        self.listings = [
+            Listing.objects.create(host=self.guest, name=f'Bulk {i}', description='d', location='Nairobi',
+                                   pricepernight=10 * (i + 1))
+            for i in range(3)
+        ]
+        Booking.objects.create(listing=self.listings[0], user=self.guest, start_date='2025-02-01',
+                               end_date='2025-02-05', total_price=40)
+
+    def item(self, listing, start, end, **extra):
+        return {'listing_id': str(listing.pk), 'user_id': self.guest.pk, 'start_date': start, 'end_date': end, **extra}
+
+    def post(self, items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/bookings/bulk/', items, format='json')
+
+    def test_mixed_batch_reports_per_item_errors(self, send_emails):
+        """Test that valid items are created while each invalid one is reported by index"""
+        items = [
+            self.item(self.listings[1], '2025-02-01', '2025-02-04'),           # ok: 3 nights x 20
+            self.item(self.listings[0], '2025-02-03', '2025-02-06'),           # overlaps existing booking
+            self.item(self.listings[1], '2025-02-03', '2025-02-05'),           # overlaps item 0
+            {**self.item(self.listings[2], '2025-02-01', '2025-02-02'), 'user_id': 999999},
+            self.item(self.listings[2], '2025-02-05', '2025-02-05'),           # zero nights
+            {'listing_id': str(uuid.uuid4()), 'user_id': self.guest.pk, 'start_date': '2025-02-01', 'end_date': '2025-02-02'},
+            self.item(self.listings[2], '2025-02-01', '2025-02-03', status='confirmed'),
+        ]
+        response = self.post(items)
+
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual([c['index'] for c in body['created']], [0, 6])
+        self.assertEqual(body['created'][0]['total_price'], '60.00')
+        self.assertEqual([e['index'] for e in body['errors']], [1, 2, 3, 4, 5])
+        self.assertEqual(body['errors'][0]['errors']['unavailable_nights'], ['2025-02-03', '2025-02-04'])
+        self.assertIn('user_id', body['errors'][2]['errors'])
+        self.assertIn('listing_id', body['errors'][4]['errors'])
+        self.assertEqual(OccupiedNight.objects.filter(listing=self.listings[2]).count(), 2)
+        self.assertEqual(Booking.objects.get(pk=body['created'][0]['booking_id']).snapshot['listing']['name'], 'Bulk 1')
+        send_emails.delay.assert_called_once()
+        self.assertEqual(len(send_emails.delay.call_args[0][0]), 2)
+
+    def test_query_count_is_independent_of_batch_size(self, send_emails):
+        """Test that lookups and overlap checks don't grow with the batch (inserts only grow by DB batch limits)"""
+        def batch(first_night, count):
+            # Consecutive one-night stays, spread round-robin over the three listings
+            return [
+                self.item(self.listings[n % 3], str(first_night + timedelta(days=n // 3)),
+                          str(first_night + timedelta(days=n // 3 + 1)))
+                for n in range(count)
+            ]
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post(batch(date(2026, 1, 1), 6)).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.post(batch(date(2026, 4, 1), 150)).status_code, 201)
+        reads = lambda ctx: [q for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(reads(small)), 4)  # Including the pricing rules of the cold price calendars
+        self.assertEqual(len(reads(large)), 3)
+        self.assertLess(len(large.captured_queries), 12)
+
+    def test_ndjson_stream(self, send_emails):
+        """Test that NDJSON bodies are accepted and malformed lines are reported"""
+        lines = [json.dumps(self.item(self.listings[2], '2025-03-01', '2025-03-02')), '{not json', '']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.generic('POST', '/api/bookings/bulk/', '\n'.join(lines),
+                                           content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['errors'][0]['index'], 1)
+
+
+class SeedCommandTest(TestCase):
+    def seed(self, **options):
+        call_command('seed', num_listings=6, num_users=4, bookings_per_listing=4, reviews_per_listing=3,
+                     chunk_size=4, seed=11, stdout=StringIO(), **options)
+
+    def snapshot(self):
+        return (
+            sorted(Listing.objects.values_list('pk', 'name', 'pricepernight', 'review_count', 'rating_sum')),
+            sorted(Booking.objects.values_list('pk', 'start_date', 'end_date', 'status')),
+            sorted(Review.objects.values_list('pk', 'rating')),
+            sorted(Payment.objects.values_list('pk', 'status')),
+        )
+
+    def test_seed_is_deterministic_and_consistent(self):
+        self.seed()
+        first = self.snapshot()
+        self.assertEqual(len(first[0]), 6)
+        self.assertTrue(first[1] and first[2] and first[3])
+
+        # Active bookings never overlap: each night is owned by exactly one booking.
+        active = Booking.objects.exclude(status='canceled')
+        self.assertEqual(
+            OccupiedNight.objects.count(),
+            sum((b.end_date - b.start_date).days for b in active),
+        )
+        # The search index rows written by the seed match a rebuild from the listings.
+        seeded_terms = sorted(ListingTerm.objects.values_list('listing_id', 'term', 'frequency', 'doc_length'))
+        self.assertTrue(seeded_terms)
+        textsearch.rebuild_index()
+        self.assertEqual(sorted(ListingTerm.objects.values_list('listing_id', 'term', 'frequency', 'doc_length')),
+                         seeded_terms)
+        # Denormalised aggregates match the reviews that were written.
+        for listing in Listing.objects.all():
+            ratings = list(listing.reviews.values_list('rating', flat=True))
+            self.assertEqual((listing.review_count, listing.rating_sum), (len(ratings), sum(ratings)))
+
+        # Re-seeding with the same seed reuses the users and regenerates identical rows.
+        self.seed(clear=True)
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(get_user_model().objects.count(), 4)
+
+    def test_rerun_without_clear_is_refused(self):
+        """Test that seeding the same --seed twice points at --clear instead of failing on a key collision"""
+        self.seed()
+        first = self.snapshot()
+        with self.assertRaisesMessage(CommandError, '--clear'):
+            self.seed()
+        self.assertEqual(self.snapshot(), first)
+        # Another seed adds to the existing rows.
+        call_command('seed', num_listings=2, num_users=4, seed=12, stdout=StringIO())
+        self.assertEqual(Listing.objects.count(), 8)
+
+
+class ExportTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='finance', email='finance@example.com', is_staff=True)
+        listing = Listing.objects.create(host=self.admin, name='Export', description='d', location='Nairobi',
+                                         pricepernight=25)
+        self.bookings = [
+            Booking.objects.create(listing=listing, user=self.admin, start_date=f'2025-03-0{i + 1}',
+                                   end_date=f'2025-03-0{i + 2}', total_price=25, status=status)
+            for i, status in enumerate(['confirmed', 'pending', 'confirmed'])
+        ]
+        self.payments = [
+            Payment.objects.create(booking=booking, amount='25.00', status='completed', transaction_id=f'tx{i}')
+            for i, booking in enumerate(self.bookings)
+        ]
+        # Spread creation dates so the date-range filter has something to cut.
+        for i, payment in enumerate(self.payments):
+            Payment.objects.filter(pk=payment.pk).update(created_at=timezone.make_aware(
+                timezone.datetime(2025, 4, 1 + i, 12)))
+        self.client.force_authenticate(self.admin)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_bookings_csv_filtered_by_status(self):
+        """Test that the CSV export streams a header and only rows with the requested status"""
+        response = self.client.get('/api/exports/bookings.csv', {'status': 'confirmed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = self.content(response).splitlines()
+        self.assertTrue(lines[0].startswith('booking_id,listing_id,user_id,start_date'))
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1].split(',')[0], str(self.bookings[0].pk))
+        self.assertIn(',25.00,confirmed,', lines[1])
+
+    def test_payments_ndjson_filtered_by_date(self):
+        """Test that the NDJSON export applies the [from, to) creation date range"""
+        response = self.client.get('/api/exports/payments.ndjson', {'from': '2025-04-02', 'to': '2025-04-03'})
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['payment_id'], str(self.payments[1].pk))
+        self.assertEqual(rows[0]['amount'], '25.00')
+        self.assertEqual(rows[0]['transaction_id'], 'tx1')
+
+    def test_export_reads_in_chunks_with_constant_queries(self):
+        """Test that the export issues one query per chunk instead of one per row"""
+        with override_settings(EXPORT_CHUNK_SIZE=2), CaptureQueriesContext(connection) as queries:
+            self.content(self.client.get('/api/exports/payments.csv'))
+        self.assertLessEqual(len([q for q in queries if 'listings_payment' in q['sql']]), 2)
+
+    def test_rejects_bad_filters_and_non_staff(self):
+        """Test that unknown statuses are a 400 and non-staff users are refused"""
+        response = self.client.get('/api/exports/bookings.csv', {'status': 'shipped'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='guest', email='guest@example.com'))
+        self.assertEqual(self.client.get('/api/exports/bookings.csv').status_code, 403)
+
+    def test_export_command_writes_matching_rows(self):
+        """Test that the export command streams the same rows to stdout"""
+        out = StringIO()
+        call_command('export', 'bookings', '--format', 'ndjson', '--status', 'pending', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['booking_id'] for row in rows], [str(self.bookings[1].pk)])
+
+
+class BenchmarkHarnessTest(TestCase):
+    def test_runs_every_benchmark_and_reports_json(self):
+        """Test that a tiny run measures every hot path and produces diffable JSON"""
+        cache.clear()
+        data = seed_data(listings=3, users=4, bookings_per_listing=4, reviews_per_listing=2, seed=5)
+        results = run_benchmarks(iterations=3, warmup=1, data=data, seed=5)
+
+        self.assertEqual(list(results['benchmarks']), BENCHMARK_NAMES)
+        self.assertEqual(results['meta']['data'], data)
+        for stats in results['benchmarks'].values():
+            self.assertEqual(stats['iterations'], 3)
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+        # Cached listing reads must not hit the database; the email tasks really send.
+        self.assertEqual(results['benchmarks']['listing_list_cached']['queries_per_op'], 0)
+        self.assertEqual(len(mail.outbox), 8)
+        json.dumps(results)
+
+        rows = compare_results(results, results)
+        self.assertTrue(rows)
+        self.assertTrue(all(change in (0, None) for *_, change in rows))
+
+
+@override_settings(REQUEST_METRICS_ENABLED=True, REQUEST_METRICS_SAMPLE_RATE=1.0, METRICS_TOKEN='scrape-me')
+class RequestMetricsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for metric in metrics.REGISTRY:
+            metric.clear()
+        self.host = User.objects.create_user(username='mhost', email='mhost@example.com', is_staff=True)
+        for i in range(3):
+            Listing.objects.create(host=self.host, name=f'Timed {i}', description='d', location='Nairobi',
+                                   pricepernight=10)
+
+    def test_server_timing_header_and_histograms(self):
+        """Test that a sampled request reports its breakdown and lands in the histograms"""
+        response = self.client.get('/api/listings/')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries", serializer;dur=[\d.]+')
+        self.assertNotIn('dupq', timing)
+        self.assertEqual(metrics.REQUEST_DURATION.count(view='listing-list', method='GET'), 1)
+        self.assertEqual(metrics.REQUEST_DB_QUERIES.count(view='listing-list', method='GET'), 1)
+
+    def test_repeated_statements_are_flagged(self):
+        """Test that an N+1 shaped request is flagged in the header, the counter and the log"""
+        def n_plus_one(request):
+            for listing in Listing.objects.all():
+                User.objects.get(pk=listing.host_id)
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(n_plus_one)
+        with self.assertLogs('listings.middleware', level='WARNING') as logs:
+            response = middleware(RequestFactory().get('/anything/'))
+        self.assertIn('dupq;desc="1 repeated statements"', response['Server-Timing'])
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+        self.assertEqual(metrics.REQUEST_DUPLICATE_QUERIES.value(view='unresolved'), 1)
+        self.assertIn('ran the same query 3 times', logs.output[0])
+
+    def test_metrics_endpoint_access(self):
+        """Test that metrics render for staff or the scrape token, and not for anyone else"""
+        self.client.get('/api/listings/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="listing-list",method="GET",le="+Inf"} 1', body)
+
+        self.client.force_authenticate(self.host)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_untouched(self):
+        """Test that requests outside the sample get no header and no observations"""
+        response = self.client.get('/api/listings/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(metrics.REQUEST_DURATION.count(view='listing-list', method='GET'), 0)
+
+
+@override_settings(EMAIL_BACKEND='listings.tests.CountingEmailBackend', CONFIRMATION_EMAIL_MAX_ATTEMPTS=2)
+class TaskMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()  # Task metrics and the flush-scheduled flag live in the cache
+        CountingEmailBackend.failing_recipients = set()
+        user = User.objects.create_user(username='tguest', email='tguest@example.com')
+        listing = Listing.objects.create(host=user, name='Tasked', description='d', location='Nairobi', pricepernight=5)
+        self.booking = Booking.objects.create(listing=listing, user=user, start_date='2025-05-01',
+                                              end_date='2025-05-02', total_price=5)
+        self.flush_name = flush_confirmation_emails.name
+
+    def queue(self):
+        with mock.patch('listings.tasks.flush_confirmation_emails'):
+            send_booking_confirmation_email(str(self.booking.pk))
+
+    def test_queue_wait_runtime_and_state_are_recorded(self):
+        """Test that a task run records its queue wait, run time and final state"""
+        self.queue()
+        result = flush_confirmation_emails.apply(headers={'enqueued_at': time.time() - 2})
+        self.assertEqual(result.state, 'SUCCESS')
+        self.assertEqual(result.result, {'sent': 1, 'retrying': 0, 'failed': 0, 'dropped': 0})
+
+        self.assertEqual(task_metrics.TASK_QUEUE_WAIT.count(task=self.flush_name), 1)
+        self.assertEqual(task_metrics.TASK_RUNTIME.count(task=self.flush_name), 1)
+        self.assertEqual(task_metrics.TASK_RUNS.value(task=self.flush_name, state='SUCCESS'), 1)
+        self.assertEqual(task_metrics.CONFIRMATION_EMAILS.value(outcome='sent'), 1)
+
+        body = metrics.render_metrics()
+        self.assertIn(f'celery_task_queue_wait_seconds_bucket{{task="{self.flush_name}",le="1.0"}} 0', body)
+        self.assertIn(f'celery_task_queue_wait_seconds_bucket{{task="{self.flush_name}",le="2.5"}} 1', body)
+        self.assertIn(f'celery_task_runs_total{{task="{self.flush_name}",state="SUCCESS"}} 1', body)
+
+    def test_failed_sends_retry_then_fail_the_task(self):
+        """Test that undeliverable email surfaces as a retry, then as a task failure"""
+        self.queue()
+        CountingEmailBackend.failing_recipients = {'tguest@example.com'}
+
+        # Eager apply() runs the retry straight away; the message isn't due again yet.
+        flush_confirmation_emails.apply()
+        self.assertEqual(task_metrics.TASK_RETRIES.value(task=self.flush_name), 1)
+        self.assertEqual(task_metrics.CONFIRMATION_EMAILS.value(outcome='retrying'), 1)
+        self.assertEqual(EmailOutbox.objects.get().attempts, 1)
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        result = flush_confirmation_emails.apply()
+        self.assertEqual(result.state, 'FAILURE')
+        self.assertIsInstance(result.result, EmailDeliveryError)
+        self.assertEqual(task_metrics.TASK_FAILURES.value(task=self.flush_name), 1)
+        self.assertEqual(task_metrics.CONFIRMATION_EMAILS.value(outcome='failed'), 1)
+
+
+class CeleryTopologyTest(TestCase):
+    def test_tasks_are_routed_to_their_queues(self):
+        """Test that each task class lands on its dedicated queue"""
+        from alx_travel_app.celery import app
+
+        router = app.amqp.router
+        expected = {
+            send_booking_confirmation_email: 'email',
+            flush_confirmation_emails: 'email',
+            verify_payment_task: 'payments',
+            reconcile_pending_payments: 'maintenance',
+            refresh_search_stats: 'maintenance',
+            purge_idempotency_keys: 'maintenance',
+            refresh_listing_rollups: 'maintenance',
+            compact_listing_rollups: 'maintenance',
+        }
+        for task, queue in expected.items():
+            self.assertEqual(router.route({}, task.name)['queue'].name, queue)
+
+        # Every routed queue is consumed by some worker in the documented topology.
+        consumed = {q for spec in settings.CELERY_WORKER_TOPOLOGY.values() for q in spec['queues']}
+        self.assertLessEqual(set(expected.values()) | {settings.CELERY_TASK_DEFAULT_QUEUE}, consumed)
+
+    def test_celery_workers_prints_one_command_per_worker(self):
+        """Test that the worker commands carry each queue's concurrency and prefetch"""
+        out = StringIO()
+        call_command('celery_workers', '--procfile', 'payments', stdout=out)
+        self.assertEqual(
+            out.getvalue().strip(),
+            'worker-payments: celery -A alx_travel_app worker -n payments@%h -Q payments '
+            f"--concurrency {settings.CELERY_WORKER_TOPOLOGY['payments']['concurrency']} "
+            '--prefetch-multiplier 1 --loglevel=info',
+        )
+
+
+# The replica alias is not configured here, so the spy records the router's choice and
+# then lets the read fall through to the test database. A transaction test case, because
+# reads inside TestCase's wrapping transaction always stay on the primary.
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTest(APITransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='replicauser', email='replica@example.com')
+        self.listing = Listing.objects.create(host=self.user, name='Replica', description='d',
+                                              location='Nairobi', pricepernight=10)
+        cache.clear()
+
+    def routed_reads(self, method, url, data=None):
+        """Makes a request and returns the response and the aliases picked for its reads"""
+        picked = []
+        db_for_read = PrimaryReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            picked.append(db_for_read(router, model, **hints))
+            return None
+
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', spy):
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, picked
+
+    def test_viewset_reads_go_to_a_replica(self):
+        """Test that listing and booking list and detail reads are routed to the replica"""
+        for url in ['/api/listings/', f'/api/listings/{self.listing.pk}/', '/api/bookings/']:
+            response, picked = self.routed_reads('get', url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(picked)
+            self.assertEqual(set(picked), {'replica_0'}, url)
+        self.assertNotIn(PIN_COOKIE, self.client.cookies)
+
+    def test_write_pins_the_client_to_the_primary(self):
+        """Test that a booking POST reads from the primary and pins the client's next reads"""
+        with mock.patch('listings.views.send_booking_confirmation_email'):
+            response, picked = self.routed_reads('post', '/api/bookings/', {
+                'listing_id': str(self.listing.pk), 'user_id': self.user.pk,
+                'start_date': '2025-03-01', 'end_date': '2025-03-03', 'total_price': '20.00',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('replica_0', picked)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.DATABASE_REPLICA_PIN_SECONDS)
+
+        response, picked = self.routed_reads('get', '/api/bookings/')
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertNotIn('replica_0', picked)
+
+    def test_listing_reads_stay_on_the_primary_after_a_change(self):
+        """Test that a listing change keeps every client's listing reads on the primary for a while"""
+        self.listing.name = 'Renamed'
+        self.listing.save()
+        response, picked = self.routed_reads('get', '/api/listings/')
+        self.assertEqual(response.json()['results'][0]['name'], 'Renamed')
+        self.assertNotIn('replica_0', picked)
+
+        cache.clear()  # The recent-write marker expires
+        response, picked = self.routed_reads('get', '/api/bookings/')
+        self.assertEqual(set(picked), {'replica_0'})
+
+    def test_router_keeps_other_reads_and_writes_on_the_primary(self):
+        """Test that only replica_reads() blocks outside transactions are sent to a replica"""
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(Listing))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Listing), 'replica_0')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Listing), 'default')
+        self.assertEqual(router.db_for_write(Listing), 'default')
+        self.assertFalse(router.allow_migrate('replica_0', 'listings'))
+        self.assertTrue(router.allow_migrate('default', 'listings'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_nothing_is_routed_or_pinned(self):
+        """Test that with no replicas configured every read uses the default database"""
+        with mock.patch('listings.views.send_booking_confirmation_email'):
+            response, picked = self.routed_reads('post', '/api/bookings/', {
+                'listing_id': str(self.listing.pk), 'user_id': self.user.pk,
+                'start_date': '2025-03-01', 'end_date': '2025-03-03', 'total_price': '20.00',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response, picked = self.routed_reads('get', '/api/listings/')
+        self.assertEqual(set(picked), {None})
+
+
+class SQLiteTuningTest(APITransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sqliteuser', email='sqlite@example.com')
+        self.listing = Listing.objects.create(host=self.user, name='SQLite', description='d',
+                                              location='Nairobi', pricepernight=10)
+
+    def begins(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('BEGIN')]
+
+    def test_connections_run_the_configured_pragmas(self):
+        """Test that new connections get the busy timeout and page cache from settings"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['cache_size'])
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], int(settings.SQLITE_BUSY_TIMEOUT * 1000))
+
+    def test_booking_and_payment_writes_begin_immediate(self):
+        """Test that booking saves and payment transitions take the write lock up front"""
+        from .payments import apply_verification
+
+        with CaptureQueriesContext(connection) as queries:
+            booking = Booking.objects.create(listing=self.listing, user=self.user, start_date='2025-04-01',
+                                             end_date='2025-04-03', total_price=20)
+            payment = Payment.objects.create(booking=booking, amount=20)
+            apply_verification(payment.pk, {'data': {'status': 'failed'}})
+        self.assertEqual(self.begins(queries.captured_queries), ['BEGIN IMMEDIATE', 'BEGIN IMMEDIATE'])
+        # The connection's own mode is left as configured for other transactions.
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            Listing.objects.count()
+        self.assertEqual(self.begins(queries.captured_queries), ['BEGIN'])
+
+    def test_nested_write_transaction_is_a_savepoint(self):
+        """Test that write_transaction inside a transaction only adds a savepoint"""
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            with write_transaction():
+                Listing.objects.update(name='Renamed')
+        self.assertEqual(self.begins(queries.captured_queries), ['BEGIN'])
+
+    @override_settings(SQLITE_IMMEDIATE_WRITES=False)
+    def test_immediate_writes_can_be_turned_off(self):
+        """Test that SQLITE_IMMEDIATE_WRITES=False leaves writes on deferred transactions"""
+        with CaptureQueriesContext(connection) as queries:
+            Booking.objects.create(listing=self.listing, user=self.user, start_date='2025-04-01',
+                                   end_date='2025-04-03', total_price=20)
+        self.assertEqual(self.begins(queries.captured_queries), ['BEGIN'])
+
+
+class IdempotencyTest(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeChapaServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.state.fail_next = 0
+        self.user = User.objects.create_user(username='retrier', email='retrier@example.com')
+        self.listing = Listing.objects.create(host=self.user, name='Retry Listing', description='d',
+                                              location='Nairobi', pricepernight=100)
+        self.booking = Booking.objects.create(listing=self.listing, user=self.user, start_date='2024-10-01',
+                                              end_date='2024-10-03', total_price=200)
+        self.client.force_authenticate(self.user)
+        self.settings_override = override_settings(CHAPA_BASE_URL=self.server.base_url, CHAPA_MAX_RETRIES=0,
+                                                   CHAPA_BREAKER_THRESHOLD=100)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def book(self, key, start_date='2025-02-01', end_date='2025-02-03'):
+        return self.client.post('/api/bookings/', {
+            'listing_id': str(self.listing.pk), 'user_id': self.user.pk,
+            'start_date': start_date, 'end_date': end_date,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def pay(self, key):
+        return self.client.post('/api/payments/initiate/', {'booking_id': str(self.booking.pk)},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    @mock.patch('listings.views.send_booking_confirmation_email')
+    def test_booking_retry_replays_the_first_response(self, send_email):
+        """Test that a retried booking POST returns the stored response without running again"""
+        first = self.book('booking-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            retry = self.book('booking-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Booking.objects.count(), 2)
+        send_email.delay.assert_called_once()
+
+        # The key is scoped to the endpoint and user, and requests without one are untouched.
+        self.assertEqual(self.book('booking-2', '2025-03-01', '2025-03-03').status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', self.book(None, '2025-04-01', '2025-04-03'))
+
+    @mock.patch('listings.views.send_booking_confirmation_email')
+    def test_key_reused_with_another_payload_is_rejected(self, send_email):
+        """Test that reusing a key for a different request gets 422 and creates nothing"""
+        self.assertEqual(self.book('booking-1').status_code, 201)
+        response = self.book('booking-1', '2025-05-01', '2025-05-03')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(self.book('x' * 256).status_code, 400)
+
+    def test_payment_retry_calls_the_gateway_once(self):
+        """Test that a retried payment initiation returns the same checkout without a second Payment"""
+        transactions = len(self.server.state.transactions)
+        first = self.pay('payment-1')
+        self.assertEqual(first.status_code, 200)
+        retry = self.pay('payment-1')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(len(self.server.state.transactions), transactions + 1)
+
+    def test_server_errors_release_the_key(self):
+        """Test that a 5xx response isn't stored, so the retry runs again"""
+        self.server.state.fail_next = 1
+        self.assertEqual(self.pay('payment-1').status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        response = self.pay('payment-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_duplicate_of_a_running_request_gets_409_after_waiting(self):
+        """Test that a duplicate still blocked when the wait runs out gets 409"""
+        self.assertEqual(self.pay('payment-1').status_code, 200)
+        IdempotencyKey.objects.update(status='in_progress')
+        self.assertEqual(self.pay('payment-1').status_code, 409)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_concurrent_duplicate_waits_for_the_first_response(self):
+        """Test that a duplicate blocks on the claim and gets the response the holder stores"""
+        holder, claimed = idempotency.claim('test', 'key', 'fingerprint')
+        self.assertTrue(claimed)
+        # The holder finishes while the duplicate sleeps between polls.
+        finish = lambda delay: idempotency.complete(holder, Response({'done': True}, status=201))
+        with mock.patch('listings.idempotency.time.sleep', side_effect=finish) as sleep:
+            entry, claimed = idempotency.claim('test', 'key', 'fingerprint')
+        sleep.assert_called_once()
+        self.assertFalse(claimed)
+        response = idempotency.replay(entry)
+        self.assertEqual((response.status_code, json.loads(response.content)), (201, {'done': True}))
+
+    def test_abandoned_and_expired_claims_are_taken_over(self):
+        """Test that a claim past its lock timeout or TTL is claimed again, and the purge drops expired keys"""
+        idempotency.claim('test', 'abandoned', 'fingerprint')
+        IdempotencyKey.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(idempotency.claim('test', 'abandoned', 'fingerprint')[1])
+
+        idempotency.claim('test', 'expired', 'fingerprint')
+        IdempotencyKey.objects.filter(key='expired').update(status='completed', expires_at=timezone.now())
+        self.assertTrue(idempotency.claim('test', 'expired', 'other fingerprint')[1])
+
+        IdempotencyKey.objects.filter(key='abandoned').update(expires_at=timezone.now())
+        self.assertEqual(purge_idempotency_keys(), {'deleted': 1})
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['expired'])
+
+
+class HostStatsTest(APITestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='statshost', email='statshost@example.com')
+        self.guest = User.objects.create_user(username='statsguest', email='statsguest@example.com')
+        self.listing = Listing.objects.create(host=self.host, name='Stats Listing', description='d',
+                                              location='Nairobi', pricepernight=100)
+        # Check-in on the 10th of last month, well inside the daily window.
+        self.month = rollups.month_start(rollups.month_start(timezone.localdate()) - timedelta(days=1))
+        self.check_in = self.month.replace(day=10)
+
+    def book(self, start, nights, status='confirmed', paid=None):
+        booking = Booking.objects.create(listing=self.listing, user=self.guest, start_date=start,
+                                         end_date=start + timedelta(days=nights), total_price=100 * nights,
+                                         status=status)
+        if paid is not None:
+            Payment.objects.create(booking=booking, amount=paid, status='completed')
+        return booking
+
+    def stats(self, **params):
+        params = {'from': self.month.strftime('%Y-%m'), 'to': self.month.strftime('%Y-%m'), **params}
+        return self.client.get(f'/api/hosts/{self.host.pk}/stats/', params)
+
+    def test_changes_are_rolled_up_and_served_from_rollups(self):
+        """Test that bookings, payments and reviews reach the host stats once the queue is applied"""
+        self.book(self.check_in, 3, paid='300.00')
+        canceled = self.book(self.check_in + timedelta(days=5), 2)
+        canceled.status = 'canceled'
+        canceled.save()
+        Review.objects.create(listing=self.listing, user=self.guest, rating=4, comment='Nice')
+        self.assertEqual(refresh_listing_rollups(), {'applied': 5})
+        self.assertFalse(ListingStatsChange.objects.exists())
+        self.assertEqual(refresh_listing_rollups(), {'applied': 0})
+
+        self.client.force_authenticate(self.host)
+        with self.assertNumQueries(1):
+            response = self.stats(**{'from': self.month.strftime('%Y-%m'), 'to': timezone.localdate().strftime('%Y-%m')})
+        self.assertEqual(response.status_code, 200)
+        months = response.json()['listings'][0]['months']
+        days = rollups.month_end(self.month).day
+        self.assertEqual(months[0], {
+            'month': self.month.strftime('%Y-%m'), 'bookings': 1, 'nights_sold': 3, 'revenue': '300.00',
+            'reviews': 0, 'average_rating': None, 'occupancy': round(3 / days, 4),
+        })
+        self.assertEqual(response.json()['totals'], {
+            'bookings': 1, 'nights_sold': 3, 'revenue': '300.00', 'reviews': 1, 'average_rating': 4.0,
+        })
+
+    def test_old_changes_rewrite_whole_months_and_compaction_keeps_the_totals(self):
+        """Test that changes before the cutoff land in monthly rows, and compaction folds days into months"""
+        old = date(self.month.year - 3, self.month.month, 12)
+        self.book(old, 2, paid='200.00')
+        self.book(self.check_in, 4, paid='400.00')
+        refresh_listing_rollups()
+        self.assertEqual(
+            set(ListingStatsRollup.objects.values_list('granularity', 'period')),
+            {('month', rollups.month_start(old))} | {('day', self.check_in + timedelta(days=n)) for n in range(4)},
+        )
+
+        self.client.force_authenticate(self.host)
+        before = self.stats().json()
+        with override_settings(ROLLUP_DAILY_DAYS=0):
+            self.assertEqual(compact_listing_rollups(), {'compacted': 4, 'moved': 0})
+        self.assertEqual(ListingStatsRollup.objects.filter(granularity='day').count(), 0)
+        self.assertEqual(self.stats().json(), before)
+
+        # The rebuild from the source tables agrees with the incremental rollups.
+        rows = lambda: sorted(ListingStatsRollup.objects.values_list(
+            'granularity', 'period', 'bookings', 'nights_sold', 'revenue'))
+        incremental = rows()
+        with override_settings(ROLLUP_DAILY_DAYS=0):
+            call_command('rebuild_listing_rollups', stdout=StringIO())
+        self.assertEqual(rows(), incremental)
+
+    def test_only_the_host_or_staff_can_read_the_stats(self):
+        """Test that other users are refused, and month parameters are validated"""
+        self.assertEqual(self.stats().status_code, 403)
+        self.client.force_authenticate(self.guest)
+        self.assertEqual(self.stats().status_code, 403)
+        self.client.force_authenticate(User.objects.create_user(username='staff', is_staff=True))
+        self.assertEqual(self.stats().status_code, 200)
+        self.assertEqual(self.stats(**{'from': '2025-13'}).status_code, 400)
+        self.assertEqual(self.stats(**{'from': '2025-05', 'to': '2025-01'}).status_code, 400)
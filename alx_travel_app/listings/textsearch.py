@@ -0,0 +1,191 @@
+"""
+Full-text search over listing name, location and description.
+
+The index is a table, ListingTerm, with one row per (listing, term). It works the same
+on SQLite and PostgreSQL, and it is maintained like the other derived tables here:
+- on Listing save, by the signal handler in listings/signals.py
+- written directly by the seed command
+- rebuilt from scratch by the `rebuild_search_index` command
+
+Text is tokenized into lowercase words with accents folded (Nairobi, NAIROBI and
+Nairóbi are one term), and common English words are dropped. A term's frequency is
+weighted by where it occurs (SEARCH_FIELD_WEIGHTS), so a match in the name counts
+more than one in the description.
+
+A query is tokenized the same way. Every query word must match (AND). A word of at
+least SEARCH_MIN_PREFIX characters also matches longer terms it starts with ("nair"
+finds Nairobi), expanded to the SEARCH_PREFIX_EXPANSIONS most common such terms.
+Matching listings are ranked by BM25 in one grouped query over the postings index:
+
+    score = sum over matched terms of
+        idf(term) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_length / avg_doc_length))
+
+The document count and average length feed idf and length normalization. They drift
+slowly, so they are cached for SEARCH_STATS_TIMEOUT instead of being counted per query,
+and the refresh_search_stats task recounts them on beat before the cache expires.
+"""
+import math
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import Listing, ListingTerm
+
+# Fields indexed, with the weight of one occurrence in each.
+SEARCH_FIELD_WEIGHTS = {'name': 3, 'location': 2, 'description': 1}
+
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has in is it of on or the this to was with'.split()
+)
+MAX_TERM_LENGTH = ListingTerm._meta.get_field('term').max_length
+
+STATS_KEY = 'listings:search:stats'
+
+# BM25 parameters: term frequency saturation and the strength of length normalization.
+K1 = 1.2
+B = 0.75
+
+_word = re.compile(r'[^\W_]+')  # Letters and digits
+
+
+def tokenize(text):
+    """
+    Splits text into index terms: lowercase words with accents removed, minus stopwords.
+    """
+    folded = unicodedata.normalize('NFKD', text.lower())
+    folded = ''.join(char for char in folded if not unicodedata.combining(char))
+    return [
+        word[:MAX_TERM_LENGTH] for word in _word.findall(folded) if word not in STOPWORDS
+    ]
+
+
+def listing_terms(listing):
+    """
+    Returns {term: weighted frequency} for a listing's indexed fields.
+    """
+    frequencies = {}
+    for field, weight in SEARCH_FIELD_WEIGHTS.items():
+        for term in tokenize(getattr(listing, field) or ''):
+            frequencies[term] = frequencies.get(term, 0) + weight
+    return frequencies
+
+
+def index_rows(listing):
+    """
+    The unsaved ListingTerm rows for a listing.
+    """
+    frequencies = listing_terms(listing)
+    doc_length = sum(frequencies.values())
+    return [
+        ListingTerm(listing_id=listing.pk, term=term, frequency=frequency, doc_length=doc_length)
+        for term, frequency in frequencies.items()
+    ]
+
+
+def reindex_listing(listing, created=False):
+    """
+    Replaces a listing's index rows with ones built from its current text.
+    """
+    with transaction.atomic():
+        if not created:
+            ListingTerm.objects.filter(listing_id=listing.pk).delete()
+        ListingTerm.objects.bulk_create(index_rows(listing))
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuilds the whole index from the Listing table, batch_size listings per transaction.
+    Returns the number of listings indexed.
+    """
+    ListingTerm.objects.all().delete()
+    listings = Listing.objects.order_by('pk').only('pk', *SEARCH_FIELD_WEIGHTS)
+    indexed, last_pk = 0, None
+    while True:
+        batch = listings.filter(pk__gt=last_pk) if last_pk else listings
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            ListingTerm.objects.bulk_create(
+                [row for listing in batch for row in index_rows(listing)], batch_size=batch_size,
+            )
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+    cache.delete(STATS_KEY)
+    return indexed
+
+
+# --- Querying ---
+
+def index_stats(refresh=False):
+    """
+    Returns (documents, average document length), cached for SEARCH_STATS_TIMEOUT.
+    refresh=True recounts them and replaces the cached value.
+    """
+    stats = None if refresh else cache.get(STATS_KEY)
+    if stats is None:
+        documents = Listing.objects.count()
+        total = ListingTerm.objects.aggregate(total=Sum('frequency'))['total'] or 0
+        stats = (documents, total / documents if documents else 0.0)
+        cache.set(STATS_KEY, stats, timeout=settings.SEARCH_STATS_TIMEOUT)
+    return stats
+
+
+def _expand(word):
+    """
+    Returns {term: document frequency} for the index terms a query word matches.
+    """
+    postings = ListingTerm.objects.order_by()
+    if len(word) >= settings.SEARCH_MIN_PREFIX:
+        # A range rather than LIKE, so it is an index range scan on every backend.
+        postings = postings.filter(term__gte=word, term__lt=word + '\uffff')
+    else:
+        postings = postings.filter(term=word)
+    # The word itself first, then the most common longer terms.
+    exact_first = Case(When(term=word, then=Value(0)), default=Value(1))
+    rows = (
+        postings.values('term').annotate(df=Count('pk'))
+        .order_by(exact_first, '-df', 'term')[:settings.SEARCH_PREFIX_EXPANSIONS]
+    )
+    return {row['term']: row['df'] for row in rows}
+
+
+def rank(query, offset=0, limit=20):
+    """
+    Returns [(listing_id, score)] for the listings matching every word of `query`, best
+    first, skipping `offset` results and returning at most `limit`.
+    """
+    words = list(dict.fromkeys(tokenize(query)))
+    if not words:
+        return []
+    groups = [_expand(word) for word in words]
+    if not all(groups):
+        return []  # Some word matches nothing, so no listing matches them all
+
+    documents, avg_length = index_stats()
+    idf = {}
+    for group in groups:
+        for term, df in group.items():
+            idf[term] = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+
+    term_idf = Case(*[When(term=term, then=Value(weight)) for term, weight in idf.items()],
+                    output_field=FloatField())
+    tf = Cast('frequency', FloatField())
+    length_norm = Value(K1 * (1 - B)) + Value(K1 * B / (avg_length or 1.0)) * Cast('doc_length', FloatField())
+    scores = (
+        ListingTerm.objects.filter(term__in=list(idf)).order_by()
+        .values('listing_id')
+        .annotate(score=Sum(term_idf * tf * Value(K1 + 1) / (tf + length_norm)))
+    )
+    if len(groups) > 1:
+        # Listings matching some term of every query word. Each word is counted on its own:
+        # a term can match several words ("beachfront" for both "beach" and "beachfront").
+        matched = {f'w{index}': Count('pk', filter=Q(term__in=list(group))) for index, group in enumerate(groups)}
+        scores = scores.annotate(**matched).filter(**{f'{name}__gt': 0 for name in matched})
+    scores = scores.order_by('-score', 'listing_id')[offset:offset + limit]
+    return [(row['listing_id'], row['score']) for row in scores]
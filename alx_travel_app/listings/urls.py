@@ -1,5 +1,6 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
+from . import views
 from .views import ListingViewSet, BookingViewSet
 
 router = DefaultRouter()
@@ -10,4 +11,12 @@ urlpatterns = [
     path('api/', include(router.urls)),
     path('api/payments/initiate/', views.initiate_payment, name='initiate-payment'),
     path('api/payments/verify/', views.verify_payment, name='verify-payment'),
+    path('api/payments/webhook/', views.payment_webhook, name='payment-webhook'),
+    path('api/metrics/', views.metrics_view, name='metrics'),
+    path('api/hosts/<int:host_id>/stats/', views.host_stats_view, name='host-stats'),
+    re_path(
+        r'^api/exports/(?P<kind>bookings|payments)\.(?P<export_format>csv|ndjson)$',
+        views.export_records,
+        name='export-records',
+    ),
 ]
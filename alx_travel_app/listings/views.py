@@ -1,21 +1,167 @@
 from django.shortcuts import render
 
 # Create your views here.
+import uuid
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.decorators import method_decorator
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework import status
+from .availability import booked_nights, exclude_unavailable, parse_date_range
 from .models import Listing, Booking
-from .serializers import ListingSerializer, BookingSerializer
-from .tasks import send_booking_confirmation_email
+from .serializers import ListingSerializer, BookingSerializer, CompactBookingSerializer
+from .cache import CachedReadMixin, written_recently
+from .pagination import ListingPagination, ListingSearchPagination, BookingPagination
+from .querysets import QueryPlanningMixin
+from .fastpath import FastListMixin
+from .geo import NearFilterMixin, parse_near, within_radius
+from .idempotency import idempotent
+from .bulk import bulk_create_bookings
+from .parsers import NDJSONParser
+from .pricing import quote_stay
+from .replicas import ReplicaReadMixin
+from .tasks import send_booking_confirmation_email, send_booking_confirmation_emails
 
-class ListingViewSet(viewsets.ModelViewSet):
+# The base querysets stay bare; QueryPlanningMixin adds select_related/prefetch_related/only
+# per action from the nested fields declared on the serializer. Safe-method requests read
+# from a replica when one is configured (ReplicaReadMixin, see listings/replicas.py).
+class ListingViewSet(ReplicaReadMixin, CachedReadMixin, NearFilterMixin, FastListMixin, QueryPlanningMixin,
+                     viewsets.ModelViewSet):
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
+    pagination_class = ListingPagination
+    column_restricted_actions = ('list', 'retrieve', 'search')
+
+    @property
+    def paginator(self):
+        """
+        `?q=` on list ranks listings by full-text relevance (listings/textsearch.py)
+        instead of paging them newest first.
+        """
+        if not hasattr(self, '_paginator') and self.action == 'list' and self.request.query_params.get('q'):
+            self._paginator = ListingSearchPagination()
+        return super().paginator
+
+    def use_replica(self, request):
+        # Responses read now are cached, so stay on the primary until a recent change has replicated.
+        return super().use_replica(request) and not written_recently()
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        GET /api/listings/search/?location=&min_price=&max_price=&from=&to=&near=&radius=
+        Listings in a location (or radius) and nightly price band that are free for the
+        whole stay. Every parameter is optional; the filters compose into one indexed query.
+        """
+        params = request.query_params
+        try:
+            near = parse_near(params)
+            start_date, end_date = parse_date_range(params, required=False)
+            min_price = Decimal(params['min_price']) if 'min_price' in params else None
+            max_price = Decimal(params['max_price']) if 'max_price' in params else None
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except InvalidOperation:
+            return Response({'error': "'min_price' and 'max_price' must be numbers"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset()
+        if params.get('location'):
+            queryset = queryset.filter(location=params['location'])
+        if min_price is not None:
+            queryset = queryset.filter(pricepernight__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(pricepernight__lte=max_price)
+        if near:
+            queryset = within_radius(queryset, *near)
+        if start_date is not None:
+            queryset = exclude_unavailable(queryset, start_date, end_date)
+        return self.list_response(queryset)
 
-class BookingViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """
+        GET /api/listings/{id}/availability/?from=YYYY-MM-DD&to=YYYY-MM-DD
+        Reports which nights in [from, to) are booked, answered from the occupancy index.
+        """
+        try:
+            start_date, end_date = parse_date_range(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            listing_exists = Listing.objects.filter(pk=pk).exists()
+        except DjangoValidationError:  # Malformed UUID
+            listing_exists = False
+        if not listing_exists:
+            return Response({'error': 'Listing not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        booked = booked_nights(pk, start_date, end_date)
+        return Response({
+            'listing_id': pk,
+            'from': start_date,
+            'to': end_date,
+            'available': not booked,
+            'booked_nights': booked,
+        })
+
+    @action(detail=True, methods=['get'])
+    def quote(self, request, pk=None):
+        """
+        GET /api/listings/{id}/quote/?from=YYYY-MM-DD&to=YYYY-MM-DD
+        Prices a stay with the listing's pricing rules, from its precomputed price calendar.
+        The total is what a booking for the same dates would cost.
+        """
+        try:
+            start_date, end_date = parse_date_range(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            listing_id = uuid.UUID(str(pk))
+        except ValueError:
+            listing_id = None
+        quote = quote_stay(listing_id, start_date, end_date) if listing_id else None
+        if quote is None:
+            return Response({'error': 'Listing not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'listing_id': listing_id,
+            'from': start_date,
+            'to': end_date,
+            'nights': quote['nights'],
+            'subtotal': str(quote['subtotal']),
+            'discount_percent': str(quote['discount_percent']),
+            'discount': str(quote['discount']),
+            'total_price': str(quote['total_price']),
+        })
+
+class BookingViewSet(ReplicaReadMixin, FastListMixin, QueryPlanningMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
-    
+    pagination_class = BookingPagination
+
+    def get_serializer_class(self):
+        """
+        `?compact=true` on list/retrieve serves the nested listing and user from the
+        booking's snapshot column instead of joining them; see listings/snapshots.py.
+        """
+        compact = self.request.query_params.get('compact', '').lower() in ('1', 'true', 'yes')
+        if compact and self.action in ('list', 'retrieve'):
+            return CompactBookingSerializer
+        return super().get_serializer_class()
+
+    @method_decorator(idempotent('bookings.create'))
+    def create(self, request, *args, **kwargs):
+        """
+        POST /api/bookings/, replayed for retries that send the same Idempotency-Key
+        (see listings/idempotency.py).
+        """
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """
         Override perform_create to trigger email task after booking creation.
@@ -25,24 +171,64 @@ class BookingViewSet(viewsets.ModelViewSet):
         send_booking_confirmation_email.delay(str(booking.booking_id))
         return booking
 
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    @method_decorator(idempotent('bookings.bulk'))
+    def bulk_create(self, request):
+        """
+        POST /api/bookings/bulk/ with a JSON array or an NDJSON stream (application/x-ndjson)
+        of {listing_id, user_id, start_date, end_date[, status]} items.
+        Valid items are created in one transaction; invalid ones are reported by index.
+        Returns 201 if every item was created, 207 if some were, and 400 if none were.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a JSON array or NDJSON stream of bookings'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_BOOKING_MAX_ITEMS:
+            return Response({'error': f'At most {settings.BULK_BOOKING_MAX_ITEMS} bookings per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        created, errors = bulk_create_bookings(items)
+        if created:
+            booking_ids = [str(booking.booking_id) for _, booking in created]
+            # One grouped confirmation task for the whole batch, once it is committed
+            transaction.on_commit(lambda: send_booking_confirmation_emails.delay(booking_ids))
+
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({
+            'created': [{'index': index, 'booking_id': booking.booking_id, 'total_price': str(booking.total_price)}
+                        for index, booking in created],
+            'errors': [{'index': index, 'errors': item_errors} for index, item_errors in sorted(errors.items())],
+        }, status=response_status)
+
 
 # --- Payment Views ---
-import requests
 import uuid
 from django.conf import settings
 from django.http import JsonResponse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from .models import Booking, Payment
 from .serializers import PaymentSerializer, PaymentInitiationSerializer
+from .chapa import ChapaError, ChapaRejected, get_client
+from .payments import signature_is_valid
+from .tasks import verify_payment_task
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('payments.initiate')
 def initiate_payment(request):
     """
     Initiate a payment for a booking by making a POST request to Chapa API.
+    Retries that send the same Idempotency-Key get the first response back instead of
+    a second Payment and checkout (see listings/idempotency.py).
     """
     serializer = PaymentInitiationSerializer(data=request.data)
     if serializer.is_valid():
@@ -71,7 +257,7 @@ def initiate_payment(request):
             'first_name': getattr(request.user, 'first_name', ''),
             'last_name': getattr(request.user, 'last_name', ''),
             'tx_ref': str(payment.payment_id),  # Use payment_id as transaction reference
-            'callback_url': request.build_absolute_uri('/api/payments/verify/'),
+            'callback_url': request.build_absolute_uri('/api/payments/webhook/'),
             'return_url': request.build_absolute_uri('/payment/success/'),
             'customization': {
                 'title': f'Payment for {booking.listing.name}',
@@ -79,16 +265,9 @@ def initiate_payment(request):
             }
         }
         
-        # Make request to Chapa API
+        # Make request to Chapa API (pooled client with timeouts, retries and a circuit breaker)
         try:
-            response = requests.post(
-                'https://api.chapa.co/v1/transaction/initialize',
-                json=chapa_data,
-                headers={
-                    'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}'
-                }
-            )
-            response_data = response.json()
+            response_data = get_client().initialize(chapa_data)
             
             if response_data.get('status') == 'success':
                 # Update payment with transaction ID
@@ -107,7 +286,14 @@ def initiate_payment(request):
                     'error': response_data.get('message', 'Payment initiation failed')
                 }, status=status.HTTP_400_BAD_REQUEST)
                 
-        except requests.RequestException as e:
+        except ChapaRejected as exc:
+            # The gateway refused the request (e.g. invalid data or API key)
+            payment.status = 'failed'
+            payment.save()
+            return Response({
+                'error': exc.body.get('message', 'Payment initiation failed')
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except ChapaError:
             # Update payment status to failed
             payment.status = 'failed'
             payment.save()
@@ -118,11 +304,53 @@ def initiate_payment(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET', 'POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def payment_webhook(request):
+    """
+    Receives Chapa's callback/webhook and queues verification in Celery.
+
+    POST deliveries must carry a valid x-chapa-signature (or Chapa-Signature) header.
+    The GET callback Chapa makes after checkout carries no signature; it is accepted
+    because it only triggers verify_payment_task, which re-checks the transaction with
+    the gateway itself and only acts on payments that are still pending.
+    """
+    if request.method == 'POST':
+        signature = request.headers.get('x-chapa-signature') or request.headers.get('Chapa-Signature')
+        if not signature_is_valid(request.body, signature):
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_401_UNAUTHORIZED)
+        tx_ref = request.data.get('tx_ref') or request.data.get('trx_ref')
+    else:
+        tx_ref = request.GET.get('trx_ref') or request.GET.get('tx_ref')
+
+    try:
+        tx_ref = str(uuid.UUID(str(tx_ref)))
+    except ValueError:
+        return Response({'error': 'Transaction reference is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if Payment.objects.filter(payment_id=tx_ref, status='pending').exists():
+        verify_payment_task.delay(tx_ref)
+    # Acknowledge unknown or already-settled references too, so the gateway stops retrying.
+    return Response({'message': 'Accepted'}, status=status.HTTP_200_OK)
+
+
+# Response for each payment status on the user-facing status read
+PAYMENT_STATUS_RESPONSES = {
+    'completed': ('Payment verified successfully', status.HTTP_200_OK),
+    'pending': ('Payment verification in progress', status.HTTP_202_ACCEPTED),
+    'failed': ('Payment verification failed', status.HTTP_400_BAD_REQUEST),
+    'cancelled': ('Payment was cancelled', status.HTTP_400_BAD_REQUEST),
+}
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def verify_payment(request):
     """
-    Verify payment status with Chapa after user completes payment.
+    Report a payment's status after the user completes checkout.
+    This is a database read only: verification with Chapa happens in verify_payment_task,
+    triggered by the payment webhook and the reconciliation sweep.
     """
     tx_ref = request.GET.get('tx_ref')
     
@@ -132,49 +360,94 @@ def verify_payment(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        payment = Payment.objects.get(payment_id=tx_ref)
-    except Payment.DoesNotExist:
+        payment_status = Payment.objects.values_list('status', flat=True).get(payment_id=tx_ref)
+    except (Payment.DoesNotExist, DjangoValidationError):
         return Response({
             'error': 'Payment not found'
         }, status=status.HTTP_404_NOT_FOUND)
-    
-    # Make request to Chapa API to verify payment
+
+    message, http_status = PAYMENT_STATUS_RESPONSES[payment_status]
+    return Response({
+        'message': message,
+        'payment_status': payment_status
+    }, status=http_status)
+
+
+from django.http import StreamingHttpResponse
+from rest_framework.permissions import IsAdminUser
+from .exports import CONTENT_TYPES, parse_export_filters, stream_export
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_records(request, kind, export_format):
+    """
+    Stream every booking or payment matching the filters as CSV or NDJSON.
+    Optional query parameters: from / to (creation dates, [from, to)) and status
+    (comma-separated). Rows are written as they are read, so memory stays flat.
+    """
     try:
-        response = requests.get(
-            f'https://api.chapa.co/v1/transaction/verify/{tx_ref}',
-            headers={
-                'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}'
-            }
-        )
-        response_data = response.json()
-        
-        if response_data.get('status') == 'success' or response_data.get('data', {}).get('status') == 'success':
-            # Update payment status to completed
-            payment.status = 'completed'
-            payment.save()
-            
-            # Update booking status to confirmed
-            payment.booking.status = 'confirmed'
-            payment.booking.save()
-            
-            # Send confirmation email using Celery
-            from .tasks import send_payment_confirmation_email
-            send_payment_confirmation_email.delay(payment.payment_id)
-            
-            return Response({
-                'message': 'Payment verified successfully',
-                'payment_status': 'completed'
-            }, status=status.HTTP_200_OK)
-        else:
-            # Update payment status to failed
-            payment.status = 'failed'
-            payment.save()
-            return Response({
-                'message': 'Payment verification failed',
-                'payment_status': 'failed'
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
-    except requests.RequestException as e:
-        return Response({
-            'error': 'Payment verification service unavailable'
-        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        filters = parse_export_filters(kind, request.GET)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        stream_export(kind, export_format, filters),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{export_format}"'
+    return response
+
+
+import hmac
+from django.http import HttpResponse
+from rest_framework.permissions import BasePermission
+from .metrics import render_metrics
+
+
+class HasMetricsAccess(BasePermission):
+    """
+    Staff users, or a scraper presenting `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        supplied = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+@api_view(['GET'])
+@permission_classes([HasMetricsAccess])
+def metrics_view(request):
+    """
+    Serve this process's request (and task) metrics in the Prometheus text format.
+    """
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+from .rollups import host_stats, parse_month_range
+
+
+class IsHostOrStaff(BasePermission):
+    """
+    The host the URL names, or a staff user.
+    """
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.is_staff or user.pk == view.kwargs.get('host_id')))
+
+
+@api_view(['GET'])
+@permission_classes([IsHostOrStaff])
+def host_stats_view(request, host_id):
+    """
+    GET /api/hosts/{id}/stats/?from=YYYY-MM&to=YYYY-MM
+    Bookings, nights sold, occupancy, revenue and rating per listing per month, read
+    from the rollup tables (see listings/rollups.py). Defaults to the last 12 months.
+    """
+    try:
+        first_month, last_month = parse_month_range(request.query_params)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(host_stats(host_id, first_month, last_month))